@@ -3,9 +3,14 @@ import cv2
 import numpy as np
 from ultralytics import YOLO
 import cvzone
-import math
-from modules.sort import *
 import os
+import sys
+
+# Detection extraction is shared with the server
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'server'))
+
+from modules.sort import *
+from modules.detections import extract_detections
 
 app = Flask(__name__)
 
@@ -26,22 +31,13 @@ def generate_frames():
             break
 
         results = model(img, stream=True)
-        detections = np.empty((0, 5))
-
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0]
-                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                w, h = x2 - x1, y2 - y1
-
-                conf = math.ceil((box.conf[0] * 100)) / 100
-
-                if float(conf) > 0.4:
-                    cvzone.cornerRect(img, (x1, y1, w, h))
-                    cvzone.putTextRect(img, f'Accident {conf}', (max(0, x1), max(35, y1)), colorR=(0, 165, 255))
-                    currentArray = np.array([x1, y1, x2, y2, conf])
-                    detections = np.vstack((detections, currentArray))
+        detections = extract_detections(results)
+
+        for x1, y1, x2, y2, conf in detections:
+            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+            w, h = x2 - x1, y2 - y1
+            cvzone.cornerRect(img, (x1, y1, w, h))
+            cvzone.putTextRect(img, f'Accident {conf}', (max(0, x1), max(35, y1)), colorR=(0, 165, 255))
 
         trackerResults = tracker.update(detections)
 
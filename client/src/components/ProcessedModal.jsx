@@ -1,4 +1,4 @@
-import React, { useRef } from 'react';
+import React, { useRef, useEffect } from 'react';
 import {
     Modal,
     ModalOverlay,
@@ -8,18 +8,116 @@ import {
     ModalBody,
     ModalFooter,
     Button,
-    AspectRatio
+    AspectRatio,
+    Box
 } from '@chakra-ui/react';
 
+const HEADER_SIZE = 16;
+const RECORD_SIZE = 16;
+const BOX_COLOR = '#ff00ff';
+
+// Reads the binary track sidecar (format described in server/modules/trackstore.py)
+// into a map of frame -> [{ id, box }]
+const parseTracks = (buffer) => {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'TRK1') throw new Error('Unknown track sidecar format');
+    const count = view.getUint32(12, true);
+    const frames = new Map();
+    for (let i = 0; i < count; i++) {
+        const offset = HEADER_SIZE + i * RECORD_SIZE;
+        const frame = view.getUint32(offset, true);
+        const box = [0, 1, 2, 3].map((k) => view.getUint16(offset + 8 + 2 * k, true));
+        if (!frames.has(frame)) frames.set(frame, []);
+        frames.get(frame).push({ id: view.getUint32(offset + 4, true), box });
+    }
+    return {
+        fps: view.getUint32(4, true) / 1000 || 25,
+        width: view.getUint16(8, true),
+        height: view.getUint16(10, true),
+        frames
+    };
+};
+
 const ProcessedModal = ({
     isOpen,
     onClose,
-    videoFilename
+    videoFilename,
+    overlayTracks = false
 }) => {
     const videoRef = useRef(null);
+    const canvasRef = useRef(null);
     const apiUrl = 'http://localhost:5000';
     const videoSrc = `${apiUrl}/processed/${videoFilename}`;
 
+    // Unrendered results are the original video plus a track sidecar: draw
+    // the tracks of the current frame on a canvas over the video
+    useEffect(() => {
+        if (!isOpen || !overlayTracks || !videoFilename) return undefined;
+
+        let tracks = null;
+        let animation = null;
+        let cancelled = false;
+
+        const draw = () => {
+            const video = videoRef.current;
+            const canvas = canvasRef.current;
+            if (video && canvas && tracks) {
+                const dpr = window.devicePixelRatio || 1;
+                const width = canvas.clientWidth;
+                const height = canvas.clientHeight;
+                if (canvas.width !== width * dpr || canvas.height !== height * dpr) {
+                    canvas.width = width * dpr;
+                    canvas.height = height * dpr;
+                }
+                const ctx = canvas.getContext('2d');
+                ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+                ctx.clearRect(0, 0, width, height);
+
+                // The video is letterboxed into the element (object-fit: contain)
+                const sourceWidth = video.videoWidth || tracks.width;
+                const sourceHeight = video.videoHeight || tracks.height;
+                const scale = Math.min(width / sourceWidth, height / sourceHeight);
+                const left = (width - sourceWidth * scale) / 2;
+                const top = (height - sourceHeight * scale) / 2;
+
+                const frame = Math.floor(video.currentTime * tracks.fps + 1e-3);
+                ctx.lineWidth = 2;
+                ctx.font = '12px sans-serif';
+                (tracks.frames.get(frame) || []).forEach(({ id, box }) => {
+                    const [x1, y1, x2, y2] = box;
+                    const x = left + x1 * scale;
+                    const y = top + y1 * scale;
+                    ctx.strokeStyle = BOX_COLOR;
+                    ctx.strokeRect(x, y, (x2 - x1) * scale, (y2 - y1) * scale);
+                    const label = `ID ${id}`;
+                    ctx.fillStyle = BOX_COLOR;
+                    ctx.fillRect(x, Math.max(0, y - 16), ctx.measureText(label).width + 8, 16);
+                    ctx.fillStyle = '#ffffff';
+                    ctx.fillText(label, x + 4, Math.max(12, y - 4));
+                });
+            }
+            animation = requestAnimationFrame(draw);
+        };
+
+        fetch(`${videoSrc}/tracks`)
+            .then((response) => {
+                if (!response.ok) throw new Error(`Tracks request failed with status ${response.status}`);
+                return response.arrayBuffer();
+            })
+            .then((buffer) => {
+                if (cancelled) return;
+                tracks = parseTracks(buffer);
+                animation = requestAnimationFrame(draw);
+            })
+            .catch((error) => console.error('Failed to load tracks:', error));
+
+        return () => {
+            cancelled = true;
+            if (animation) cancelAnimationFrame(animation);
+        };
+    }, [isOpen, overlayTracks, videoFilename, videoSrc]);
+
     return (
         <Modal
             isOpen={isOpen}
@@ -34,22 +132,36 @@ const ProcessedModal = ({
 
                 <ModalBody>
                     <AspectRatio ratio={16 / 9} width="100%">
-                        <video
-                            ref={videoRef}
-                            controls
-                            autoPlay
-                            muted
-                            playsInline
-                            style={{
-                                width: '100%',
-                                height: '100%',
-                                borderRadius: '8px',
-                                backgroundColor: '#f0f0f0'
-                            }}
-                        >
-                            <source src={videoSrc} type="video/mp4" />
-                            Your browser doesn't support HTML5 video.
-                        </video>
+                        <Box position="relative">
+                            <video
+                                ref={videoRef}
+                                controls
+                                autoPlay
+                                muted
+                                playsInline
+                                style={{
+                                    width: '100%',
+                                    height: '100%',
+                                    borderRadius: '8px',
+                                    backgroundColor: '#f0f0f0'
+                                }}
+                            >
+                                <source src={videoSrc} type="video/mp4" />
+                                Your browser doesn't support HTML5 video.
+                            </video>
+                            {overlayTracks && (
+                                <canvas
+                                    ref={canvasRef}
+                                    style={{
+                                        position: 'absolute',
+                                        inset: 0,
+                                        width: '100%',
+                                        height: '100%',
+                                        pointerEvents: 'none'
+                                    }}
+                                />
+                            )}
+                        </Box>
                     </AspectRatio>
                 </ModalBody>
 
@@ -63,4 +175,4 @@ const ProcessedModal = ({
     );
 };
 
-export default ProcessedModal;
\ No newline at end of file
+export default ProcessedModal;
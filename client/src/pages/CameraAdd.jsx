@@ -14,7 +14,11 @@ import {
     Box,
     Progress,
     Text,
-    Spinner
+    Spinner,
+    Switch,
+    FormControl,
+    FormLabel,
+    Image
 } from "@chakra-ui/react";
 import { AiOutlineVideoCameraAdd } from "react-icons/ai";
 import { AddIcon } from "@chakra-ui/icons";
@@ -24,6 +28,27 @@ import { io } from "socket.io-client";
 
 const API_URL = "http://localhost:5000";
 const socket = io(API_URL);
+const MAX_UPLOAD_SIZE = 4 * 1024 * 1024 * 1024;
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const MAX_CHUNK_RETRIES = 5;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+const sha256Base64 = async (buffer) => {
+    const digest = new Uint8Array(await crypto.subtle.digest("SHA-256", buffer));
+    let binary = "";
+    digest.forEach((byte) => { binary += String.fromCharCode(byte); });
+    return btoa(binary);
+};
+
+const readError = async (response) => {
+    try {
+        const body = await response.json();
+        return body.error || `Upload failed with status ${response.status}`;
+    } catch {
+        return `Upload failed with status ${response.status}`;
+    }
+};
 
 const CameraAdd = () => {
     const [cameraUrl, setCameraUrl] = useState("");
@@ -32,11 +57,18 @@ const CameraAdd = () => {
     const [file, setFile] = useState(null);
     const [isModalOpen, setIsModalOpen] = useState(false);
     const [fileName, setFileName] = useState("");
+    // Name of the result under /processed, unique per job
+    const [processedFilename, setProcessedFilename] = useState("");
     const [isProcessedModalOpen, setIsProcessedModalOpen] = useState(false);
     const [accidentCount, setAccidentCount] = useState(0);
     const [uploadProgress, setUploadProgress] = useState(0);
     const [processingProgress, setProcessingProgress] = useState(0);
     const [currentStatus, setCurrentStatus] = useState('');
+    // Off: the server only tracks, the modal draws the boxes over the original
+    const [renderVideo, setRenderVideo] = useState(true);
+    const [isRendered, setIsRendered] = useState(true);
+    // Job currently processing our file, for the live preview
+    const [previewJobId, setPreviewJobId] = useState(null);
     const fileInputRef = useRef(null);
     const toast = useToast();
 
@@ -47,8 +79,17 @@ const CameraAdd = () => {
     }, [fileURL]);
 
     useEffect(() => {
+        const onProcessing = (data) => {
+            if (data.filename === fileName && data.job_id) {
+                setPreviewJobId(data.job_id);
+            }
+        };
+
         const onProcessed = (data) => {
             if (data.filename === fileName) {
+                setPreviewJobId(null);
+                setProcessedFilename(data.processed_filename || fileName);
+                setIsRendered(data.rendered !== false);
                 setIsProcessedModalOpen(true);
                 setCurrentStatus('Processing complete!');
                 setTimeout(() => {
@@ -61,6 +102,7 @@ const CameraAdd = () => {
 
         const onError = (data) => {
             if (data.filename === fileName) {
+                setPreviewJobId(null);
                 toast({
                     title: "Processing Error",
                     description: data.message || "An unexpected error occurred during video processing",
@@ -85,11 +127,13 @@ const CameraAdd = () => {
             }
         };
 
+        socket.on("video_processing", onProcessing);
         socket.on("processing_progress", onProcessingProgress);
         socket.on("video_processed", onProcessed);
         socket.on("processing_error", onError);
 
         return () => {
+            socket.off("video_processing", onProcessing);
             socket.off("processing_progress", onProcessingProgress);
             socket.off("video_processed", onProcessed);
             socket.off("processing_error", onError);
@@ -110,10 +154,10 @@ const CameraAdd = () => {
             return;
         }
 
-        if (file.size > 100 * 1024 * 1024) {
+        if (file.size > MAX_UPLOAD_SIZE) {
             toast({
                 title: "File too large",
-                description: "Maximum size is 100MB",
+                description: "Maximum size is 4GB",
                 status: "error",
                 duration: 5000,
             });
@@ -137,37 +181,59 @@ const CameraAdd = () => {
         setIsModalOpen(false);
 
         try {
-            const formData = new FormData();
-            formData.append("video", file);
-
-            const xhr = new XMLHttpRequest();
-            xhr.upload.addEventListener("progress", (event) => {
-                if (event.lengthComputable) {
-                    const percent = Math.round((event.loaded / event.total) * 100);
-                    setUploadProgress(percent);
-                    setCurrentStatus(`Uploading... (${percent}%)`);
-                }
+            // Resumable chunked upload: the server may start processing
+            // before the last chunk arrives
+            const createResponse = await fetch(`${API_URL}/uploads`, {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({ filename: file.name, size: file.size, render: renderVideo })
             });
+            if (!createResponse.ok) throw new Error(await readError(createResponse));
+            const upload = await createResponse.json();
+            const uploadUrl = `${API_URL}/uploads/${upload.upload_id}`;
 
-            await new Promise((resolve, reject) => {
-                xhr.onreadystatechange = () => {
-                    if (xhr.readyState === 4) {
-                        if (xhr.status === 200) {
-                            resolve(xhr.response);
-                            setCurrentStatus('Processing started...');
-                        } else {
-                            try {
-                                const errorResponse = JSON.parse(xhr.responseText || '{}');
-                                reject(new Error(errorResponse.error || 'Upload failed'));
-                            } catch {
-                                reject(new Error(`Upload failed with status ${xhr.status}`));
-                            }
-                        }
-                    }
-                };
-                xhr.open("POST", `${API_URL}/process-video`, true);
-                xhr.send(formData);
-            });
+            let offset = upload.offset;
+            let retries = 0;
+            while (offset < file.size) {
+                const chunk = await file.slice(offset, offset + CHUNK_SIZE).arrayBuffer();
+                let response;
+                try {
+                    response = await fetch(uploadUrl, {
+                        method: "PATCH",
+                        headers: {
+                            "Upload-Offset": String(offset),
+                            "Upload-Checksum": `sha256 ${await sha256Base64(chunk)}`
+                        },
+                        body: chunk
+                    });
+                } catch {
+                    response = null; // network error, resume below
+                }
+
+                if (response && response.ok) {
+                    offset = (await response.json()).offset;
+                    retries = 0;
+                } else if (response && ![409, 460].includes(response.status) && response.status < 500) {
+                    throw new Error(await readError(response));
+                } else {
+                    // Dropped connection, corrupted chunk or offset mismatch:
+                    // ask the server where to resume
+                    retries += 1;
+                    if (retries > MAX_CHUNK_RETRIES) throw new Error("Upload failed after several retries");
+                    await sleep(1000 * 2 ** (retries - 1));
+                    const statusResponse = await fetch(uploadUrl);
+                    if (!statusResponse.ok) throw new Error(await readError(statusResponse));
+                    offset = (await statusResponse.json()).offset;
+                }
+
+                const percent = Math.round((offset / file.size) * 100);
+                setUploadProgress(percent);
+                setCurrentStatus(`Uploading... (${percent}%)`);
+            }
+
+            const finalizeResponse = await fetch(`${uploadUrl}/finalize`, { method: "POST" });
+            if (!finalizeResponse.ok) throw new Error(await readError(finalizeResponse));
+            setCurrentStatus('Processing started...');
 
         } catch (error) {
             toast({
@@ -207,6 +273,17 @@ const CameraAdd = () => {
             const data = await response.json();
             if (!response.ok) throw new Error(data.message);
 
+            // Start monitoring the validated stream on the server
+            const cameraResponse = await fetch(`${API_URL}/cameras`, {
+                method: "POST",
+                headers: {
+                    "Content-Type": "application/json",
+                },
+                body: JSON.stringify({ url: cameraUrl }),
+            });
+            const camera = await cameraResponse.json();
+            if (!cameraResponse.ok) throw new Error(camera.error);
+
             toast({
                 title: "Camera added",
                 description: data.message || "Camera connected successfully",
@@ -232,6 +309,7 @@ const CameraAdd = () => {
         setFileURL(null);
         setFile(null);
         setFileName("");
+        setProcessedFilename("");
         if (fileInputRef.current) fileInputRef.current.value = "";
     };
 
@@ -276,6 +354,16 @@ const CameraAdd = () => {
                                     ref={fileInputRef}
                                 />
                             </HStack>
+                            <FormControl display="flex" alignItems="center" mt={3}>
+                                <FormLabel htmlFor="render-video" mb={0} fontSize="sm">
+                                    Draw boxes into the processed video
+                                </FormLabel>
+                                <Switch
+                                    id="render-video"
+                                    isChecked={renderVideo}
+                                    onChange={(e) => setRenderVideo(e.target.checked)}
+                                />
+                            </FormControl>
                             {(uploadProgress > 0 || processingProgress > 0) && (
                                 <Box mt={4}>
                                     <Text fontSize="sm" mb={1}>
@@ -295,6 +383,16 @@ const CameraAdd = () => {
                                             ? `${uploadProgress}% uploaded`
                                             : `${processingProgress}% processed`}
                                     </Text>
+                                    {previewJobId && (
+                                        <Image
+                                            src={`${API_URL}/jobs/${previewJobId}/preview?fps=10&width=640`}
+                                            alt="Live preview"
+                                            width="100%"
+                                            mt={2}
+                                            borderRadius="8px"
+                                            onError={() => setPreviewJobId(null)}
+                                        />
+                                    )}
                                 </Box>
                             )}
                         </CardBody>
@@ -316,7 +414,8 @@ const CameraAdd = () => {
                             setIsProcessedModalOpen(false);
                             clearFile();
                         }}
-                        videoFilename={fileName}
+                        videoFilename={processedFilename}
+                        overlayTracks={!isRendered}
                     />
                 </Center>
             </Flex>
@@ -1,19 +1,41 @@
-from flask import Flask, request, Response, jsonify, send_from_directory
+from flask import Flask, request, Response, jsonify
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
 from werkzeug.utils import secure_filename
 from functools import wraps
 import os
 import cv2
-import cvzone
-import math
-import re
 import numpy as np
-from ultralytics import YOLO
-from modules.sort import *
+from modules.backends import load_detector
+from modules.batch_sort import BatchSort
+from modules.gating import MotionGate
+from modules.encoder import open_video_writer
+from modules.annotate import draw_detections, draw_track
+from modules.detections import extract_detections, match_confidence, CONF_THRESHOLD
+from modules.cache import ResultCache, cache_key, file_digest, link_or_copy
+from modules.trackstore import TrackRecorder, EventStore, load_tracks
+from modules.fileserve import FileServer, HeadCache
+from modules.preview import PreviewHub, PreviewClosed, BOUNDARY as PREVIEW_BOUNDARY
+from modules.alerts import AlertDispatcher, WebhookSink, EmailSink, encode_snapshot
+from modules.metrics import Registry
+from modules.pipeline import InferencePipeline
+from modules.segments import SegmentedProcessor, video_info
+from modules.uploads import (UploadManager, UploadError, UploadNotFound, OffsetMismatch,
+                             GrowingFileReader, parse_checksum)
+from modules.decoder import FFmpegPipeCapture, open_capture
+from modules.preprocess import Preprocessor, parse_imgsz, parse_roi
+from modules.streams import StreamScheduler
+from modules.sessions import TrackerRegistry
+from modules.jobs import JobManager, JobCancelled, QueueFull, COMPLETED, RUNNING, FINISHED_STATES
 import logging
-import subprocess
+import atexit
+from contextlib import closing
 import time
+import uuid
+import json
+import threading
+import shutil
+from functools import partial, lru_cache
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -23,22 +45,351 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 # Configuration
 UPLOAD_FOLDER = "uploads"
 PROCESSED_FOLDER = "processed"
+RESULTS_FOLDER = "results"  # per-job detection/track files
+EVENTS_DB = "instance/events.db"  # accident event index, next to users.db
+SIDECAR_NAME = "tracks"  # processed/<video>.tracks, binary per-frame tracks for overlays
 ALLOWED_EXTENSIONS = {'mp4', 'mov', 'avi', 'mkv', 'webm'}
-MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
+MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB, single-request uploads
+MAX_UPLOAD_SIZE = 4 * 1024 * 1024 * 1024  # 4GB, chunked uploads
+UPLOAD_TTL = 24 * 3600  # seconds before an idle chunked upload is discarded
+UPLOAD_EXPIRY_INTERVAL = 600  # seconds between checks for idle uploads
+UPLOAD_IDLE_TIMEOUT = 120  # seconds without data before a job started early on an upload fails
+MODEL_WEIGHTS = "models/i1-yolov8s.pt"
+# Fallback order; override e.g. DETECTOR_BACKENDS=onnx-int8,torch-cpu
+DETECTOR_BACKENDS = os.environ.get("DETECTOR_BACKENDS", "torch-cuda,torch-cpu,onnx,onnx-int8").split(",")
+TRACKER_MAX_AGE = 20
+TRACKER_MIN_HITS = 3
+TRACKER_IOU_THRESHOLD = 0.3
+CACHE_ENABLED = True
+CACHE_FOLDER = "cache"
+CACHE_MAX_BYTES = 5 * 1024 * 1024 * 1024  # 5GB of processed videos
+STREAM_BLOCK_SIZE = 256 * 1024  # bytes read per step when streaming files
+HOT_CACHE_BYTES = 64 * 1024 * 1024  # in-memory heads/moov atoms of served videos; 0 disables
+# Results are published atomically under unique names and never rewritten, so clients may keep them
+PROCESSED_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MAX_CONCURRENT_JOBS = 2
+MAX_PENDING_JOBS = 16
+INFERENCE_BATCH_SIZE = 8
+INFERENCE_MAX_LATENCY = 0.05  # seconds before a partial batch is flushed
+INFERENCE_IMGSZ = None  # default detector input size (longer side); None = model default
+DECODE_BACKEND = os.environ.get("DECODE_BACKEND", "opencv")  # "opencv" or "ffmpeg" (pipe from an ffmpeg process)
+DECODE_THREADS = 0  # ffmpeg decoder threads; 0 = ffmpeg's choice
+DECODE_HWACCEL = os.environ.get("DECODE_HWACCEL")  # e.g. "cuda", "vaapi" or "auto"; unset decodes on the CPU
+ENCODER_PRESET = "fast"  # libx264 preset for processed videos
+ENCODER_CRF = 23
+MOTION_GATE_ENABLED = True
+MOTION_GATE_STRIDE = 1  # minimum frames between detector runs
+MOTION_GATE_THRESHOLD = 0.005  # fraction of changed thumbnail pixels that triggers detection
+MOTION_GATE_REFRESH = 15  # force a detector run at least every N frames
+PARALLEL_WORKERS = os.cpu_count() or 1  # worker processes for segmented processing
+PARALLEL_MIN_DURATION = 120  # seconds; shorter uploads are processed in-process
+PARALLEL_MIN_SEGMENT = 10  # seconds per segment at least
+CAMERA_BATCH_SIZE = 8  # frames per inference batch across all live cameras
+CAMERA_FPS_CAP = 10  # default frames per second analysed per camera
+CAMERA_PROTOCOLS = ('rtsp://', 'http://', 'https://')
+PREVIEW_MAX_FPS = 15  # live preview frame rate limit per viewer
+PREVIEW_MAX_VIEWERS = 16  # per job/camera
+# Accident alerts; a sink is enabled by setting its environment variables
+ALERT_WEBHOOK_URL = os.environ.get("ALERT_WEBHOOK_URL")
+ALERT_SMTP_HOST = os.environ.get("ALERT_SMTP_HOST")
+ALERT_SMTP_PORT = int(os.environ.get("ALERT_SMTP_PORT", "25"))
+ALERT_SMTP_TLS = os.environ.get("ALERT_SMTP_TLS", "") == "1"
+ALERT_SMTP_USER = os.environ.get("ALERT_SMTP_USER")
+ALERT_SMTP_PASSWORD = os.environ.get("ALERT_SMTP_PASSWORD")
+ALERT_EMAIL_FROM = os.environ.get("ALERT_EMAIL_FROM", "alerts@localhost")
+ALERT_EMAIL_TO = [a for a in os.environ.get("ALERT_EMAIL_TO", "").split(",") if a]
+ALERT_COALESCE_WINDOW = 10  # seconds; alerts per camera/job within it are sent together
+ALERT_QUEUE_SIZE = 256  # undelivered alerts beyond this are dropped
+ALERT_MAX_RETRIES = 5
+ALERT_SNAPSHOT_SIZE = 640  # longest side of the JPEG snapshot attached to alerts
+ALERT_DEAD_LETTER = "instance/alerts-dead.jsonl"
+METRICS_PREFIX = "accident_"  # Prometheus metric name prefix for GET /metrics
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+os.makedirs(RESULTS_FOLDER, exist_ok=True)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 # Initialize YOLO model
 try:
-    model = YOLO("models/i1-yolov8s.pt").to("cuda")
-    tracker = Sort(max_age=20, min_hits=3, iou_threshold=0.3)
+    # First backend in DETECTOR_BACKENDS that loads on this machine; the
+    # backend serializes inference calls from job workers and cameras.
+    model = load_detector(MODEL_WEIGHTS, order=DETECTOR_BACKENDS)
+    # One tracker session per job/stream, each with its own track ID space
+    trackers = TrackerRegistry(
+        factory=BatchSort,
+        max_age=TRACKER_MAX_AGE,
+        min_hits=TRACKER_MIN_HITS,
+        iou_threshold=TRACKER_IOU_THRESHOLD
+    )
 except Exception as e:
     logging.error(f"Failed to initialize YOLO model: {str(e)}")
     raise
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+jobs = JobManager(max_workers=MAX_CONCURRENT_JOBS, max_pending=MAX_PENDING_JOBS)
+uploads = UploadManager(UPLOAD_FOLDER, MAX_UPLOAD_SIZE, ttl=UPLOAD_TTL)
+uploads.start_expiry(UPLOAD_EXPIRY_INTERVAL)
+result_cache = ResultCache(CACHE_FOLDER, CACHE_MAX_BYTES)
+events = EventStore(EVENTS_DB)
+files = FileServer(block_size=STREAM_BLOCK_SIZE, head_cache=HeadCache(HOT_CACHE_BYTES),
+                   cache_control=PROCESSED_CACHE_CONTROL)
+# Per-stage latency histograms and gauges, exported on GET /metrics
+metrics = Registry(prefix=METRICS_PREFIX)
+# Serializes the early-start/finalize decision per upload
+upload_start_lock = threading.Lock()
+
+def infer_batch(frames, imgsz=None):
+    if imgsz is None:
+        return model(frames)
+    return model(frames, imgsz=imgsz)
+
+def make_preprocessor(data):
+    """
+    Builds a Preprocessor from the optional ``imgsz`` and ``roi`` request
+    fields. Raises ValueError on invalid values.
+    """
+    try:
+        imgsz = parse_imgsz(data.get("imgsz", INFERENCE_IMGSZ))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid imgsz: {str(e)}")
+    roi = data.get("roi")
+    if isinstance(roi, str):
+        try:
+            roi = json.loads(roi) if roi else None
+        except ValueError:
+            raise ValueError("roi must be a JSON list of polygons")
+    try:
+        roi = parse_roi(roi)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid roi: {str(e)}")
+    return Preprocessor(imgsz=imgsz, roi=roi)
+
+def parse_flag(value, name, default=True):
+    """
+    Boolean request field ``name``: a JSON boolean or a form string
+    (1/0, true/false, yes/no, on/off); ``default`` when absent.
+    """
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ('1', 'true', 'yes', 'on'):
+        return True
+    if str(value).lower() in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"{name} must be true or false")
+
+def parse_render(value):
+    """
+    ``render`` request field: False skips drawing and encoding and only
+    produces the track sidecar for client-side overlays.
+    """
+    return parse_flag(value, "render")
+
+# Worker pool for long uploads, started on first use
+segmented = SegmentedProcessor(
+    MODEL_WEIGHTS,
+    DETECTOR_BACKENDS,
+    workers=PARALLEL_WORKERS,
+    min_segment_seconds=PARALLEL_MIN_SEGMENT
+)
+
+def make_motion_gate():
+    if not MOTION_GATE_ENABLED:
+        return None
+    return MotionGate(
+        stride=MOTION_GATE_STRIDE,
+        motion_threshold=MOTION_GATE_THRESHOLD,
+        refresh_interval=MOTION_GATE_REFRESH
+    )
+
+# Live MJPEG previews of running jobs ("job/<id>") and cameras ("camera/<id>")
+def annotate_preview(img, detections, tracks):
+    if detections is not None:
+        draw_detections(img, detections)
+    for track in tracks if tracks is not None else ():
+        draw_track(img, track)
+
+previews = PreviewHub(annotate=annotate_preview, max_fps=PREVIEW_MAX_FPS, max_viewers=PREVIEW_MAX_VIEWERS)
+
+# Accident alerts, delivered from a background event loop
+def make_alert_sinks():
+    sinks = []
+    try:
+        if ALERT_WEBHOOK_URL:
+            sinks.append(WebhookSink(ALERT_WEBHOOK_URL))
+        if ALERT_SMTP_HOST and ALERT_EMAIL_TO:
+            sinks.append(EmailSink(
+                ALERT_SMTP_HOST, ALERT_SMTP_PORT, ALERT_EMAIL_FROM, ALERT_EMAIL_TO,
+                username=ALERT_SMTP_USER, password=ALERT_SMTP_PASSWORD, use_tls=ALERT_SMTP_TLS
+            ))
+    except ImportError as e:
+        logger.error(f"Accident alerts disabled: {str(e)}")
+        return []
+    return sinks
+
+alerts = AlertDispatcher(
+    make_alert_sinks(),
+    queue_size=ALERT_QUEUE_SIZE,
+    coalesce_window=ALERT_COALESCE_WINDOW,
+    max_retries=ALERT_MAX_RETRIES,
+    dead_letter_path=ALERT_DEAD_LETTER
+)
+if alerts.sinks:
+    alerts.start()
+    atexit.register(alerts.stop)
+
+def submit_alerts(source, frame, frame_index, detections, tracks, **details):
+    """
+    Queues an alert for each of ``tracks`` (new accidents); never blocks.
+    """
+    if not alerts.sinks or not len(tracks):
+        return
+    confidence = match_confidence(tracks, detections)
+    snapshot = encode_snapshot(frame, ALERT_SNAPSHOT_SIZE)
+    for track, conf in zip(tracks, confidence):
+        alerts.submit(source, track[4], confidence=None if conf != conf else conf, box=track[:4],
+                      snapshot=snapshot, frame_index=frame_index, **details)
+
+# Highest track id reported so far per live camera
+camera_last_ids = {}
+
+def on_camera_result(stream_id, frame_index, frame, detections, tracks):
+    previews.publish(f"camera/{stream_id}", frame, detections, tracks)
+    last_id = camera_last_ids.get(stream_id, 0)
+    new_tracks = tracks[tracks[:, 4] > last_id]
+    for x1, y1, x2, y2, track_id in new_tracks:
+        socketio.emit('camera_accident', {
+            'stream_id': stream_id,
+            'id': int(track_id),
+            'frame_index': frame_index,
+            'box': [int(x1), int(y1), int(x2), int(y2)]
+        })
+    if len(new_tracks):
+        camera_last_ids[stream_id] = int(new_tracks[:, 4].max())
+        submit_alerts(f"camera/{stream_id}", frame, frame_index, detections, new_tracks, stream_id=stream_id)
+
+cameras = StreamScheduler(
+    infer_batch,
+    trackers,
+    max_batch=CAMERA_BATCH_SIZE,
+    on_result=on_camera_result,
+    gate_factory=make_motion_gate,
+    profile=metrics.profile(name="cameras", source="camera")
+)
+
+metrics.gauge("jobs_queued", "Jobs waiting for a worker", jobs.queue_depth)
+metrics.gauge("jobs_running", "Jobs being processed",
+              lambda: sum(1 for job in jobs.list() if job.status == RUNNING))
+metrics.gauge("pipeline_queue_depth", "Frames waiting between pipeline stages of running jobs",
+              metrics.queue_depths)
+metrics.gauge("camera_fps", "Frames per second processed per camera",
+              lambda: [({"stream": c["stream_id"]}, c["fps"]) for c in cameras.list()])
+metrics.gauge("camera_buffered_frames", "Frames waiting in each camera's buffer",
+              lambda: [({"stream": c["stream_id"]}, c["buffered"]) for c in cameras.list()])
+metrics.gauge("camera_dropped_frames", "Frames dropped by each camera's buffer",
+              lambda: [({"stream": c["stream_id"]}, c["frames_dropped"]) for c in cameras.list()])
+metrics.gauge("preview_viewers", "Live preview viewers",
+              lambda: sum(channel["viewers"] for channel in previews.stats().values()))
+metrics.gauge("alerts", "Accident alert dispatcher counters",
+              lambda: [({"state": name}, value) for name, value in sorted(alerts.stats().items())])
+metrics.gauge("result_cache_bytes", "Bytes held by the result cache", lambda: result_cache.stats()["bytes"])
+metrics.gauge("hot_cache_bytes", "Bytes of served videos held in memory",
+              lambda: files.head_cache.stats()["bytes"])
+
+# Result cache
+@lru_cache(maxsize=None)
+def weights_digest(path, mtime):
+    return file_digest(path)
+
+def result_cache_key(content_digest, preprocessor, render=True, processing="sequential"):
+    """
+    Key of the result a video with SHA-256 ``content_digest`` would produce
+    with the current model and settings. ``processing`` is how the job runs
+    (see ``processing_mode``): segment boundaries and the decoder both show
+    up in the output, so results of different modes are kept apart.
+    """
+    preprocessor = preprocessor or Preprocessor(imgsz=INFERENCE_IMGSZ)
+    params = {
+        'backend': model.name,
+        'conf_threshold': CONF_THRESHOLD,
+        'tracker': [TRACKER_MAX_AGE, TRACKER_MIN_HITS, TRACKER_IOU_THRESHOLD],
+        'imgsz': preprocessor.imgsz,
+        'roi': preprocessor.roi_points(),
+        'motion_gate': [MOTION_GATE_STRIDE, MOTION_GATE_THRESHOLD, MOTION_GATE_REFRESH] if MOTION_GATE_ENABLED else None,
+        'encoder': [ENCODER_PRESET, ENCODER_CRF] if render else None,
+        'render': render,
+        # Uploads processed while arriving are always piped through ffmpeg on the CPU
+        'decode': ["ffmpeg", None] if processing == "streamed" else [DECODE_BACKEND, DECODE_HWACCEL],
+        'processing': [processing, PARALLEL_WORKERS, PARALLEL_MIN_SEGMENT] if processing == "segmented" else processing,
+    }
+    return cache_key(content_digest, weights_digest(model.path, os.path.getmtime(model.path)), params)
+
+def serve_cached_result(key, filename):
+    """
+    On a cache hit, publishes the cached video under a new processed name
+    and returns its metadata; returns None on a miss.
+    """
+    if not CACHE_ENABLED:
+        return None
+    cached = result_cache.get(key)
+    if cached is None:
+        return None
+    video_path, meta = cached
+    output_name = processed_name(filename)
+    link_or_copy(video_path, os.path.join(PROCESSED_FOLDER, output_name))
+    sidecar = result_cache.attachment(key, SIDECAR_NAME)
+    if sidecar is not None:
+        link_or_copy(sidecar, sidecar_path(output_name))
+    logger.info(f"Served {filename} from the result cache")
+    rendered = (meta.get("result") or {}).get("rendered", True)
+    socketio.emit('video_processed', {'filename': filename, 'processed_filename': output_name, 'job_id': None,
+                                      'cached': True, 'rendered': rendered})
+    return {
+        "message": meta.get("message", "Video processed"),
+        "cached": True,
+        "result": meta.get("result"),
+        "processed_video_url": f"/processed/{output_name}"
+    }
+
+def processed_name(filename):
+    """
+    Unique name under PROCESSED_FOLDER for a result of ``filename``, so jobs
+    for files with the same name don't replace each other's output.
+    """
+    return f"{uuid.uuid4().hex}_{filename}"
+
+def processed_video_url(job):
+    return f"/processed/{os.path.basename(job.params['output_path'])}"
+
+# Track store
+def sidecar_path(filename):
+    return os.path.join(PROCESSED_FOLDER, f"{filename}.{SIDECAR_NAME}")
+
+def save_track_data(key, filename, output_name, recorder, fps, frames, width, height):
+    """
+    Writes the job's detections and tracks to ``RESULTS_FOLDER/<key>.npz``
+    and the overlay sidecar next to the processed video ``output_name``,
+    and indexes its accident events. Returns the fields added to the job result; a failure
+    here is logged and does not fail the job.
+    """
+    try:
+        track_path = os.path.join(RESULTS_FOLDER, f"{key}.npz")
+        recorder.save(track_path)
+        recorder.write_sidecar(sidecar_path(output_name), fps, width, height)
+        accident_events = recorder.events(fps)
+        events.add_video(key, filename, fps, frames, width, height, track_path, accident_events)
+        return {
+            "events": len(accident_events),
+            "tracks_url": f"/jobs/{key}/tracks",
+            "events_url": f"/events?job_id={key}",
+            "sidecar_url": f"/processed/{output_name}/tracks"
+        }
+    except Exception as e:
+        logger.error(f"Failed to store tracks of {filename}: {str(e)}")
+        return {}
 
 # Decorators
 def cleanup_files(func):
@@ -96,32 +447,426 @@ def process_video():
     if not valid:
         logger.error(f"File validation failed: {message}")
         return jsonify({"error": message}), 400
+
+    try:
+        preprocessor = make_preprocessor(request.form)
+        render = parse_render(request.form.get("render"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     try:
         filename = secure_filename(file.filename)
-        video_path = os.path.join(UPLOAD_FOLDER, filename)
+        # Unique upload name so queued jobs with the same filename don't clobber each other
+        video_path = os.path.join(UPLOAD_FOLDER, f"{uuid.uuid4().hex}_{filename}")
         
         # Ensure upload folder exists
         os.makedirs(UPLOAD_FOLDER, exist_ok=True)
         file.save(video_path)
         
-        processed_video_path = os.path.join(PROCESSED_FOLDER, filename)
-        success, message = process_video_with_yolo(video_path, processed_video_path, filename)
-        
-        if not success:
-            logger.error(f"Video processing failed: {message}")
-            return jsonify({"error": message}), 500
+        processing = processing_mode(video_path)
+        key = result_cache_key(file_digest(video_path), preprocessor, render, processing) if CACHE_ENABLED else None
+        cached = serve_cached_result(key, filename) if key else None
+        if cached is not None:
+            os.remove(video_path)
+            return jsonify(cached), 200
+
+        try:
+            job = submit_video_job(filename, video_path, preprocessor, cache_key=key, render=render,
+                                   processing=processing)
+        except QueueFull as e:
+            os.remove(video_path)
+            logger.warning(f"Rejected {filename}: {str(e)}")
+            return jsonify({"error": str(e)}), 503
         
-        socketio.emit('video_processed', {'filename': filename})
+        logger.info(f"Queued {filename} as job {job.id}")
         return jsonify({
-            "message": "Video processed successfully",
-            "processed_video_url": f"/processed/{filename}"
-        }), 200
+            "message": "Video queued for processing",
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}",
+            "processed_video_url": processed_video_url(job)
+        }), 202
         
     except Exception as e:
         logger.error(f"Error in process-video endpoint: {str(e)}", exc_info=True)
         return jsonify({"error": "Internal server error"}), 500
 
+def submit_video_job(filename, input_path, preprocessor, upload=None, cache_key=None, render=True,
+                     processing="sequential"):
+    """
+    Queues processing of ``input_path``. With ``upload`` the job decodes the
+    upload while it is still arriving; otherwise ``processing`` (from
+    ``processing_mode``) says whether it is split into segments. Without
+    ``render`` the original video is published unchanged next to the track
+    sidecar. Raises QueueFull.
+    """
+    return jobs.submit(
+        run_video_job,
+        filename,
+        on_finish=on_video_job_finished,
+        input_path=input_path,
+        output_path=os.path.join(PROCESSED_FOLDER, processed_name(filename)),
+        preprocessor=preprocessor,
+        upload=upload,
+        cache_key=cache_key,
+        render=render,
+        processing="streamed" if upload is not None else processing
+    )
+
+def run_video_job(job):
+    upload = job.params.get('upload')
+    if upload is not None:
+        # Started before the upload finished: decode it as it arrives
+        return process_video_with_yolo(
+            job.params['input_path'],
+            job.params['output_path'],
+            job.filename,
+            job=job,
+            preprocessor=job.params.get('preprocessor'),
+            capture=FFmpegPipeCapture(GrowingFileReader(upload, idle_timeout=UPLOAD_IDLE_TIMEOUT)),
+            render=job.params.get('render', True)
+        )
+    if job.params.get('processing') == "segmented":
+        return process_video_segmented(
+            job.params['input_path'],
+            job.params['output_path'],
+            job.filename,
+            job=job,
+            preprocessor=job.params.get('preprocessor'),
+            render=job.params.get('render', True)
+        )
+    return process_video_with_yolo(
+        job.params['input_path'],
+        job.params['output_path'],
+        job.filename,
+        job=job,
+        preprocessor=job.params.get('preprocessor'),
+        render=job.params.get('render', True)
+    )
+
+def use_segmented_processing(video_path):
+    if PARALLEL_WORKERS < 2 or shutil.which("ffmpeg") is None:
+        return False
+    try:
+        _, _, fps, frame_count = video_info(video_path)
+    except IOError:
+        return False
+    return fps > 0 and frame_count / fps >= PARALLEL_MIN_DURATION
+
+def processing_mode(video_path):
+    """
+    "segmented" or "sequential" for a complete file; decided once at submit
+    time so the cache key and the job agree. Uploads processed while still
+    arriving are "streamed".
+    """
+    return "segmented" if use_segmented_processing(video_path) else "sequential"
+
+def on_video_job_finished(job):
+    metrics.counter("jobs_total", "Finished jobs", {"status": job.status}).inc()
+    if job.status == COMPLETED:
+        socketio.emit('video_processed', {
+            'filename': job.filename,
+            'processed_filename': os.path.basename(job.params['output_path']),
+            'job_id': job.id,
+            'rendered': job.params.get('render', True)
+        })
+        if CACHE_ENABLED:
+            store_cached_result(job)
+    upload = job.params.get('upload')
+    if upload is not None:
+        try:
+            uploads.abort(upload.id)
+        except UploadNotFound:
+            pass
+    input_path = job.params.get('input_path', '')
+    if os.path.exists(input_path):
+        os.remove(input_path)
+
+# Chunked upload endpoints
+def upload_error_response(e):
+    body = {"error": str(e)}
+    if isinstance(e, OffsetMismatch):
+        body["offset"] = e.expected
+    response = jsonify(body)
+    if isinstance(e, OffsetMismatch):
+        response.headers['Upload-Offset'] = str(e.expected)
+    return response, e.status
+
+def upload_response(upload, status=200):
+    body = upload.to_dict()
+    body["upload_url"] = f"/uploads/{upload.id}"
+    if upload.job_id:
+        body["status_url"] = f"/jobs/{upload.job_id}"
+        job = jobs.get(upload.job_id)
+        if job is not None:
+            body["processed_video_url"] = processed_video_url(job)
+    response = jsonify(body)
+    response.headers['Upload-Offset'] = str(upload.offset)
+    return response, status
+
+def start_upload_early(upload):
+    """
+    Queues processing of an unfinished upload as soon as its container
+    header shows that the data so far can be decoded front to back.
+    """
+    with upload_start_lock:
+        if upload.job_id is not None or not upload.params.get('start_early'):
+            return
+        if not uploads.is_streamable(upload):
+            return
+        try:
+            job = submit_video_job(upload.filename, upload.path, upload.params['preprocessor'], upload=upload,
+                                   render=upload.params['render'])
+        except QueueFull:
+            return  # retried on the next chunk, or at finalize
+        upload.job_id = job.id
+        logger.info(f"Started processing upload {upload.id} before it finished as job {job.id}")
+
+@app.route("/uploads", methods=["POST"])
+def create_upload():
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get("filename") or "")
+    if not filename or not allowed_file(filename):
+        return jsonify({"error": "File type not allowed"}), 400
+
+    size = data.get("size")
+    if size is not None:
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            return jsonify({"error": "size must be an integer"}), 400
+        if size <= 0:
+            return jsonify({"error": "size must be positive"}), 400
+
+    try:
+        preprocessor = make_preprocessor(data)
+        render = parse_render(data.get("render"))
+        start_early = parse_flag(data.get("start_early"), "start_early")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        upload = uploads.create(
+            filename,
+            size=size,
+            preprocessor=preprocessor,
+            render=render,
+            start_early=start_early
+        )
+    except UploadError as e:
+        return upload_error_response(e)
+    return upload_response(upload, 201)
+
+@app.route("/uploads/<upload_id>", methods=["GET", "HEAD"])
+def get_upload(upload_id):
+    try:
+        return upload_response(uploads.get(upload_id))
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route("/uploads/<upload_id>", methods=["PATCH"])
+def append_upload(upload_id):
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({"error": "Upload-Offset header required"}), 400
+
+    try:
+        checksum = parse_checksum(request.headers.get('Upload-Checksum'))
+        uploads.append(upload_id, offset, request.stream, checksum=checksum)
+        upload = uploads.get(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+
+    start_upload_early(upload)
+    return upload_response(upload)
+
+@app.route("/uploads/<upload_id>/finalize", methods=["POST"])
+def finalize_upload(upload_id):
+    try:
+        upload = uploads.finalize(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+
+    with upload_start_lock:
+        if upload.job_id is None:
+            processing = processing_mode(upload.path)
+            key = result_cache_key(upload.digest(), upload.params['preprocessor'],
+                                   upload.params['render'], processing) if CACHE_ENABLED else None
+            cached = serve_cached_result(key, upload.filename) if key else None
+            if cached is not None:
+                uploads.abort(upload.id)
+                return jsonify(dict(cached, upload_id=upload.id)), 200
+            try:
+                job = submit_video_job(upload.filename, upload.path, upload.params['preprocessor'],
+                                       cache_key=key, render=upload.params['render'], processing=processing)
+            except QueueFull as e:
+                logger.warning(f"Rejected upload {upload.id}: {str(e)}")
+                return jsonify({"error": str(e)}), 503
+            upload.job_id = job.id
+            # The job owns the file from here on
+            uploads.discard(upload.id)
+            logger.info(f"Queued upload {upload.id} as job {job.id}")
+    return upload_response(upload, 202)
+
+@app.route("/uploads/<upload_id>", methods=["DELETE"])
+def abort_upload(upload_id):
+    try:
+        upload = uploads.abort(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    if upload.job_id is not None:
+        jobs.cancel(upload.job_id)
+    return jsonify({"message": "Upload aborted"}), 200
+
+def store_cached_result(job):
+    try:
+        # Uploads processed while arriving have their digest only now that they are complete
+        key = job.params.get('cache_key')
+        if key is None:
+            upload = job.params.get('upload')
+            digest = upload.digest() if upload is not None else file_digest(job.params['input_path'])
+            key = result_cache_key(digest, job.params.get('preprocessor'), job.params.get('render', True),
+                                   job.params.get('processing', "sequential"))
+        sidecar = sidecar_path(os.path.basename(job.params['output_path']))
+        result_cache.put(key, job.params['output_path'], {
+            "filename": job.filename,
+            "message": job.message,
+            "result": job.result
+        }, attachments={SIDECAR_NAME: sidecar} if os.path.exists(sidecar) else None)
+    except Exception as e:
+        logger.error(f"Failed to cache result of job {job.id}: {str(e)}")
+
+# Job endpoints
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job.status in FINISHED_STATES:
+        return jsonify({"error": f"Job already {job.status}", **job.to_dict()}), 409
+    return jsonify(job.to_dict()), 202
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def get_job_result(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job.status not in FINISHED_STATES:
+        return jsonify(job.to_dict()), 202
+    if job.status != COMPLETED:
+        return jsonify({"error": job.error or job.message, **job.to_dict()}), 409
+    return jsonify({
+        "job_id": job.id,
+        "message": job.message,
+        "result": job.result,
+        "processed_video_url": processed_video_url(job)
+    }), 200
+
+def optional_arg(name, cast):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: {value}")
+
+def preview_response(name):
+    """
+    MJPEG stream of a preview channel. ``fps``, ``quality`` (JPEG, 1-100)
+    and ``width`` (0 = full size) are negotiated per viewer.
+    """
+    channel = previews.get(name)
+    if channel is None:
+        return None
+    try:
+        fps = float(request.args.get("fps", 10))
+        quality = int(request.args.get("quality", 70))
+        width = int(request.args.get("width", 640))
+    except ValueError:
+        return jsonify({"error": "fps, quality and width must be numbers"}), 400
+    if fps <= 0 or not 1 <= quality <= 100 or width < 0:
+        return jsonify({"error": "fps must be positive, quality 1-100, width >= 0"}), 400
+    try:
+        frames = channel.stream(fps=fps, quality=quality, width=width)
+    except PreviewClosed:
+        return None
+    except OverflowError as e:
+        return jsonify({"error": str(e)}), 503
+    response = Response(frames, mimetype=f"multipart/x-mixed-replace; boundary={PREVIEW_BOUNDARY}")
+    response.headers['Cache-Control'] = 'no-cache, no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route("/jobs/<job_id>/preview", methods=["GET"])
+def get_job_preview(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    response = preview_response(f"job/{job_id}")
+    if response is None:
+        # Queued, finished, or processed in parallel worker processes
+        return jsonify({"error": f"No live preview available for this job ({job.status})", **job.to_dict()}), 409
+    return response
+
+@app.route("/jobs/<job_id>/tracks", methods=["GET"])
+def get_job_tracks(job_id):
+    """
+    Detections and tracks of a processed video as columns, optionally
+    limited to ``start_frame``..``end_frame`` and one ``track_id``.
+    """
+    video = events.get_video(job_id)
+    if video is None or not video["track_file"] or not os.path.exists(video["track_file"]):
+        return jsonify({"error": "Tracks not found"}), 404
+    try:
+        tracks = load_tracks(
+            video["track_file"],
+            start_frame=optional_arg("start_frame", int),
+            end_frame=optional_arg("end_frame", int),
+            track_id=optional_arg("track_id", int)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "job_id": job_id,
+        "filename": video["filename"],
+        "fps": video["fps"],
+        "frames": video["frames"],
+        "width": video["width"],
+        "height": video["height"],
+        **tracks
+    }), 200
+
+@app.route("/events", methods=["GET"])
+def get_events():
+    """
+    Accident events across processed videos. ``start``/``end`` select a
+    time range within the videos (seconds), ``since``/``until`` one of
+    processing time (Unix time); ``min_conf`` filters on peak confidence.
+    """
+    try:
+        found = events.query_events(
+            job_id=request.args.get("job_id") or None,
+            filename=request.args.get("filename") or None,
+            start=optional_arg("start", float),
+            end=optional_arg("end", float),
+            min_conf=optional_arg("min_conf", float),
+            since=optional_arg("since", float),
+            until=optional_arg("until", float),
+            limit=min(optional_arg("limit", int) or 100, 1000),
+            offset=optional_arg("offset", int) or 0
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"events": found, "count": len(found)}), 200
+
 @app.route("/processed/<filename>")
 def get_processed_video(filename):
     try:
@@ -131,43 +876,28 @@ def get_processed_video(filename):
         if not os.path.exists(file_path):
             return jsonify({"error": "File not found"}), 404
 
-        range_header = request.headers.get('Range', None)
-        size = os.path.getsize(file_path)
-        
-        if range_header:
-            byte1, byte2 = 0, None
-            m = re.search(r'(\d+)-(\d*)', range_header)
-            if m:
-                byte1 = int(m.group(1))
-                byte2 = int(m.group(2)) if m.group(2) else size - 1
-            
-            chunk_size = byte2 - byte1 + 1
-            
-            def generate():
-                with open(file_path, 'rb') as f:
-                    f.seek(byte1)
-                    data = f.read(chunk_size)
-                    yield data
-            
-            response = Response(
-                generate(),
-                206,
-                mimetype='video/mp4',
-                direct_passthrough=True
-            )
-            response.headers.add('Content-Range', f'bytes {byte1}-{byte2}/{size}')
-            response.headers.add('Accept-Ranges', 'bytes')
-            response.headers.add('Content-Length', str(chunk_size))
-            return response
-        
-        response = send_from_directory(PROCESSED_FOLDER, filename, mimetype='video/mp4')
-        response.headers.add('Accept-Ranges', 'bytes')
-        return response
+        return files.response(request, file_path, 'video/mp4')
     
     except Exception as e:
         logger.error(f"Error serving processed video: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
+@app.route("/processed/<filename>/tracks")
+def get_processed_tracks(filename):
+    """
+    Binary per-frame track sidecar of a processed video (format in
+    modules/trackstore.py), with range support for partial reads.
+    """
+    try:
+        file_path = sidecar_path(secure_filename(filename))
+        if not os.path.exists(file_path):
+            return jsonify({"error": "Tracks not found"}), 404
+        return files.response(request, file_path, 'application/octet-stream')
+
+    except Exception as e:
+        logger.error(f"Error serving track sidecar: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
 @app.route('/validate-camera', methods=['POST'])
 def validate_camera():
     try:
@@ -179,7 +909,7 @@ def validate_camera():
         if not url:
             return jsonify({"valid": False, "message": "No URL provided"}), 400
 
-        if not (url.startswith('rtsp://') or url.startswith('http://') or url.startswith('https://')):
+        if not url.startswith(CAMERA_PROTOCOLS):
             return jsonify({"valid": False, "message": "Invalid URL protocol"}), 400
 
         cap = cv2.VideoCapture(url)
@@ -216,12 +946,81 @@ def validate_camera():
             "message": "Internal server error during validation"
         }), 500
 
-def process_video_with_yolo(input_video_path, output_video_path, filename):
+# Live camera endpoints
+@app.route('/cameras', methods=['POST'])
+def add_camera():
+    data = request.get_json(silent=True)
+    if not data or not data.get("url"):
+        return jsonify({"error": "No URL provided"}), 400
+
+    url = data["url"]
+    if not url.startswith(CAMERA_PROTOCOLS):
+        return jsonify({"error": "Invalid URL protocol"}), 400
+
+    try:
+        fps_cap = float(data.get("fps_cap", CAMERA_FPS_CAP))
+    except (TypeError, ValueError):
+        return jsonify({"error": "fps_cap must be a number"}), 400
+    if fps_cap <= 0:
+        return jsonify({"error": "fps_cap must be positive"}), 400
+
+    try:
+        preprocessor = make_preprocessor(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    stream_id = cameras.add(url, fps_cap=fps_cap, preprocessor=preprocessor)
+    previews.open(f"camera/{stream_id}")
+    logger.info(f"Monitoring camera {url} as stream {stream_id}")
+    return jsonify(cameras.get(stream_id)), 201
+
+@app.route('/cameras', methods=['GET'])
+def list_cameras():
+    return jsonify({"cameras": cameras.list()}), 200
+
+@app.route('/cameras/<stream_id>', methods=['GET'])
+def get_camera(stream_id):
+    info = cameras.get(stream_id)
+    if info is None:
+        return jsonify({"error": "Camera not found"}), 404
+    return jsonify(info), 200
+
+@app.route('/alerts', methods=['GET'])
+def get_alerts():
+    return jsonify({"sinks": [sink.name for sink in alerts.sinks], **alerts.stats()}), 200
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cameras/<stream_id>/preview', methods=['GET'])
+def get_camera_preview(stream_id):
+    response = preview_response(f"camera/{stream_id}")
+    if response is None:
+        return jsonify({"error": "Camera not found"}), 404
+    return response
+
+@app.route('/cameras/<stream_id>', methods=['DELETE'])
+def remove_camera(stream_id):
+    if not cameras.remove(stream_id):
+        return jsonify({"error": "Camera not found"}), 404
+    camera_last_ids.pop(stream_id, None)
+    previews.close(f"camera/{stream_id}")
+    return jsonify({"message": "Camera removed"}), 200
+
+def process_video_with_yolo(input_video_path, output_video_path, filename, job=None, preprocessor=None,
+                            capture=None, render=True):
+    job_id = job.id if job is not None else None
+    session_key = job_id or uuid.uuid4().hex
+    tracker = trackers.open(session_key)
+    preview = previews.open(f"job/{session_key}")
+    profile = tracker.profile = metrics.profile(name=session_key, source="job")
     try:
         start_time = time.time()
-        socketio.emit('video_processing', {'filename': filename})
+        socketio.emit('video_processing', {'filename': filename, 'job_id': job_id})
         
-        cap = cv2.VideoCapture(input_video_path)
+        cap = capture if capture is not None else open_capture(
+            input_video_path, DECODE_BACKEND, threads=DECODE_THREADS, hwaccel=DECODE_HWACCEL)
         if not cap.isOpened():
             raise Exception("Could not open video file")
 
@@ -230,88 +1029,247 @@ def process_video_with_yolo(input_video_path, output_video_path, filename):
         fps = cap.get(cv2.CAP_PROP_FPS)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         
-        fourcc = cv2.VideoWriter_fourcc(*'avc1')
-        out = cv2.VideoWriter(output_video_path, fourcc, fps, (width, height))
+        # Annotated frames go straight into a single H.264 encode; without
+        # render the client draws the tracks from the sidecar instead
+        if render:
+            out = open_video_writer(
+                output_video_path, width, height, fps,
+                preset=ENCODER_PRESET, crf=ENCODER_CRF
+            )
 
         totalAccidents = []
         processed_frames = 0
 
-        while cap.isOpened():
-            success, img = cap.read()
-            if not success:
-                break
+        gate = make_motion_gate()
+        # Crop/mask/letterbox in the decode stage; boxes are mapped back to
+        # full resolution before tracking and annotation
+        preprocessor = preprocessor or Preprocessor(imgsz=INFERENCE_IMGSZ)
+        pipeline = InferencePipeline(
+            partial(infer_batch, imgsz=preprocessor.imgsz),
+            batch_size=INFERENCE_BATCH_SIZE,
+            max_latency=INFERENCE_MAX_LATENCY,
+            gate=gate.should_infer if gate is not None else None,
+            preprocess=preprocessor.prepare if preprocessor.active else None,
+            profile=profile,
+            recycle_frames=True
+        )
+        detections = np.empty((0, 5))
 
-            results = model(img, stream=True)
-            detections = np.empty((0, 5))
+        recorder = TrackRecorder()
 
-            for r in results:
-                boxes = r.boxes
-                for box in boxes:
-                    x1, y1, x2, y2 = box.xyxy[0]
-                    x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                    conf = math.ceil((box.conf[0] * 100)) / 100
+        with closing(pipeline.run(cap)) as frames:
+            for frame_index, img, r in frames:
+                if job is not None:
+                    job.check_cancelled()
 
-                    if conf > 0.4:
-                        cvzone.cornerRect(img, (x1, y1, x2 - x1, y2 - y1))
-                        cvzone.putTextRect(img, f"Accident {conf}", (x1, y1 - 10), colorR=(0, 165, 255))
-                        currentArray = np.array([x1, y1, x2, y2, conf])
-                        detections = np.vstack((detections, currentArray))
+                # r is None when the motion gate skipped the detector on this frame
+                if r is not None:
+                    with profile.time("postprocess"):
+                        project = preprocessor.transform(img.shape).project if preprocessor.active else None
+                        detections = extract_detections(r, project=project)
 
-            trackerResults = tracker.update(detections)
+                if render:
+                    with profile.time("annotate"):
+                        draw_detections(img, detections)
 
-            for result in trackerResults:
-                x1, y1, x2, y2, id = result
-                x1, y1, x2, y2 = map(int, [x1, y1, x2, y2])
+                if r is not None:
+                    trackerResults = tracker.update(detections)
+                else:
+                    trackerResults = tracker.coast()
+                with profile.time("record"):
+                    recorder.add(frame_index, detections if r is not None else None, trackerResults)
 
-                if id not in totalAccidents:
-                    cvzone.cornerRect(img, (x1, y1, x2 - x1, y2 - y1), colorR=(255, 0, 255))
-                    cvzone.putTextRect(img, f"ID {id}", (x1, y1 - 10))
-                    totalAccidents.append(id)
+                new_tracks = []
+                for result in trackerResults:
+                    id = result[4]
+                    if id not in totalAccidents:
+                        if render:
+                            with profile.time("annotate"):
+                                draw_track(img, result)
+                        totalAccidents.append(id)
+                        new_tracks.append(result)
+                if new_tracks:
+                    submit_alerts(f"job/{session_key}", img, frame_index, detections, np.array(new_tracks),
+                                  job_id=job_id, filename=filename)
 
-            out.write(img)
-            processed_frames += 1
-            
-            if processed_frames % max(1, total_frames // 10) == 0:
-                progress = int((processed_frames / total_frames) * 100)            
-                socketio.emit('processing_progress', {
-                    'filename': filename,
-                    'progress': progress,
-                    'accidents': len(totalAccidents)
-                })
+                if render:
+                    with profile.time("encode"):
+                        out.write(img)
+                    preview.publish(img)
+                else:
+                    preview.publish(img, detections, trackerResults)
+                processed_frames += 1
+                profile.frame()
+
+                # The frame count is unknown (0) while decoding some unfinished uploads
+                if total_frames > 0 and processed_frames % max(1, total_frames // 10) == 0:
+                    progress = min(100, int((processed_frames / total_frames) * 100))
+                    if job is not None:
+                        job.progress = progress
+                    socketio.emit('processing_progress', {
+                        'filename': filename,
+                        'job_id': job_id,
+                        'progress': progress,
+                        'accidents': len(totalAccidents)
+                    })
 
         cap.release()
-        out.release()
-        
-        temp_path = output_video_path + ".temp.mp4"
-        try:
-            subprocess.run([
-                'ffmpeg', '-y', '-i', output_video_path,
-                '-c:v', 'libx264', '-preset', 'fast',
-                '-movflags', '+faststart', '-crf', '23',
-                temp_path
-            ], check=True)
-            os.replace(temp_path, output_video_path)
-        except subprocess.CalledProcessError as e:
-            logger.error(f"FFmpeg re-encoding failed: {str(e)}")
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+        if render:
+            with profile.time("ffmpeg"):
+                out.release()
+        else:
+            link_or_copy(input_video_path, output_video_path)
 
         processing_time = time.time() - start_time
-        logger.info(f"Processed {filename} in {processing_time:.2f} seconds")
+        summary = profile.summary()
+        logger.info(f"Processed {filename} in {processing_time:.2f} seconds "
+                    f"({summary['fps']} fps, bottleneck: {summary['bottleneck']})")
+        if gate is not None:
+            logger.info(f"Motion gate sent {gate.inferences}/{gate.frames} frames of {filename} to the detector")
         
+        stored = save_track_data(session_key, filename, os.path.basename(output_video_path), recorder, fps,
+                                 processed_frames, width, height)
+        if job is not None:
+            job.result = {
+                "frames": processed_frames,
+                "accidents": len(totalAccidents),
+                "accident_ids": sorted(int(i) for i in totalAccidents),
+                "processing_time": round(processing_time, 3),
+                "rendered": render,
+                "profile": summary,
+                **stored
+            }
         return True, f"Processed {processed_frames} frames with {len(totalAccidents)} accidents detected"
     
+    except JobCancelled:
+        logger.info(f"Processing of {filename} cancelled")
+        socketio.emit('processing_cancelled', {'filename': filename, 'job_id': job_id})
+        if 'out' in locals(): out.abort()
+        if 'cap' in locals(): cap.release()
+        if os.path.exists(output_video_path):
+            os.remove(output_video_path)
+        raise
+
     except Exception as e:
         logger.error(f"Error processing video: {str(e)}")
         socketio.emit('processing_error', {
             'filename': filename,
+            'job_id': job_id,
             'message': str(e)
         })
-        if 'out' in locals(): out.release()
+        if 'out' in locals(): out.abort()
         if 'cap' in locals(): cap.release()
         if os.path.exists(output_video_path):
             os.remove(output_video_path)
         return False, str(e)
 
+    finally:
+        trackers.close(session_key)
+        previews.close(f"job/{session_key}")
+
+def process_video_segmented(input_video_path, output_video_path, filename, job=None, preprocessor=None,
+                            render=True):
+    """
+    Same result as process_video_with_yolo, but the video is split into
+    keyframe-aligned segments that are detected and encoded in parallel
+    worker processes, with one tracker pass keeping accident IDs consistent.
+    """
+    job_id = job.id if job is not None else None
+    session_key = job_id or uuid.uuid4().hex
+    tracker = trackers.open(session_key)
+    # Worker processes time their own stages; their totals are merged into
+    # the job's profile, while the Prometheus histograms only see the
+    # tracking, recording and concat done here
+    profile = tracker.profile = metrics.profile(name=session_key, source="job")
+    preprocessor = preprocessor or Preprocessor(imgsz=INFERENCE_IMGSZ)
+    options = {
+        'imgsz': preprocessor.imgsz,
+        'roi': preprocessor.roi_points(),
+        'batch_size': INFERENCE_BATCH_SIZE,
+        'max_latency': INFERENCE_MAX_LATENCY,
+        'gate': {
+            'stride': MOTION_GATE_STRIDE,
+            'motion_threshold': MOTION_GATE_THRESHOLD,
+            'refresh_interval': MOTION_GATE_REFRESH
+        } if MOTION_GATE_ENABLED else None,
+        'decode': {'backend': DECODE_BACKEND, 'threads': DECODE_THREADS, 'hwaccel': DECODE_HWACCEL}
+    }
+
+    def on_progress(progress, accidents):
+        if job is not None:
+            job.progress = progress
+        socketio.emit('processing_progress', {
+            'filename': filename,
+            'job_id': job_id,
+            'progress': progress,
+            'accidents': accidents
+        })
+
+    try:
+        start_time = time.time()
+        socketio.emit('video_processing', {'filename': filename, 'job_id': job_id})
+        recorder = TrackRecorder()
+
+        processed_frames, accidents = segmented.process(
+            input_video_path,
+            output_video_path,
+            tracker,
+            options,
+            {'preset': ENCODER_PRESET, 'crf': ENCODER_CRF},
+            check_cancelled=job.check_cancelled if job is not None else None,
+            on_progress=on_progress,
+            recorder=recorder,
+            render=render,
+            profile=profile
+        )
+        if not render:
+            link_or_copy(input_video_path, output_video_path)
+        profile.frame(processed_frames)
+
+        processing_time = time.time() - start_time
+        summary = profile.summary()
+        logger.info(f"Processed {filename} in {processing_time:.2f} seconds ({PARALLEL_WORKERS} workers, "
+                    f"bottleneck: {summary['bottleneck']})")
+        width, height, fps, _ = video_info(input_video_path)
+        stored = save_track_data(session_key, filename, os.path.basename(output_video_path), recorder, fps,
+                                 processed_frames, width, height)
+        if job is not None:
+            job.result = {
+                "frames": processed_frames,
+                "accidents": len(accidents),
+                "accident_ids": sorted(int(i) for i in accidents),
+                "processing_time": round(processing_time, 3),
+                "rendered": render,
+                "profile": summary,
+                **stored
+            }
+        return True, f"Processed {processed_frames} frames with {len(accidents)} accidents detected"
+
+    except JobCancelled:
+        logger.info(f"Processing of {filename} cancelled")
+        socketio.emit('processing_cancelled', {'filename': filename, 'job_id': job_id})
+        if os.path.exists(output_video_path):
+            os.remove(output_video_path)
+        raise
+
+    except Exception as e:
+        logger.error(f"Error processing video: {str(e)}")
+        socketio.emit('processing_error', {
+            'filename': filename,
+            'job_id': job_id,
+            'message': str(e)
+        })
+        if os.path.exists(output_video_path):
+            os.remove(output_video_path)
+        return False, str(e)
+
+    finally:
+        trackers.close(session_key)
+
+def main():
+    socketio.run(app, host='0.0.0.0', port=5000, debug=True)
+
+# Start the server with run.py: segment worker processes re-run the main
+# script, which must not be this module
 if __name__ == "__main__":
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    main()
\ No newline at end of file
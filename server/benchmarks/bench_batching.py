@@ -0,0 +1,97 @@
+"""
+CPU benchmark of the batched inference pipeline.
+
+Runs the same clip through InferencePipeline at several batch sizes and
+reports end-to-end throughput. Without --video a synthetic clip is used.
+
+    $ python benchmarks/bench_batching.py --video assets/car-crash.mov --frames 240
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from modules.pipeline import InferencePipeline
+
+
+class FrameListCapture(object):
+    """Minimal VideoCapture stand-in replaying frames held in memory."""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.pos = 0
+
+    def read(self):
+        if self.pos >= len(self.frames):
+            return False, None
+        frame = self.frames[self.pos]
+        self.pos += 1
+        return True, frame
+
+
+def load_frames(video, count, width, height):
+    if video is None:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+
+    import cv2
+    cap = cv2.VideoCapture(video)
+    frames = []
+    while len(frames) < count:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise SystemExit(f"Could not read frames from {video}")
+    return frames
+
+
+def run(model, frames, batch_size, max_latency, imgsz):
+    def infer_batch(batch):
+        return model(batch, device='cpu', imgsz=imgsz, verbose=False)
+
+    pipeline = InferencePipeline(infer_batch, batch_size=batch_size, max_latency=max_latency)
+    start = time.perf_counter()
+    count = 0
+    for _ in pipeline.run(FrameListCapture(frames)):
+        count += 1
+    return count, time.perf_counter() - start
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Batched inference benchmark (CPU)')
+    parser.add_argument('--model', default='models/i1-yolov8s.pt', help='YOLO weights')
+    parser.add_argument('--video', default=None, help='Clip to read frames from [synthetic]')
+    parser.add_argument('--frames', type=int, default=128, help='Number of frames per run')
+    parser.add_argument('--width', type=int, default=1280, help='Synthetic frame width')
+    parser.add_argument('--height', type=int, default=720, help='Synthetic frame height')
+    parser.add_argument('--imgsz', type=int, default=640, help='Inference size')
+    parser.add_argument('--batch-sizes', default='1,4,8,16', help='Comma separated batch sizes')
+    parser.add_argument('--max-latency', type=float, default=0.05, help='Partial batch flush (s)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    from ultralytics import YOLO
+    model = YOLO(args.model)
+
+    frames = load_frames(args.video, args.frames, args.width, args.height)
+    # Warm up so model fusing and allocator growth are not timed
+    run(model, frames[:4], 4, args.max_latency, args.imgsz)
+
+    print("batch  frames  seconds     fps  speedup")
+    baseline = None
+    for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+        count, elapsed = run(model, frames, batch_size, args.max_latency, args.imgsz)
+        fps = count / elapsed
+        baseline = baseline or fps
+        print("%5d  %6d  %7.2f  %6.1f  %6.2fx" % (batch_size, count, elapsed, fps, fps / baseline))
@@ -0,0 +1,136 @@
+"""
+Frame transport between processes: pickling queues vs FrameBus.
+
+A producer process ("decode") sends every frame to --consumers processes
+("inference", "encode"), either as pickled arrays over multiprocessing
+queues or as FrameBus slot numbers with the pixels in shared memory. Each
+consumer samples the frame and releases it. Reports frames per second and
+the frame data rate delivered to the consumers; the checksums of both
+transports must match.
+
+    $ python benchmarks/bench_framebus.py --resolutions 1280x720,1920x1080,3840x2160 --frames 120
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from modules.framebus import FrameBus
+
+TRANSPORTS = ('pickle', 'shm')
+
+
+def produce(bus, queues, shape, frames, barrier):
+    source = np.random.default_rng(0).integers(0, 255, shape, dtype=np.uint8)
+    barrier.wait()
+    for i in range(frames):
+        if bus is not None:
+            slot = bus.acquire(refs=len(queues))
+            frame = bus.frame(slot)
+            np.copyto(frame, source)  # stands in for cap.read(frame)
+            frame[0, 0, 0] = i % 256
+            del frame
+            for q in queues:
+                q.put(slot)
+        else:
+            frame = source.copy()
+            frame[0, 0, 0] = i % 256
+            for q in queues:
+                q.put(frame)
+    for q in queues:
+        q.put(None)
+    if bus is not None:
+        bus.close()
+
+
+def consume(bus, q, barrier, done):
+    barrier.wait()
+    count = 0
+    checksum = 0
+    while True:
+        message = q.get()
+        if message is None:
+            break
+        frame = bus.frame(message) if bus is not None else message
+        checksum += int(frame[::32, ::32].sum())
+        del frame
+        if bus is not None:
+            bus.release(message)
+        count += 1
+    if bus is not None:
+        bus.close()
+    done.put((count, checksum))
+
+
+def transfer(transport, shape, frames, consumers=2, slots=8, ctx=None):
+    """
+    Sends ``frames`` frames of ``shape`` to ``consumers`` processes over
+    ``transport`` ("pickle" or "shm"). Process start-up is not timed.
+    """
+    ctx = ctx or multiprocessing.get_context('spawn')
+    bus = FrameBus(slots, shape, ctx=ctx) if transport == 'shm' else None
+    queues = [ctx.Queue(maxsize=slots) for _ in range(consumers)]
+    barrier = ctx.Barrier(consumers + 2)
+    done = ctx.Queue()
+    workers = [ctx.Process(target=produce, args=(bus, queues, shape, frames, barrier))]
+    workers += [ctx.Process(target=consume, args=(bus, q, barrier, done)) for q in queues]
+    try:
+        for worker in workers:
+            worker.start()
+        barrier.wait()
+        start = time.perf_counter()
+        results = [done.get() for _ in range(consumers)]
+        seconds = time.perf_counter() - start
+        for worker in workers:
+            worker.join()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        if bus is not None:
+            bus.unlink()
+
+    delivered = sum(count for count, _ in results)
+    return {
+        'seconds': seconds,
+        'frames': frames,
+        'fps': frames / max(seconds, 1e-9),
+        'mb_per_s': delivered * int(np.prod(shape)) / max(seconds, 1e-9) / 1e6,
+        'checksum': sum(checksum for _, checksum in results),
+    }
+
+
+def parse_resolutions(value):
+    return [tuple(int(v) for v in r.split('x')) for r in value.split(',')]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Inter-process frame transport benchmark')
+    parser.add_argument('--resolutions', default='1280x720,1920x1080,3840x2160', help='Comma separated WxH')
+    parser.add_argument('--frames', type=int, default=120, help='Frames per run')
+    parser.add_argument('--consumers', type=int, default=2, help='Processes receiving every frame')
+    parser.add_argument('--slots', type=int, default=8, help='FrameBus slots / queue size')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    print("resolution  transport  seconds     fps    MB/s  speedup")
+    for width, height in parse_resolutions(args.resolutions):
+        baseline = None
+        checksums = set()
+        for transport in TRANSPORTS:
+            result = transfer(transport, (height, width, 3), args.frames, args.consumers, args.slots)
+            checksums.add(result['checksum'])
+            baseline = baseline or result['fps']
+            print("%10s  %9s  %7.2f  %6.1f  %6.0f  %6.2fx" % (
+                '%dx%d' % (width, height), transport, result['seconds'], result['fps'], result['mb_per_s'],
+                result['fps'] / baseline))
+        if len(checksums) != 1:
+            raise SystemExit("Transports delivered different frames")
@@ -0,0 +1,72 @@
+"""
+Dense iou_batch vs sweep-based iou_sparse.
+
+Detections and predicted tracks are scattered over a 4K frame; for each box
+count both modes produce the overlapping pairs and the script reports where
+sparse mode starts to win.
+
+    $ python benchmarks/bench_iou.py --counts 10,50,100,200,500,1000,2000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from modules.sort import iou_batch, iou_sparse
+
+
+def make_boxes(n, width, height, rng):
+    xy = rng.uniform(0, [width, height], (n, 2))
+    wh = rng.uniform(30, 150, (n, 2))
+    return np.concatenate([xy, xy + wh], axis=1)
+
+
+def dense(dets, trks):
+    iou = iou_batch(dets, trks)
+    rows, cols = np.nonzero(iou > 0)
+    return rows, cols, iou[rows, cols]
+
+
+def timeit(fn, *args, repeat=20):
+    fn(*args)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - start) / repeat * 1000.
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Dense vs sparse IOU benchmark')
+    parser.add_argument('--counts', default='10,50,100,200,500,1000,2000', help='Boxes per side')
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--repeat', type=int, default=20)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    rng = np.random.default_rng(0)
+
+    print("%6s %10s %10s %8s %8s" % ("boxes", "dense ms", "sparse ms", "pairs", "winner"))
+    crossover = None
+    for n in [int(c) for c in args.counts.split(',')]:
+        dets = make_boxes(n, args.width, args.height, rng)
+        trks = dets + rng.normal(0, 5, dets.shape)
+        dense_ms = timeit(dense, dets, trks, repeat=args.repeat)
+        sparse_ms = timeit(iou_sparse, dets, trks, repeat=args.repeat)
+        pairs = len(iou_sparse(dets, trks)[0])
+        winner = 'sparse' if sparse_ms < dense_ms else 'dense'
+        if winner == 'sparse' and crossover is None:
+            crossover = n
+        print("%6d %10.3f %10.3f %8d %8s" % (n, dense_ms, sparse_ms, pairs, winner))
+
+    if crossover is not None:
+        print("sparse mode wins from %d boxes per frame" % crossover)
+    else:
+        print("dense mode won at every size tested")
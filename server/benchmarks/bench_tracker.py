@@ -0,0 +1,103 @@
+"""
+Per-frame latency of Sort vs BatchSort on MOT-format detection streams.
+
+Synthetic sequences with 10, 100 and 1000 concurrent objects are generated in
+MOT ``det.txt`` layout (frame, id, x, y, w, h, score, ...); a real sequence can
+be given with --det instead.
+
+    $ python benchmarks/bench_tracker.py --tracks 10,100,1000 --frames 200
+    $ python benchmarks/bench_tracker.py --det data/train/ADL-Rundle-6/det/det.txt
+"""
+
+import argparse
+import os
+import sys
+import time
+from functools import partial
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from modules.sort import Sort
+from modules.batch_sort import BatchSort
+
+TRACKERS = {
+    'sort': Sort,
+    'batch_sort': BatchSort,
+    'batch_sort_sparse': partial(BatchSort, sparse_iou=True),
+}
+
+
+def synthetic_mot(num_objects, num_frames, width=3840, height=2160, seed=0):
+    """
+    Returns an ``(N, 7)`` MOT-format array of noisy detections for objects
+    moving at constant velocity, with ~10% missed detections per frame.
+    """
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform(0, [width, height], (num_objects, 2))
+    vel = rng.normal(0, 4, (num_objects, 2))
+    size = rng.uniform(20, 80, (num_objects, 2))
+    rows = []
+    for frame in range(1, num_frames + 1):
+        pos += vel
+        visible = rng.random(num_objects) > 0.1
+        xy = pos[visible] - size[visible] / 2 + rng.normal(0, 1.5, (visible.sum(), 2))
+        wh = size[visible]
+        n = len(xy)
+        rows.append(np.column_stack([
+            np.full(n, frame), np.full(n, -1), xy, wh, rng.uniform(0.5, 1, n)]))
+    return np.concatenate(rows)
+
+
+def frames_from_mot(seq_dets):
+    """
+    Splits a MOT array into per-frame ``[x1, y1, x2, y2, score]`` arrays, as
+    the demo in modules/sort.py does.
+    """
+    frames = []
+    for frame in range(1, int(seq_dets[:, 0].max()) + 1):
+        dets = seq_dets[seq_dets[:, 0] == frame, 2:7].copy()
+        dets[:, 2:4] += dets[:, 0:2]
+        frames.append(dets)
+    return frames
+
+
+def measure(tracker_cls, frames, max_age, min_hits, iou_threshold):
+    tracker = tracker_cls(max_age=max_age, min_hits=min_hits, iou_threshold=iou_threshold)
+    latencies = np.empty(len(frames))
+    for i, dets in enumerate(frames):
+        start = time.perf_counter()
+        tracker.update(dets)
+        latencies[i] = time.perf_counter() - start
+    return latencies * 1000.
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Tracker latency benchmark')
+    parser.add_argument('--det', default=None, help='MOT det.txt to replay instead of synthetic data')
+    parser.add_argument('--tracks', default='10,100,1000', help='Concurrent objects for synthetic runs')
+    parser.add_argument('--frames', type=int, default=200, help='Frames per synthetic run')
+    parser.add_argument('--trackers', default='sort,batch_sort,batch_sort_sparse', help='Comma separated: ' + ','.join(TRACKERS))
+    parser.add_argument('--max_age', type=int, default=20)
+    parser.add_argument('--min_hits', type=int, default=3)
+    parser.add_argument('--iou_threshold', type=float, default=0.3)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.det:
+        workloads = [(os.path.basename(os.path.dirname(os.path.dirname(args.det))),
+                      frames_from_mot(np.loadtxt(args.det, delimiter=',')))]
+    else:
+        workloads = [('%d tracks' % n, frames_from_mot(synthetic_mot(n, args.frames)))
+                     for n in [int(t) for t in args.tracks.split(',')]]
+
+    print("%-14s %-17s %9s %9s %9s" % ("workload", "tracker", "mean ms", "p50 ms", "p95 ms"))
+    for name, frames in workloads:
+        for tracker_name in args.trackers.split(','):
+            ms = measure(TRACKERS[tracker_name], frames, args.max_age, args.min_hits, args.iou_threshold)
+            print("%-14s %-17s %9.3f %9.3f %9.3f" % (
+                name, tracker_name, ms.mean(), np.percentile(ms, 50), np.percentile(ms, 95)))
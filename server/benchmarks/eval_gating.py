@@ -0,0 +1,109 @@
+"""
+Accuracy/cost evaluation of the motion gate against full-rate processing.
+
+The clip is processed twice with the same detector and tracker settings:
+once running YOLO on every frame, once through MotionGate. An accident ID
+from the full-rate run counts as found if, on any frame where it is
+reported, a gated track overlaps it with IOU >= --match-iou.
+
+    $ python benchmarks/eval_gating.py --video assets/car-crash.mov --threshold 0.005 --refresh 15
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from modules.batch_sort import BatchSort
+from modules.detections import extract_detections
+from modules.gating import MotionGate
+from modules.sort import iou_batch
+
+
+def track_video(model, video, gate=None, max_age=20, min_hits=3, iou_threshold=0.3):
+    """
+    Returns ``(observations, inference_calls, seconds)`` where observations
+    maps frame index to the ``(M, 5)`` tracker output of that frame.
+    """
+    tracker = BatchSort(max_age=max_age, min_hits=min_hits, iou_threshold=iou_threshold)
+    cap = cv2.VideoCapture(video)
+    observations = {}
+    calls = 0
+    index = 0
+    start = time.perf_counter()
+    while True:
+        success, frame = cap.read()
+        if not success:
+            break
+        if gate is None or gate.should_infer(frame):
+            calls += 1
+            tracks = tracker.update(extract_detections(model(frame, verbose=False)))
+        else:
+            tracks = tracker.coast()
+        if len(tracks):
+            observations[index] = tracks
+        index += 1
+    cap.release()
+    return observations, calls, time.perf_counter() - start
+
+
+def accident_ids(observations):
+    ids = set()
+    for tracks in observations.values():
+        ids.update(int(t) for t in tracks[:, 4])
+    return ids
+
+
+def lost_ids(reference, candidate, match_iou):
+    """
+    Returns the reference IDs never overlapped by a candidate track.
+    """
+    found = set()
+    for frame, tracks in reference.items():
+        other = candidate.get(frame)
+        if other is None:
+            continue
+        iou = iou_batch(tracks[:, :4], other[:, :4])
+        for row, track_id in enumerate(tracks[:, 4]):
+            if iou[row].max() >= match_iou:
+                found.add(int(track_id))
+    return accident_ids(reference) - found
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Motion gate evaluation')
+    parser.add_argument('--video', required=True, help='Clip to evaluate')
+    parser.add_argument('--model', default='models/i1-yolov8s.pt', help='YOLO weights')
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--stride', type=int, default=1, help='Minimum frames between detector runs')
+    parser.add_argument('--threshold', type=float, default=0.005, help='Changed-pixel fraction that triggers detection')
+    parser.add_argument('--refresh', type=int, default=15, help='Forced detector run interval')
+    parser.add_argument('--match-iou', type=float, default=0.3, help='IOU for matching accident IDs')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    from ultralytics import YOLO
+    model = YOLO(args.model).to(args.device)
+
+    full, full_calls, full_time = track_video(model, args.video)
+    gate = MotionGate(stride=args.stride, motion_threshold=args.threshold, refresh_interval=args.refresh)
+    gated, gated_calls, gated_time = track_video(model, args.video, gate=gate)
+
+    full_ids = accident_ids(full)
+    lost = lost_ids(full, gated, args.match_iou)
+    spurious = lost_ids(gated, full, args.match_iou)
+
+    print("frames:            %d" % gate.frames)
+    print("inference calls:   full %d, gated %d (%.1fx fewer)" % (
+        full_calls, gated_calls, full_calls / float(max(gated_calls, 1))))
+    print("wall time:         full %.2fs, gated %.2fs" % (full_time, gated_time))
+    print("accident IDs:      full %d, gated %d" % (len(full_ids), len(accident_ids(gated))))
+    print("lost vs full-rate: %d %s" % (len(lost), sorted(lost) if lost else ''))
+    print("gated-only IDs:    %d" % len(spurious))
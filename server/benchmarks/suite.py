@@ -0,0 +1,453 @@
+"""
+Headless benchmark suite for the detection and tracking pipeline.
+
+Suites (all on CPU, fixed seeds):
+
+  tracker   per-frame latency of Sort / BatchSort / sparse BatchSort on
+            synthetic MOT streams and on MOT ``det.txt`` files (--mot)
+  iou       dense iou_batch vs sweep-based iou_sparse
+  detector  batched inference through InferencePipeline, with a stub
+            detector (default, no weights needed) or a real backend
+            (--detector onnx, onnx-int8, torch-cpu or auto)
+  e2e       process_video_with_yolo on generated clips, with and without
+            rendering, including the per-stage profile of each run
+  ipc       frames sent from one process to two others as pickled arrays
+            vs FrameBus shared-memory slots, at 720p/1080p/4K
+
+Every measurement is repeated --repeat times and the median run is kept.
+Results are written as JSON; ``compare`` flags metrics that got worse by more
+than --threshold between two result files and exits with status 1 if any did.
+
+    $ python benchmarks/suite.py run --suites tracker,iou,detector,e2e,ipc
+    $ python benchmarks/suite.py run --suites tracker --mot 'data/train/*/det/det.txt'
+    $ python benchmarks/suite.py compare benchmarks/results/before.json benchmarks/results/after.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import cv2
+import numpy as np
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, SERVER_DIR)
+
+from bench_batching import FrameListCapture
+from bench_framebus import TRANSPORTS, parse_resolutions, transfer
+from bench_iou import dense, make_boxes
+from bench_tracker import TRACKERS, frames_from_mot, synthetic_mot
+
+from modules.pipeline import InferencePipeline
+from modules.sort import iou_sparse
+
+SUITES = ('tracker', 'iou', 'detector', 'e2e', 'ipc')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Metrics where a larger value is better; all others (latencies, seconds) are
+# better when smaller. Counters such as frames are not compared.
+HIGHER_IS_BETTER = ('fps', 'mb_per_s')
+NOT_COMPARED = ('frames', 'count', 'pairs', 'batches', 'accidents')
+
+
+class StubBoxes(object):
+    """The parts of ultralytics ``Boxes`` that extract_detections reads."""
+
+    def __init__(self, xyxy, conf):
+        self.xyxy = xyxy
+        self.conf = conf
+
+    def __len__(self):
+        return len(self.conf)
+
+
+class StubResult(object):
+
+    def __init__(self, xyxy, conf):
+        self.boxes = StubBoxes(xyxy, conf)
+
+
+class StubDetector(object):
+    """
+    Weight-free stand-in for a detector backend. Each frame is letterboxed
+    to ``imgsz`` like the real preprocessing, and bright blobs (the objects
+    of ``make_clip`` clips) are reported as detections, so the tracker
+    downstream sees realistic, moving boxes.
+    """
+
+    def __init__(self, imgsz=640, threshold=128, min_area=64):
+        self.imgsz = imgsz
+        self.threshold = threshold
+        self.min_area = min_area
+
+    def __call__(self, frames, imgsz=None, **kwargs):
+        return [self._detect(frame, imgsz or self.imgsz) for frame in frames]
+
+    def _detect(self, frame, imgsz):
+        height, width = frame.shape[:2]
+        scale = imgsz / float(max(height, width))
+        small = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_LINEAR)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        _, mask = cv2.threshold(gray, self.threshold, 255, cv2.THRESH_BINARY)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+        stats = stats[1:count]
+        stats = stats[stats[:, 4] >= self.min_area * scale * scale]
+        xyxy = np.empty((len(stats), 4), dtype=np.float32)
+        xyxy[:, :2] = stats[:, :2]
+        xyxy[:, 2:] = stats[:, :2] + stats[:, 2:4]
+        xyxy /= scale
+        area = stats[:, 4].astype(np.float32)
+        conf = np.clip(0.5 + area / (area.max(initial=0) + 1) / 2, 0, 0.99).astype(np.float32)
+        return StubResult(xyxy, conf)
+
+    def describe(self):
+        return {"backend": "stub", "imgsz": self.imgsz}
+
+
+def make_clip(path, width, height, frames, fps=25, objects=8, seed=0):
+    """
+    Writes a synthetic clip of bright rectangles moving at constant velocity
+    (some of them crossing) over a dark, noisy background.
+    """
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform(0, [width, height], (objects, 2))
+    vel = rng.normal(0, max(width, height) / 300.0, (objects, 2))
+    size = rng.uniform(0.04, 0.1, (objects, 2)) * [width, height]
+    background = rng.integers(0, 60, (height, width, 3), dtype=np.uint8)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        raise IOError(f"Could not write {path}")
+    try:
+        for _ in range(frames):
+            frame = background.copy()
+            pos += vel
+            # Bounce off the frame edges so objects stay in view
+            out = (pos < 0) | (pos > [width, height])
+            vel[out] *= -1
+            for (x, y), (w, h) in zip(pos, size):
+                cv2.rectangle(frame, (int(x - w / 2), int(y - h / 2)), (int(x + w / 2), int(y + h / 2)),
+                              (220, 220, 220), -1)
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+
+def median_run(fn, repeat):
+    """
+    Calls ``fn()`` (returning a result dict with ``seconds``) ``repeat``
+    times and returns the result of the median run.
+    """
+    runs = sorted((fn() for _ in range(max(1, repeat))), key=lambda r: r['seconds'])
+    return runs[len(runs) // 2]
+
+
+def latency_stats(ms):
+    return {
+        'mean_ms': round(float(ms.mean()), 4),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p95_ms': round(float(np.percentile(ms, 95)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+    }
+
+
+def bench_tracker(args):
+    workloads = [('synthetic-%d' % n, frames_from_mot(synthetic_mot(n, args.frames)))
+                 for n in [int(t) for t in args.tracks.split(',')]]
+    for det in sorted(glob.glob(args.mot)) if args.mot else []:
+        name = os.path.basename(os.path.dirname(os.path.dirname(det)))
+        workloads.append(('mot-' + name, frames_from_mot(np.loadtxt(det, delimiter=','))))
+
+    results = {}
+    for workload, frames in workloads:
+        for tracker_name in args.trackers.split(','):
+            def run():
+                tracker = TRACKERS[tracker_name](max_age=20, min_hits=3, iou_threshold=0.3)
+                latencies = np.empty(len(frames))
+                for i, dets in enumerate(frames):
+                    start = time.perf_counter()
+                    tracker.update(dets)
+                    latencies[i] = time.perf_counter() - start
+                return {'seconds': float(latencies.sum()), 'latencies': latencies * 1000.}
+
+            best = median_run(run, args.repeat)
+            result = latency_stats(best['latencies'])
+            result.update(frames=len(frames), seconds=round(best['seconds'], 4),
+                          fps=round(len(frames) / max(best['seconds'], 1e-9), 1))
+            results['tracker/%s/%s' % (workload, tracker_name)] = result
+    return results
+
+
+def bench_iou(args):
+    rng = np.random.default_rng(0)
+    results = {}
+    for n in [int(c) for c in args.iou_counts.split(',')]:
+        dets = make_boxes(n, 3840, 2160, rng)
+        trks = dets + rng.normal(0, 5, dets.shape)
+        for mode, fn in (('dense', dense), ('sparse', iou_sparse)):
+            fn(dets, trks)
+
+            def run():
+                start = time.perf_counter()
+                for _ in range(20):
+                    fn(dets, trks)
+                return {'seconds': (time.perf_counter() - start) / 20}
+
+            best = median_run(run, args.repeat)
+            results['iou/%d/%s' % (n, mode)] = {'mean_ms': round(best['seconds'] * 1000, 4),
+                                                'pairs': int(len(iou_sparse(dets, trks)[0]))}
+    return results
+
+
+def load_benchmark_detector(name, weights, imgsz):
+    if name == 'stub':
+        return StubDetector(imgsz=imgsz)
+    from modules.backends import load_detector
+    order = ('onnx', 'onnx-int8', 'torch-cpu') if name == 'auto' else (name,)
+    return load_detector(weights, order=order, imgsz=imgsz)
+
+
+def bench_detector(args):
+    detector = load_benchmark_detector(args.detector, args.weights, args.imgsz)
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = make_clip(os.path.join(tmp, 'clip.mp4'), args.width, args.height, args.detector_frames)
+        cap = cv2.VideoCapture(clip)
+        frames = []
+        while True:
+            success, frame = cap.read()
+            if not success:
+                break
+            frames.append(frame)
+        cap.release()
+
+    # Warm up so model fusing and allocator growth are not timed
+    detector(frames[:2])
+    results = {}
+    for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+        def run():
+            batches = []
+
+            def infer_batch(images):
+                start = time.perf_counter()
+                output = detector(images)
+                batches.append(time.perf_counter() - start)
+                return output
+
+            pipeline = InferencePipeline(infer_batch, batch_size=batch_size, max_latency=0.05)
+            start = time.perf_counter()
+            count = sum(1 for _ in pipeline.run(FrameListCapture(frames)))
+            return {'seconds': time.perf_counter() - start, 'frames': count,
+                    'batches': np.array(batches) * 1000.}
+
+        best = median_run(run, args.repeat)
+        results['detector/%s/%dx%d/batch-%d' % (args.detector, args.width, args.height, batch_size)] = {
+            'frames': best['frames'],
+            'batches': len(best['batches']),
+            'seconds': round(best['seconds'], 4),
+            'fps': round(best['frames'] / best['seconds'], 1),
+            'batch_mean_ms': round(float(best['batches'].mean()), 4),
+            'batch_p95_ms': round(float(np.percentile(best['batches'], 95)), 4),
+        }
+    return results
+
+
+def bench_e2e(args):
+    import modules.backends
+    from modules.jobs import Job
+    from modules.trackstore import EventStore
+
+    # app loads its detector on import: hand it the benchmark detector, so
+    # the stub needs neither a backend nor weights. Its folders are created
+    # relative to the server directory.
+    detector = load_benchmark_detector(args.detector, args.weights, args.imgsz)
+    load_detector = modules.backends.load_detector
+    modules.backends.load_detector = lambda *args, **kwargs: detector
+    os.chdir(SERVER_DIR)
+    try:
+        import app
+    finally:
+        modules.backends.load_detector = load_detector
+    app.model = detector
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep track data and sidecars out of the server's folders
+        app.RESULTS_FOLDER = app.PROCESSED_FOLDER = tmp
+        app.events = EventStore(os.path.join(tmp, 'events.db'))
+        for resolution in args.resolutions.split(','):
+            width, height = [int(v) for v in resolution.split('x')]
+            clip = make_clip(os.path.join(tmp, 'input-%s.mp4' % resolution), width, height, args.e2e_frames)
+            for render in (True, False):
+                def run():
+                    job = Job('bench.mp4')
+                    start = time.perf_counter()
+                    success, message = app.process_video_with_yolo(
+                        clip, os.path.join(tmp, 'output.mp4'), 'bench.mp4', job=job, render=render)
+                    if not success:
+                        raise RuntimeError(message)
+                    return {'seconds': time.perf_counter() - start, 'result': job.result}
+
+                best = median_run(run, args.repeat)
+                profile = best['result']['profile']
+                result = {
+                    'frames': best['result']['frames'],
+                    'accidents': best['result']['accidents'],
+                    'seconds': round(best['seconds'], 4),
+                    'fps': round(best['result']['frames'] / best['seconds'], 1),
+                    'bottleneck': profile['bottleneck'],
+                }
+                for stage, stats in profile['stages'].items():
+                    result['%s_mean_ms' % stage] = stats['mean_ms']
+                    result['%s_p95_ms' % stage] = stats['p95_ms']
+                name = 'rendered' if render else 'metadata'
+                results['e2e/%s/%s/%s' % (args.detector, resolution, name)] = result
+    return results
+
+
+def bench_ipc(args):
+    results = {}
+    for width, height in parse_resolutions(args.ipc_resolutions):
+        for transport in TRANSPORTS:
+            best = median_run(lambda: transfer(transport, (height, width, 3), args.ipc_frames), args.repeat)
+            results['ipc/%dx%d/%s' % (width, height, transport)] = {
+                'frames': best['frames'],
+                'seconds': round(best['seconds'], 4),
+                'fps': round(best['fps'], 1),
+                'mb_per_s': round(best['mb_per_s'], 1),
+            }
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SERVER_DIR,
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_suites(args):
+    suites = [s.strip() for s in args.suites.split(',') if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        raise SystemExit('Unknown suites: %s (choose from %s)' % (', '.join(sorted(unknown)), ', '.join(SUITES)))
+
+    report = {'environment': environment(), 'arguments': vars(args), 'results': {}, 'errors': {}}
+    for suite in suites:
+        started = time.perf_counter()
+        try:
+            results = globals()['bench_' + suite](args)
+        except Exception as e:
+            report['errors'][suite] = '%s: %s' % (type(e).__name__, e)
+            print('%-8s failed: %s' % (suite, report['errors'][suite]))
+            continue
+        report['results'].update(results)
+        print('%-8s %d results in %.1fs' % (suite, len(results), time.perf_counter() - started))
+        for name, result in results.items():
+            print('  %-48s %s' % (name, headline(result)))
+
+    out = args.out or os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('wrote %s' % out)
+    return 1 if report['errors'] else 0
+
+
+def headline(result):
+    keys = [k for k in ('fps', 'mean_ms', 'p95_ms', 'batch_mean_ms', 'seconds') if k in result]
+    return '  '.join('%s=%s' % (k, result[k]) for k in keys)
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    with open(args.candidate) as f:
+        candidate = json.load(f)['results']
+
+    regressions = 0
+    print('%-48s %-22s %12s %12s %8s' % ('benchmark', 'metric', 'baseline', 'candidate', 'change'))
+    for name in sorted(set(baseline) & set(candidate)):
+        for metric, before in sorted(baseline[name].items()):
+            after = candidate[name].get(metric)
+            if (metric in NOT_COMPARED or not isinstance(before, (int, float)) or not isinstance(after, (int, float))
+                    or isinstance(before, bool) or before <= 0):
+                continue
+            if args.metrics and not any(metric.endswith(m) for m in args.metrics.split(',')):
+                continue
+            change = (after - before) / before
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = ''
+            # Sub-millisecond latencies jitter; --min-ms sets the noise floor
+            if worse > args.threshold and (metric in HIGHER_IS_BETTER or abs(after - before) >= args.min_ms):
+                flag = 'REGRESSION'
+                regressions += 1
+            elif worse < -args.threshold:
+                flag = 'improved'
+            if flag or args.all:
+                print('%-48s %-22s %12.4g %12.4g %+7.1f%% %s' % (name, metric, before, after, change * 100, flag))
+
+    for name in sorted(set(baseline) - set(candidate)):
+        print('%-48s missing from candidate' % name)
+    for name in sorted(set(candidate) - set(baseline)):
+        print('%-48s new in candidate' % name)
+    print('%d regression%s over %.0f%%' % (regressions, '' if regressions == 1 else 's', args.threshold * 100))
+    return 1 if regressions else 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Pipeline benchmark suite')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Run benchmarks and write a JSON report')
+    run.add_argument('--suites', default=','.join(SUITES), help='Comma separated: ' + ','.join(SUITES))
+    run.add_argument('--out', default=None, help='Report path [benchmarks/results/<time>.json]')
+    run.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the median is kept')
+    run.add_argument('--tracks', default='10,100,1000', help='Concurrent objects for synthetic tracker runs')
+    run.add_argument('--frames', type=int, default=200, help='Frames per synthetic tracker run')
+    run.add_argument('--trackers', default='sort,batch_sort,batch_sort_sparse', help='Comma separated: ' + ','.join(TRACKERS))
+    run.add_argument('--mot', default=None, help="Glob of MOT det.txt files, e.g. 'data/train/*/det/det.txt'")
+    run.add_argument('--iou-counts', default='10,100,500,2000', help='Boxes per side for the IOU suite')
+    run.add_argument('--detector', default='stub', help='stub, auto, onnx, onnx-int8 or torch-cpu')
+    run.add_argument('--weights', default=os.path.join(SERVER_DIR, 'models', 'i1-yolov8s.pt'), help='YOLO weights')
+    run.add_argument('--imgsz', type=int, default=640, help='Inference size')
+    run.add_argument('--width', type=int, default=1280, help='Detector suite frame width')
+    run.add_argument('--height', type=int, default=720, help='Detector suite frame height')
+    run.add_argument('--detector-frames', type=int, default=64, help='Frames per detector run')
+    run.add_argument('--batch-sizes', default='1,4,8', help='Comma separated batch sizes')
+    run.add_argument('--resolutions', default='640x360,1280x720', help='Clip sizes for the e2e suite')
+    run.add_argument('--e2e-frames', type=int, default=150, help='Frames per generated e2e clip')
+    run.add_argument('--ipc-resolutions', default='1280x720,1920x1080,3840x2160', help='Frame sizes for the ipc suite')
+    run.add_argument('--ipc-frames', type=int, default=60, help='Frames per ipc run')
+
+    diff = commands.add_parser('compare', help='Flag regressions between two reports')
+    diff.add_argument('baseline')
+    diff.add_argument('candidate')
+    diff.add_argument('--threshold', type=float, default=0.1, help='Relative change that counts [0.1 = 10%%]')
+    diff.add_argument('--min-ms', type=float, default=0.1, help='Ignore latency changes smaller than this')
+    diff.add_argument('--metrics', default=None, help='Only compare metrics ending in these, e.g. fps,p95_ms')
+    diff.add_argument('--all', action='store_true', help='Print unchanged metrics too')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    sys.exit(run_suites(args) if args.command == 'run' else compare(args))
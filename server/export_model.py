@@ -0,0 +1,156 @@
+"""
+Exports the accident detector to CPU-friendly formats and validates them.
+
+    $ python export_model.py --weights models/i1-yolov8s.pt --formats onnx,onnx-int8
+    $ python export_model.py --validate-only --video processed/carcrash.mp4 --frames 100
+
+Export writes, next to the .pt weights:
+  onnx       <stem>.onnx           (dynamic batch, for ONNX Runtime CPU)
+  onnx-int8  <stem>.int8.onnx      (dynamic INT8 weight quantization of the above)
+  openvino   <stem>_openvino_model/
+
+Validation runs every available backend over the same frames of a sample
+clip and reports per-frame latency and the accuracy delta against the
+torch-cpu reference (detections matched at IOU >= 0.5).
+"""
+
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from modules.backends import BackendUnavailable, create_backend, export_paths
+from modules.detections import extract_detections
+from modules.sort import iou_batch
+
+BACKENDS = ("torch-cuda", "torch-cpu", "onnx", "onnx-int8", "openvino")
+
+
+def export(weights, formats, imgsz):
+    from ultralytics import YOLO
+
+    paths = export_paths(weights)
+    model = YOLO(weights)
+    if "onnx" in formats or "onnx-int8" in formats:
+        exported = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+        if os.path.abspath(exported) != os.path.abspath(paths["onnx"]):
+            os.replace(exported, paths["onnx"])
+        print(f"Exported {paths['onnx']}")
+    if "onnx-int8" in formats:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(paths["onnx"], paths["onnx-int8"], weight_type=QuantType.QUInt8)
+        print(f"Exported {paths['onnx-int8']}")
+    if "openvino" in formats:
+        exported = model.export(format="openvino", imgsz=imgsz)
+        print(f"Exported {exported}")
+
+
+def read_frames(video, count):
+    cap = cv2.VideoCapture(video)
+    frames = []
+    while len(frames) < count:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise SystemExit(f"Could not read frames from {video}")
+    return frames
+
+
+def run_backend(backend, frames, batch_size):
+    backend(frames[:1])  # warm up
+    detections = []
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        for result in backend(frames[i:i + batch_size]):
+            detections.append(extract_detections(result))
+    elapsed = time.perf_counter() - start
+    return detections, elapsed / len(frames) * 1000.
+
+
+def compare(reference, candidate, match_iou=0.5):
+    """
+    Precision/recall of ``candidate`` detections against ``reference`` and
+    the mean absolute confidence difference of matched boxes.
+    """
+    matched = ref_total = cand_total = 0
+    conf_delta = []
+    for ref, cand in zip(reference, candidate):
+        ref_total += len(ref)
+        cand_total += len(cand)
+        if len(ref) == 0 or len(cand) == 0:
+            continue
+        iou = iou_batch(ref[:, :4], cand[:, :4])
+        best = iou.argmax(axis=1)
+        hit = iou[np.arange(len(ref)), best] >= match_iou
+        matched += int(hit.sum())
+        conf_delta.extend(np.abs(ref[hit, 4] - cand[best[hit], 4]))
+    return {
+        "recall": matched / ref_total if ref_total else 1.0,
+        "precision": matched / cand_total if cand_total else 1.0,
+        "conf_delta": float(np.mean(conf_delta)) if conf_delta else 0.0,
+    }
+
+
+def validate(weights, backends, video, count, batch_size, imgsz):
+    frames = read_frames(video, count)
+    report = {}
+    reference = None
+    for name in backends:
+        try:
+            backend = create_backend(name, weights, imgsz=imgsz)
+        except (BackendUnavailable, ImportError) as e:
+            report[name] = {"available": False, "reason": str(e)}
+            continue
+        detections, latency = run_backend(backend, frames, batch_size)
+        report[name] = {"available": True, "latency_ms": latency, "detections": int(sum(map(len, detections)))}
+        if name == "torch-cpu":
+            reference = detections
+        report[name]["_detections"] = detections
+
+    for name, entry in report.items():
+        detections = entry.pop("_detections", None)
+        if detections is not None and reference is not None:
+            entry.update(compare(reference, detections))
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export and validate detector backends")
+    parser.add_argument("--weights", default="models/i1-yolov8s.pt", help="PyTorch weights")
+    parser.add_argument("--formats", default="onnx,onnx-int8", help="Formats to export: onnx,onnx-int8,openvino")
+    parser.add_argument("--imgsz", type=int, default=640, help="Export/inference size")
+    parser.add_argument("--validate-only", action="store_true", help="Skip export")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Backends to validate")
+    parser.add_argument("--video", default="processed/carcrash.mp4", help="Sample clip for validation")
+    parser.add_argument("--frames", type=int, default=100, help="Frames to validate on")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--json", default=None, help="Also write the report to this file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not args.validate_only:
+        export(args.weights, args.formats.split(","), args.imgsz)
+
+    report = validate(args.weights, args.backends.split(","), args.video, args.frames,
+                      args.batch_size, args.imgsz)
+
+    print("%-11s %10s %8s %9s %10s" % ("backend", "ms/frame", "recall", "precision", "conf delta"))
+    for name, entry in report.items():
+        if not entry["available"]:
+            print("%-11s unavailable: %s" % (name, entry["reason"]))
+            continue
+        print("%-11s %10.2f %8.3f %9.3f %10.4f" % (
+            name, entry["latency_ms"], entry.get("recall", float("nan")),
+            entry.get("precision", float("nan")), entry.get("conf_delta", float("nan"))))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
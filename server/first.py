@@ -1,14 +1,18 @@
 import asyncio
-import numpy as np
-from ultralytics import YOLO
+import os
 import cv2
 import cvzone
-import math
-from modules.sort import *
-import base64
+from modules.sort import Sort
+from modules.detections import extract_detections
+from modules.backends import load_detector
+from modules.alerts import AlertDispatcher, WebhookSink, encode_snapshot
 
-# Importing the model
-model = YOLO('models/i1-yolov8s.pt').to('cuda')
+# Importing the model (fastest available backend: CUDA, CPU, ONNX)
+model = load_detector('models/i1-yolov8s.pt')
+
+# Accident alerts are posted to ALERT_WEBHOOK_URL when it is set
+ALERT_WEBHOOK_URL = os.environ.get("ALERT_WEBHOOK_URL")
+alerts = AlertDispatcher([WebhookSink(ALERT_WEBHOOK_URL)] if ALERT_WEBHOOK_URL else [])
 
 # Importing the video
 cap = cv2.VideoCapture("./assets/car-crash.mov")
@@ -26,23 +30,15 @@ async def main():
             break
         
         results = model(img, stream=True)
-        detections = np.empty((0, 5))
-
-        for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0]
-                x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                w, h = x2 - x1, y2 - y1
-
-                conf = math.ceil((box.conf[0] * 100)) / 100
-                tempConf = conf
+        detections = extract_detections(results)
+        if len(detections):
+            tempConf = float(detections[:, 4].max())
 
-                if float(tempConf) > 0.4:
-                    cvzone.cornerRect(img, (x1, y1, w, h))
-                    cvzone.putTextRect(img, f'Accident {conf}', (max(0, x1), max(35, y1)), colorR=(0, 165, 255))
-                    currentArray = np.array([x1, y1, x2, y2, conf])
-                    detections = np.vstack((detections, currentArray))
+        for x1, y1, x2, y2, conf in detections:
+            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+            w, h = x2 - x1, y2 - y1
+            cvzone.cornerRect(img, (x1, y1, w, h))
+            cvzone.putTextRect(img, f'Accident {conf}', (max(0, x1), max(35, y1)), colorR=(0, 165, 255))
 
         trackerResults = tracker.update(detections)
 
@@ -53,15 +49,10 @@ async def main():
             w, h = x2 - x1, y2 - y1
 
             if totalAccidents.count(id) == 0:
-                _, frame_encoded = cv2.imencode('.jpg', img)
-                frame_base64 = base64.b64encode(frame_encoded).decode('utf-8')
-                data = {
-                    "severityInPercentage": tempConf * 100,
-                    "severity": "Moderate",
-                    "frame": frame_base64
-                }
-                # Log data to console (or handle as needed)
-                print(f"Accident Data: {data}")
+                print(f"Accident {id}: severity {tempConf * 100:.0f}%")
+                if alerts.sinks:
+                    alerts.submit("first.py", id, confidence=tempConf, box=(x1, y1, x2, y2),
+                                  snapshot=encode_snapshot(img), severity="Moderate")
 
                 cvzone.cornerRect(img, (x1, y1, w, h), colorR=(255, 0, 255))
                 cvzone.putTextRect(img, f'{id}', (max(0, x1), max(35, y1)))
@@ -77,8 +68,11 @@ async def main():
         await asyncio.sleep(0.01)
 
 if __name__ == "__main__":
+    if alerts.sinks:
+        alerts.start()
     loop = asyncio.get_event_loop()
     try:
         loop.run_until_complete(main())
     finally:
-        loop.close()
\ No newline at end of file
+        loop.close()
+        alerts.stop()
\ No newline at end of file
@@ -0,0 +1,349 @@
+"""
+Accident alert delivery.
+
+Processing threads hand alerts to ``AlertDispatcher.submit``, which only
+counts and schedules them and never waits. Snapshots are queued as small
+JPEGs (see ``encode_snapshot``), never as raw frames. An alert counts
+against ``queue_size`` until its notification has been delivered or
+dead-lettered; beyond that, new alerts are dropped (and counted), so a
+failing sink cannot make memory grow without bound.
+Everything else happens on one asyncio event loop in a background thread:
+
+  coalescing  alerts from the same source (camera or job) within
+              ``coalesce_window`` seconds are merged into one notification
+  delivery    every sink (webhook, email) gets each notification over a
+              pooled connection, at most ``max_concurrency`` at a time
+  retries     failed deliveries are retried with exponential backoff and
+              jitter; what still fails (or is rejected outright, e.g. HTTP
+              4xx) is appended to a JSON-lines dead-letter file
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import random
+import threading
+import time
+from email.message import EmailMessage
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+class PermanentError(Exception):
+    """A delivery failure that retrying cannot fix."""
+
+
+def encode_snapshot(frame, max_size=640, quality=80):
+    """
+    JPEG bytes of ``frame`` (BGR image) scaled down so that its longer side
+    is at most ``max_size``, or None if encoding fails. Encode once per frame
+    and pass the result to every ``submit`` for that frame.
+    """
+    height, width = frame.shape[:2]
+    scale = max_size / max(height, width)
+    if scale < 1:
+        frame = cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    ok, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return jpeg.tobytes() if ok else None
+
+
+class WebhookSink(object):
+    """
+    POSTs notifications as JSON through one pooled ``httpx.AsyncClient``.
+    """
+
+    name = "webhook"
+
+    def __init__(self, url, timeout=10.0, headers=None, max_connections=10):
+        import httpx
+        self._httpx = httpx
+        self.url = url
+        self.timeout = timeout
+        self.headers = headers or {}
+        self.max_connections = max_connections
+        self._client = None
+
+    async def send(self, notification):
+        if self._client is None:
+            self._client = self._httpx.AsyncClient(
+                timeout=self.timeout,
+                headers=self.headers,
+                limits=self._httpx.Limits(max_connections=self.max_connections)
+            )
+        response = await self._client.post(self.url, json=notification)
+        if response.status_code in (408, 429) or response.status_code >= 500:
+            raise IOError(f"Webhook returned {response.status_code}")
+        if response.status_code >= 400:
+            raise PermanentError(f"Webhook rejected the alert with {response.status_code}")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class EmailSink(object):
+    """
+    Sends notifications as email over one SMTP connection that is kept open
+    between alerts and re-established when the server drops it.
+    """
+
+    name = "email"
+
+    def __init__(self, hostname, port, sender, recipients, username=None, password=None,
+                 use_tls=False, start_tls=None, timeout=30.0):
+        import aiosmtplib
+        self._aiosmtplib = aiosmtplib
+        self.hostname = hostname
+        self.port = port
+        self.sender = sender
+        self.recipients = list(recipients)
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.start_tls = start_tls
+        self.timeout = timeout
+        self._smtp = None
+        self._lock = None
+
+    async def _connection(self):
+        if self._smtp is not None and self._smtp.is_connected:
+            try:
+                await self._smtp.noop()
+                return self._smtp
+            except self._aiosmtplib.SMTPException:
+                self._smtp.close()
+        self._smtp = self._aiosmtplib.SMTP(hostname=self.hostname, port=self.port, use_tls=self.use_tls,
+                                           start_tls=self.start_tls, timeout=self.timeout)
+        await self._smtp.connect()
+        if self.username:
+            await self._smtp.login(self.username, self.password)
+        return self._smtp
+
+    def message(self, notification):
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = ", ".join(self.recipients)
+        message['Subject'] = f"Accident detected: {notification['source']}"
+        lines = [
+            f"Source: {notification['source']}",
+            f"Accidents: {', '.join(str(i) for i in notification['track_ids'])}",
+            f"First seen: {time.ctime(notification['first_time'])}",
+            f"Last seen: {time.ctime(notification['last_time'])}",
+            f"Peak confidence: {notification['confidence']}",
+        ]
+        if notification.get('filename'):
+            lines.insert(1, f"Video: {notification['filename']}")
+        message.set_content("\n".join(lines))
+        if notification.get('snapshot'):
+            message.add_attachment(base64.b64decode(notification['snapshot']), maintype='image',
+                                   subtype='jpeg', filename='snapshot.jpg')
+        return message
+
+    async def send(self, notification):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            try:
+                smtp = await self._connection()
+                errors, _ = await smtp.send_message(self.message(notification))
+            except self._aiosmtplib.SMTPRecipientsRefused as e:
+                raise PermanentError(str(e))
+            except (self._aiosmtplib.SMTPException, OSError):
+                if self._smtp is not None:
+                    self._smtp.close()
+                    self._smtp = None
+                raise
+            if errors and len(errors) == len(self.recipients):
+                raise PermanentError(f"All recipients refused: {errors}")
+
+    async def close(self):
+        if self._smtp is not None and self._smtp.is_connected:
+            try:
+                await self._smtp.quit()
+            except Exception:
+                self._smtp.close()
+        self._smtp = None
+
+
+class AlertDispatcher(object):
+    """
+    ``submit(source, track_id, ...)`` from any thread; notifications go to
+    every sink in ``sinks`` (objects with ``name``, ``async send(dict)`` and
+    ``async close()``).
+    """
+
+    def __init__(self, sinks, queue_size=256, coalesce_window=10.0, max_retries=5,
+                 backoff_initial=1.0, backoff_max=60.0, max_concurrency=8, dead_letter_path=None):
+        self.sinks = list(sinks)
+        self.queue_size = queue_size
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.max_concurrency = max_concurrency
+        self.dead_letter_path = dead_letter_path
+        self.counts = {"submitted": 0, "dropped": 0, "coalesced": 0, "notifications": 0,
+                       "delivered": 0, "retries": 0, "dead_lettered": 0}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._dead_letter_lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._batches = {}
+        self._tasks = set()
+        self._semaphore = None
+        self._ready = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run_loop, name="alerts", daemon=True)
+            self._thread.start()
+            self._ready.wait()
+        return self
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    def submit(self, source, track_id, confidence=None, box=None, snapshot=None, frame_index=None, **details):
+        """
+        Queues an accident alert. ``snapshot`` (JPEG bytes from
+        ``encode_snapshot``) is attached to the notification. Returns False
+        if the alert was dropped.
+        """
+        with self._lock:
+            self.counts["submitted"] += 1
+            if self._loop is None or self._pending >= self.queue_size:
+                self.counts["dropped"] += 1
+                return False
+            self._pending += 1
+        alert = {
+            "source": source,
+            "track_id": int(track_id),
+            "confidence": None if confidence is None else round(float(confidence), 4),
+            "box": None if box is None else [int(v) for v in box],
+            "frame_index": frame_index,
+            "time": time.time(),
+            "snapshot": snapshot,
+            **details
+        }
+        self._loop.call_soon_threadsafe(self._add, alert)
+        return True
+
+    def _add(self, alert):
+        batch = self._batches.get(alert["source"])
+        if batch is None:
+            self._batches[alert["source"]] = {"alerts": [alert], "opened": time.monotonic()}
+            self._loop.call_later(self.coalesce_window, self._flush, alert["source"])
+        else:
+            batch["alerts"].append(alert)
+            self.counts["coalesced"] += 1
+
+    def _flush(self, source):
+        batch = self._batches.pop(source, None)
+        if batch is not None:
+            task = self._loop.create_task(self._dispatch(batch["alerts"]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, alerts):
+        try:
+            notification = self._notification(alerts)
+            self.counts["notifications"] += 1
+            await asyncio.gather(*(self._deliver(sink, notification) for sink in self.sinks))
+        finally:
+            with self._lock:
+                self._pending -= len(alerts)
+
+    def _notification(self, alerts):
+        """
+        Merges the alerts of one source and window into one notification.
+        """
+        best = max(alerts, key=lambda a: a["confidence"] if a["confidence"] is not None else -1)
+        details = {k: v for k, v in best.items()
+                   if k not in ("track_id", "confidence", "box", "frame_index", "time", "snapshot")}
+        track_ids = sorted({a["track_id"] for a in alerts})
+        snapshot = best["snapshot"] or next((a["snapshot"] for a in alerts if a["snapshot"]), None)
+        return dict(details, **{
+            "kind": "accident",
+            "track_ids": track_ids,
+            "alerts": len(alerts),
+            "first_time": min(a["time"] for a in alerts),
+            "last_time": max(a["time"] for a in alerts),
+            "confidence": best["confidence"],
+            "accidents": [{"track_id": a["track_id"], "confidence": a["confidence"], "box": a["box"],
+                           "frame_index": a["frame_index"], "time": a["time"]} for a in alerts],
+            "snapshot": None if snapshot is None else base64.b64encode(snapshot).decode('ascii'),
+        })
+
+    async def _deliver(self, sink, notification):
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.counts["retries"] += 1
+                delay = min(self.backoff_max, self.backoff_initial * 2 ** (attempt - 1))
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            try:
+                async with self._semaphore:
+                    await sink.send(notification)
+                self.counts["delivered"] += 1
+                return
+            except PermanentError as e:
+                error = e
+                break
+            except Exception as e:
+                error = e
+                logger.warning(f"Alert to {sink.name} failed (attempt {attempt + 1}): {str(e)}")
+        logger.error(f"Giving up on alert to {sink.name}: {str(error)}")
+        self._dead_letter(sink, notification, error, attempt + 1)
+
+    def _dead_letter(self, sink, notification, error, attempts):
+        self.counts["dead_lettered"] += 1
+        if not self.dead_letter_path:
+            return
+        record = {"sink": sink.name, "error": str(error), "attempts": attempts, "failed_at": time.time(),
+                  "notification": notification}
+        try:
+            with self._dead_letter_lock, open(self.dead_letter_path, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logger.error(f"Failed to write alert dead letter: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, pending=self._pending, open_batches=len(self._batches),
+                        in_flight=len(self._tasks))
+
+    def stop(self, timeout=30.0):
+        """
+        Sends open batches right away, waits up to ``timeout`` seconds for
+        deliveries and closes the sinks' connections.
+        """
+        if self._loop is None:
+            return
+
+        async def drain():
+            for source in list(self._batches):
+                self._flush(source)
+            if self._tasks:
+                await asyncio.wait(list(self._tasks), timeout=timeout)
+            for sink in self.sinks:
+                try:
+                    await sink.close()
+                except Exception as e:
+                    logger.warning(f"Closing alert sink {sink.name} failed: {str(e)}")
+
+        asyncio.run_coroutine_threadsafe(drain(), self._loop).result(timeout + 5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._loop = None
+        self._thread = None
@@ -0,0 +1,21 @@
+"""
+Drawing of detections and accident tracks on output frames, shared by the
+sequential and the segmented (multi-process) video paths so both render
+identically.
+"""
+
+import cvzone
+
+
+def draw_detections(img, detections):
+    for x1, y1, x2, y2, conf in detections:
+        x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+        cvzone.cornerRect(img, (x1, y1, x2 - x1, y2 - y1))
+        cvzone.putTextRect(img, f"Accident {conf}", (x1, y1 - 10), colorR=(0, 165, 255))
+
+
+def draw_track(img, track):
+    x1, y1, x2, y2, id = track
+    x1, y1, x2, y2 = map(int, [x1, y1, x2, y2])
+    cvzone.cornerRect(img, (x1, y1, x2 - x1, y2 - y1), colorR=(255, 0, 255))
+    cvzone.putTextRect(img, f"ID {id}", (x1, y1 - 10))
@@ -0,0 +1,120 @@
+"""
+Pluggable detector backends.
+
+Every backend wraps an ultralytics ``YOLO`` model, which dispatches to
+PyTorch, ONNX Runtime or OpenVINO depending on the weights it is given, and
+exposes the same call: a list of BGR frames in, one ``Results`` per frame
+out. ``load_detector`` walks a preference list and returns the first backend
+that can actually be loaded on this machine, so CPU-only nodes no longer
+fail at startup on ``.to("cuda")``.
+"""
+
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ORDER = ("torch-cuda", "torch-cpu", "onnx", "onnx-int8")
+
+
+class BackendUnavailable(Exception):
+    """Raised when a backend cannot run on this machine."""
+
+
+def export_paths(weights):
+    """
+    Returns the file each exported backend is loaded from, next to the
+    PyTorch weights.
+    """
+    stem = os.path.splitext(weights)[0]
+    return {
+        "torch-cuda": weights,
+        "torch-cpu": weights,
+        "onnx": stem + ".onnx",
+        "onnx-int8": stem + ".int8.onnx",
+        "openvino": stem + "_openvino_model",
+    }
+
+
+class DetectorBackend(object):
+    """
+    Thread-safe wrapper around one loaded model. Calls are serialized because
+    the ultralytics predictor keeps per-call state.
+    """
+
+    def __init__(self, name, path, device, imgsz=640):
+        self.name = name
+        self.path = path
+        self.device = device
+        self.imgsz = imgsz
+        self._lock = threading.Lock()
+        self.model = self._load()
+
+    def _load(self):
+        from ultralytics import YOLO
+        if self.name.startswith("torch"):
+            return YOLO(self.path).to(self.device)
+        return YOLO(self.path, task="detect")
+
+    def __call__(self, frames, **kwargs):
+        options = {"device": self.device, "imgsz": self.imgsz, "verbose": False}
+        options.update(kwargs)
+        # Results are always materialized so that no lazy generator runs
+        # outside the lock
+        options.pop("stream", None)
+        with self._lock:
+            return list(self.model(frames, **options))
+
+    def describe(self):
+        return {"backend": self.name, "path": self.path, "device": self.device, "imgsz": self.imgsz}
+
+
+def check_backend(name, path):
+    """
+    Raises BackendUnavailable if ``name`` cannot be loaded from ``path``.
+    """
+    if name == "torch-cuda":
+        import torch
+        if not torch.cuda.is_available():
+            raise BackendUnavailable("CUDA is not available")
+    elif name in ("onnx", "onnx-int8"):
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            raise BackendUnavailable("onnxruntime is not installed")
+    elif name == "openvino":
+        try:
+            import openvino  # noqa: F401
+        except ImportError:
+            raise BackendUnavailable("openvino is not installed")
+    elif name != "torch-cpu":
+        raise BackendUnavailable(f"Unknown backend {name!r}")
+
+    if not os.path.exists(path):
+        raise BackendUnavailable(f"{path} not found (run export_model.py)")
+
+
+def create_backend(name, weights, imgsz=640):
+    path = export_paths(weights)[name]
+    check_backend(name, path)
+    device = "cuda" if name == "torch-cuda" else "cpu"
+    return DetectorBackend(name, path, device, imgsz=imgsz)
+
+
+def load_detector(weights, order=DEFAULT_ORDER, imgsz=640):
+    """
+    Returns the first backend from ``order`` that loads successfully.
+    """
+    errors = []
+    for name in order:
+        name = name.strip()
+        try:
+            backend = create_backend(name, weights, imgsz=imgsz)
+        except Exception as e:
+            logger.info(f"Detector backend {name} unavailable: {str(e)}")
+            errors.append(f"{name}: {str(e)}")
+            continue
+        logger.info(f"Using detector backend {name} ({backend.path})")
+        return backend
+    raise BackendUnavailable("No detector backend could be loaded: " + "; ".join(errors))
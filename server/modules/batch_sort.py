@@ -0,0 +1,230 @@
+"""
+Structure-of-arrays variant of the SORT tracker.
+
+All track states and covariances live in stacked ``(T, 7)`` / ``(T, 7, 7)``
+arrays and the Kalman predict/update steps run as batched matmuls over every
+track at once, instead of one filterpy ``KalmanFilter`` per track. The
+filter model and the track life-cycle (IDs, ``min_hits``, ``max_age``) are
+identical to ``modules.sort.Sort`` so the two can be swapped freely.
+
+Setting ``profile`` (a metrics.Profile) times each update as the
+track_predict, track_associate and track_update stages.
+"""
+
+import numpy as np
+
+from modules.metrics import timed
+from modules.sort import ScratchBuffers, associate_detections_to_trackers
+
+# Constant velocity model over [x, y, s, r, vx, vy, vs], same as KalmanBoxTracker
+F = np.eye(7)
+F[0, 4] = F[1, 5] = F[2, 6] = 1.
+
+R = np.diag([1., 1., 10., 10.])
+
+Q = np.eye(7)
+Q[-1, -1] *= 0.01
+Q[4:, 4:] *= 0.01
+
+P0 = np.eye(7)
+P0[4:, 4:] *= 1000.  # high uncertainty for the unobservable initial velocities
+P0 *= 10.
+
+I7 = np.eye(7)
+
+
+def bboxes_to_z(bboxes):
+    """
+    Vectorized convert_bbox_to_z: ``(N, 4+)`` boxes to ``(N, 4)`` [x, y, s, r].
+    """
+    w = bboxes[:, 2] - bboxes[:, 0]
+    h = bboxes[:, 3] - bboxes[:, 1]
+    z = np.empty((len(bboxes), 4))
+    z[:, 0] = bboxes[:, 0] + w / 2.
+    z[:, 1] = bboxes[:, 1] + h / 2.
+    z[:, 2] = w * h
+    z[:, 3] = w / h
+    return z
+
+
+def states_to_bboxes(x):
+    """
+    Vectorized convert_x_to_bbox: ``(N, 7)`` states to ``(N, 4)`` boxes.
+    Invalid states (negative area) produce NaN rows.
+    """
+    with np.errstate(invalid='ignore'):
+        w = np.sqrt(x[:, 2] * x[:, 3])
+        h = x[:, 2] / w
+    boxes = np.empty((len(x), 4))
+    boxes[:, 0] = x[:, 0] - w / 2.
+    boxes[:, 1] = x[:, 1] - h / 2.
+    boxes[:, 2] = x[:, 0] + w / 2.
+    boxes[:, 3] = x[:, 1] + h / 2.
+    return boxes
+
+
+class BatchSort(object):
+    """
+    Drop-in replacement for ``Sort`` with batched Kalman filtering.
+    """
+
+    def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, sparse_iou=False):
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.iou_threshold = iou_threshold
+        self.sparse_iou = sparse_iou
+        self.buffers = ScratchBuffers()
+        self.profile = None
+        self.reset()
+
+    def reset(self):
+        """
+        Drops all tracks and restarts frame and ID numbering.
+        """
+        self.x = np.empty((0, 7))
+        self.P = np.empty((0, 7, 7))
+        self.ids = np.empty(0, dtype=np.int64)
+        self.time_since_update = np.empty(0, dtype=np.int64)
+        self.hits = np.empty(0, dtype=np.int64)
+        self.hit_streak = np.empty(0, dtype=np.int64)
+        self.age = np.empty(0, dtype=np.int64)
+        self.frame_count = 0
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def update(self, dets=np.empty((0, 5))):
+        """
+        Same contract as ``Sort.update``: call once per frame with an
+        ``(N, 5)`` array of [x1, y1, x2, y2, score] (possibly empty) and get
+        back ``(M, 5)`` rows of [x1, y1, x2, y2, id].
+        """
+        self.frame_count += 1
+        profile = self.profile
+
+        with timed(profile, "track_predict"):
+            trks = self.predict()
+            valid = ~np.any(np.isnan(trks), axis=1)
+            if not valid.all():
+                self._keep(valid)
+                trks = trks[valid]
+
+        with timed(profile, "track_associate"):
+            matched, unmatched_dets, _ = associate_detections_to_trackers(
+                dets, trks, self.iou_threshold, self.buffers, self.sparse_iou)
+
+        with timed(profile, "track_update"):
+            return self._finish(dets, matched, unmatched_dets)
+
+    def _finish(self, dets, matched, unmatched_dets):
+        """
+        Corrects matched tracks, spawns new ones and builds the output rows.
+        """
+        if len(matched):
+            self._correct(matched[:, 1], dets[matched[:, 0], :4])
+        if len(unmatched_dets):
+            self._spawn(dets[unmatched_dets, :4])
+
+        boxes = states_to_bboxes(self.x)
+        confirmed = (self.time_since_update < 1) & \
+            ((self.hit_streak >= self.min_hits) | (self.frame_count <= self.min_hits))
+
+        # Sort walks its tracker list backwards when building the output
+        order = np.flatnonzero(confirmed)[::-1]
+        ret = np.empty((len(order), 5))
+        ret[:, :4] = boxes[order]
+        ret[:, 4] = self.ids[order] + 1  # +1 as MOT benchmark requires positive
+
+        alive = self.time_since_update <= self.max_age
+        if not alive.all():
+            self._keep(alive)
+        return ret
+
+    def coast(self):
+        """
+        Advances every track by one frame without a measurement, for frames
+        on which the detector was skipped. Hit streaks and miss counters are
+        left alone, so coasting does not age tracks out. Returns the tracks
+        reported by the last update at their predicted positions.
+        """
+        if len(self.ids) == 0:
+            return np.empty((0, 5))
+
+        with timed(self.profile, "track_predict"):
+            self.x[self.x[:, 6] + self.x[:, 2] <= 0, 6] = 0.
+            self.x = self.x @ F.T
+            self.P = F @ self.P @ F.T + Q
+
+        confirmed = (self.time_since_update < 1) & \
+            ((self.hit_streak >= self.min_hits) | (self.frame_count <= self.min_hits))
+        order = np.flatnonzero(confirmed)[::-1]
+        ret = np.empty((len(order), 5))
+        ret[:, :4] = states_to_bboxes(self.x[order])
+        ret[:, 4] = self.ids[order] + 1
+        return ret[~np.isnan(ret).any(axis=1)]
+
+    def predict(self):
+        """
+        Advances every track by one frame and returns the predicted ``(T, 4)``
+        boxes.
+        """
+        if len(self.ids) == 0:
+            return np.empty((0, 4))
+
+        self.x[self.x[:, 6] + self.x[:, 2] <= 0, 6] = 0.
+        self.x = self.x @ F.T
+        self.P = F @ self.P @ F.T + Q
+
+        self.age += 1
+        self.hit_streak[self.time_since_update > 0] = 0
+        self.time_since_update += 1
+        return states_to_bboxes(self.x)
+
+    def _correct(self, idx, bboxes):
+        """
+        Batched Kalman update of tracks ``idx`` with their matched boxes.
+        """
+        z = bboxes_to_z(bboxes)
+        x = self.x[idx]
+        P = self.P[idx]
+
+        # H selects the first four state components, so P H^T and H P H^T
+        # are plain slices
+        PHT = P[:, :, :4]
+        S = PHT[:, :4, :] + R
+        K = PHT @ np.linalg.inv(S)
+        x = x + (K @ (z - x[:, :4])[:, :, None])[:, :, 0]
+
+        I_KH = np.broadcast_to(I7, P.shape).copy()
+        I_KH[:, :, :4] -= K
+        P = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ R @ K.transpose(0, 2, 1)
+
+        self.x[idx] = x
+        self.P[idx] = P
+        self.time_since_update[idx] = 0
+        self.hits[idx] += 1
+        self.hit_streak[idx] += 1
+
+    def _spawn(self, bboxes):
+        n = len(bboxes)
+        x = np.zeros((n, 7))
+        x[:, :4] = bboxes_to_z(bboxes)
+        self.x = np.concatenate((self.x, x))
+        self.P = np.concatenate((self.P, np.broadcast_to(P0, (n, 7, 7))))
+        self.ids = np.concatenate((self.ids, np.arange(self.next_id, self.next_id + n)))
+        self.next_id += n
+        zeros = np.zeros(n, dtype=np.int64)
+        self.time_since_update = np.concatenate((self.time_since_update, zeros))
+        self.hits = np.concatenate((self.hits, zeros))
+        self.hit_streak = np.concatenate((self.hit_streak, zeros))
+        self.age = np.concatenate((self.age, zeros))
+
+    def _keep(self, mask):
+        self.x = self.x[mask]
+        self.P = self.P[mask]
+        self.ids = self.ids[mask]
+        self.time_since_update = self.time_since_update[mask]
+        self.hits = self.hits[mask]
+        self.hit_streak = self.hit_streak[mask]
+        self.age = self.age[mask]
@@ -0,0 +1,195 @@
+"""
+Content-addressed cache of processing results.
+
+An entry is keyed on the SHA-256 of the uploaded file, the digest of the
+detector weights and every pipeline parameter that changes the output, so an
+identical clip processed with identical settings is never run through the
+detector twice. Each entry is a directory holding the processed video, a
+``meta.json`` with the job's result metadata and any attachments (e.g. the
+track sidecar).
+
+Total size is bounded: the least recently used entries are evicted once
+``max_bytes`` is exceeded. Recency survives restarts through the mtime of
+``meta.json``, which is touched on every hit.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK = 1024 * 1024
+VIDEO_NAME = "video.mp4"
+META_NAME = "meta.json"
+
+
+def file_digest(path):
+    """
+    SHA-256 of a file, or of all files below a directory (e.g. an exported
+    OpenVINO model) in sorted order.
+    """
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    else:
+        paths = [path]
+    for p in paths:
+        with open(p, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(content_digest, weights_digest, params):
+    """
+    Combines the input digests and the JSON-serializable pipeline
+    parameters into one key.
+    """
+    payload = json.dumps({"content": content_digest, "weights": weights_digest, "params": params},
+                         sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def link_or_copy(source, destination):
+    """
+    Places ``source`` at ``destination`` (replacing it atomically), as a hard
+    link when both are on the same filesystem.
+    """
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        return
+    temp_path = f"{destination}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        shutil.copyfile(source, temp_path)
+    try:
+        os.replace(temp_path, destination)
+    finally:
+        # rename() is a no-op when both names already link the same file
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class ResultCache(object):
+    """
+    LRU cache of processed videos, one directory per key under ``folder``.
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        found = []
+        for key in os.listdir(self.folder):
+            meta_path = os.path.join(self.folder, key, META_NAME)
+            video_path = os.path.join(self.folder, key, VIDEO_NAME)
+            if not (os.path.exists(meta_path) and os.path.exists(video_path)):
+                # Left over from an interrupted put
+                shutil.rmtree(os.path.join(self.folder, key), ignore_errors=True)
+                continue
+            found.append((os.path.getmtime(meta_path), key, self._entry_size(key)))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+
+    @property
+    def size(self):
+        with self._lock:
+            return sum(self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Returns ``(video_path, metadata)`` for a cached result, or None.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        entry = os.path.join(self.folder, key)
+        meta_path = os.path.join(entry, META_NAME)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            os.utime(meta_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable cache entry {key}: {str(e)}")
+            self._remove(key)
+            return None
+        return os.path.join(entry, VIDEO_NAME), meta
+
+    def attachment(self, key, name):
+        """
+        Path of the attachment ``name`` of a cached entry, or None.
+        """
+        path = os.path.join(self.folder, key, name)
+        return path if os.path.exists(path) else None
+
+    def put(self, key, video_path, meta, attachments=None):
+        """
+        Stores a processed video, its metadata and ``attachments`` (name ->
+        path) under ``key``, then evicts least recently used entries beyond
+        ``max_bytes``.
+        """
+        entry = os.path.join(self.folder, key)
+        staging = os.path.join(self.folder, f".{key}.{uuid.uuid4().hex[:8]}")
+        os.makedirs(staging)
+        try:
+            link_or_copy(video_path, os.path.join(staging, VIDEO_NAME))
+            for name, path in (attachments or {}).items():
+                link_or_copy(path, os.path.join(staging, name))
+            with open(os.path.join(staging, META_NAME), 'w') as f:
+                json.dump(dict(meta, cached_at=time.time()), f)
+            with self._lock:
+                if key in self._entries:
+                    return
+                os.rename(staging, entry)
+                self._entries[key] = self._entry_size(key)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self._evict()
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if sum(self._entries.values()) <= self.max_bytes or len(self._entries) <= 1:
+                    return
+                key = next(iter(self._entries))
+            logger.info(f"Evicting cached result {key}")
+            self._remove(key)
+
+    def _remove(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        shutil.rmtree(os.path.join(self.folder, key), ignore_errors=True)
+
+    def _entry_size(self, key):
+        entry = os.path.join(self.folder, key)
+        return sum(os.path.getsize(os.path.join(entry, name)) for name in os.listdir(entry))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,360 @@
+"""
+Video decoding for the processing pipeline.
+
+cv2.VideoCapture only reads complete files or URLs. FFmpegPipeCapture runs
+``ffmpeg`` as a separate decoder process and reads raw BGR frames back from
+its stdout, exposing the subset of the VideoCapture interface the processing
+code uses. Its input is either a file path or any file-like ``read()``
+source (e.g. an upload that is still arriving) fed into ``pipe:0``. ffmpeg
+can decode with several threads, on a hardware decoder (``hwaccel``) and
+scale frames before they cross the pipe.
+
+Files can be opened at a frame: ``open_at`` seeks to the keyframe at or
+before it, which is cheap, and decodes forward only the frames in between.
+
+FrameRing recycles frame buffers, so that the decode stage reads each frame
+into an array a consumer has already finished with instead of allocating
+a new one.
+"""
+
+import bisect
+import logging
+import re
+import shutil
+import subprocess
+import threading
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FEED_BLOCK = 1024 * 1024
+
+
+class DecoderError(Exception):
+    """Raised when ffmpeg is missing or cannot decode the stream."""
+
+
+def find_keyframes(path, fps):
+    """
+    Returns the sorted frame indices of the video's keyframes, or None if
+    they cannot be determined. Uses ffprobe's packet flags (no decoding)
+    when available, otherwise ffmpeg decoding only keyframes.
+    """
+    if not fps or fps <= 0:
+        return None
+    ffprobe = shutil.which("ffprobe")
+    ffmpeg = shutil.which("ffmpeg")
+    try:
+        if ffprobe is not None:
+            result = subprocess.run(
+                [ffprobe, '-v', 'error', '-select_streams', 'v:0',
+                 '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', path],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+            times = []
+            for line in result.stdout.decode(errors='replace').splitlines():
+                fields = line.strip().split(',')
+                if len(fields) >= 2 and 'K' in fields[1] and fields[0] not in ('', 'N/A'):
+                    times.append(float(fields[0]))
+        elif ffmpeg is not None:
+            result = subprocess.run(
+                [ffmpeg, '-hide_banner', '-nostats', '-skip_frame', 'nokey', '-i', path,
+                 '-map', '0:v:0', '-vf', 'showinfo', '-f', 'null', '-'],
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+            times = [float(t) for t in re.findall(r'pts_time:\s*(-?[\d.]+)',
+                                                  result.stderr.decode(errors='replace'))]
+        else:
+            return None
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        logger.warning(f"Could not read keyframes of {path}: {str(e)}")
+        return None
+
+    if not times:
+        return None
+    first = min(times)
+    return sorted({int(round((t - first) * fps)) for t in times})
+
+
+def keyframe_before(keyframes, frame):
+    """
+    The last of the sorted ``keyframes`` at or before ``frame`` (0 if none).
+    """
+    if not keyframes:
+        return 0
+    i = bisect.bisect_right(keyframes, frame)
+    return keyframes[i - 1] if i else 0
+
+
+class FrameRing(object):
+    """
+    Pool of at most ``capacity`` frame arrays of one shape. Arrays are
+    allocated on first need and handed out again once released, so after the
+    first few frames decoding allocates nothing. ``acquire`` blocks while
+    all of them are in use.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = max(1, int(capacity))
+        self.shape = None
+        self._owned = []
+        self._free = []
+        self._cond = threading.Condition()
+
+    @property
+    def allocated(self):
+        return len(self._owned)
+
+    def acquire(self, shape, timeout=None):
+        """
+        Returns a free ``uint8`` array of ``shape`` (contents undefined), or
+        None if none was released within ``timeout`` seconds.
+        """
+        shape = tuple(shape)
+        with self._cond:
+            if shape != self.shape:
+                # New frame size: arrays of the old size are dropped as they come back
+                self.shape = shape
+                self._owned = []
+                self._free = []
+            while not self._free and len(self._owned) >= self.capacity:
+                if not self._cond.wait(timeout):
+                    return None
+            if self._free:
+                return self._free.pop()
+            frame = np.empty(shape, dtype=np.uint8)
+            self._owned.append(frame)
+            return frame
+
+    def release(self, frame):
+        """
+        Returns ``frame`` to the pool; arrays the ring did not hand out are
+        ignored.
+        """
+        if frame is None:
+            return
+        with self._cond:
+            if any(frame is owned for owned in self._owned) and not any(frame is free for free in self._free):
+                self._free.append(frame)
+                self._cond.notify()
+
+
+def read_frame(cap, out=None):
+    """
+    ``cap.read()`` into ``out`` where the capture supports it (FFmpegPipeCapture,
+    cv2.VideoCapture); other captures return a new array.
+    """
+    if out is not None:
+        read_into = getattr(cap, 'read_into', None)
+        if read_into is not None:
+            return read_into(out)
+        if isinstance(cap, cv2.VideoCapture):
+            return cap.read(out)
+    return cap.read()
+
+
+def open_capture(path, backend="opencv", threads=0, hwaccel=None):
+    """
+    Opens ``path`` with ``backend`` "ffmpeg" (FFmpegPipeCapture, if ffmpeg is
+    installed) or "opencv". ``hwaccel`` selects a hardware decoder: an ffmpeg
+    ``-hwaccel`` name for the ffmpeg backend; for OpenCV any value asks for
+    whatever acceleration its FFmpeg backend offers.
+    """
+    if backend == "ffmpeg" and shutil.which("ffmpeg") is not None:
+        return FFmpegPipeCapture(path, threads=threads, hwaccel=hwaccel)
+    if hwaccel and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+        return cv2.VideoCapture(path, cv2.CAP_FFMPEG,
+                                [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
+    return cv2.VideoCapture(path)
+
+
+class FFmpegPipeCapture(object):
+    """
+    ``read()`` returns ``(True, frame)`` per decoded frame and
+    ``(False, None)`` at the end of the stream. If the source fails before
+    its end (e.g. an aborted upload), ``read()`` raises DecoderError instead
+    of silently ending the video early.
+
+    ``source`` is a file path or a file-like object. Options:
+
+      threads  decoder threads (0: ffmpeg's choice)
+      hwaccel  ffmpeg ``-hwaccel`` method, e.g. "cuda", "vaapi" or "auto";
+               frames are downloaded to system memory for the pipe
+      scale    ``(width, height)`` to scale to inside ffmpeg (-1 keeps the
+               aspect ratio)
+      start    seconds to seek to (paths only); with ``accurate`` False the
+               stream starts at the keyframe at or before it
+
+    Width, height, frame rate and (if the container declares a duration) the
+    frame count are taken from ffmpeg's stream description, which it prints
+    as soon as it has parsed the container header.
+    """
+
+    def __init__(self, source, ffmpeg=None, probe_timeout=60.0, threads=0, hwaccel=None, scale=None,
+                 start=0.0, accurate=True):
+        ffmpeg = ffmpeg or shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise DecoderError("ffmpeg is not installed")
+        self.source = source
+        self.width = 0
+        self.height = 0
+        self.fps = 0.0
+        self.duration = 0.0
+        self.start = start
+        self._stderr_tail = []
+        self._source_error = None
+        self._interrupted = False
+        self._probed = threading.Event()
+        piped = not isinstance(source, str)
+        if piped and start:
+            raise ValueError("Only file paths can be opened at an offset")
+
+        command = [ffmpeg, '-hide_banner', '-nostats', '-noautorotate']
+        if threads:
+            command += ['-threads', str(int(threads))]
+        if hwaccel:
+            command += ['-hwaccel', hwaccel]
+        if start:
+            command += ['-ss', f"{start:.6f}"] + ([] if accurate else ['-noaccurate_seek'])
+        command += ['-i', 'pipe:0' if piped else source, '-map', '0:v:0', '-vsync', 'passthrough']
+        if scale is not None:
+            command += ['-vf', f"scale={int(scale[0])}:{int(scale[1])}"]
+        command += ['-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1']
+
+        self._proc = subprocess.Popen(
+            command, stdin=subprocess.PIPE if piped else subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._feeder = None
+        if piped:
+            self._feeder = threading.Thread(target=self._feed, name="decoder-feed", daemon=True)
+            self._feeder.start()
+        self._logger = threading.Thread(target=self._parse_stderr, name="decoder-stderr", daemon=True)
+        self._logger.start()
+        self._probed.wait(probe_timeout)
+        self._frame_size = self.width * self.height * 3
+
+    @classmethod
+    def open_at(cls, path, frame, fps, keyframes=None, **options):
+        """
+        Opens ``path`` so that the first ``read()`` returns frame ``frame``:
+        seeks straight to the keyframe at or before it (``keyframes`` from
+        ``find_keyframes``, looked up if not given) and decodes forward from
+        there.
+        """
+        if keyframes is None:
+            keyframes = find_keyframes(path, fps)
+        start = keyframe_before(keyframes, frame)
+        cap = cls(path, start=start / float(fps) if start else 0.0, accurate=False, **options)
+        buffer = None
+        for _ in range(frame - start):
+            success, buffer = cap.read_into(buffer) if buffer is not None else cap.read()
+            if not success:
+                break
+        return cap
+
+    def isOpened(self):
+        return self._proc is not None and self._frame_size > 0
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(int(max(0.0, self.duration - self.start) * self.fps))
+        return 0.0
+
+    def read(self):
+        if not self.isOpened():
+            return False, None
+        return self.read_into(np.empty((self.height, self.width, 3), dtype=np.uint8))
+
+    def read_into(self, out):
+        """
+        Reads the next frame into ``out`` (a C-contiguous ``uint8`` array of
+        the frame's shape) and returns ``(True, out)``.
+        """
+        if not self.isOpened():
+            return False, None
+        if out.shape != (self.height, self.width, 3):
+            raise ValueError(f"Frame buffer {out.shape} does not match {self.width}x{self.height}")
+        view = memoryview(out).cast('B')
+        filled = 0
+        while filled < self._frame_size:
+            count = self._proc.stdout.readinto(view[filled:])
+            if not count:
+                if self._source_error is not None and not self._interrupted:
+                    raise DecoderError(f"Input stream failed: {self._source_error}")
+                return False, None
+            filled += count
+        return True, out
+
+    def interrupt(self):
+        """
+        Unblocks a pending ``read()`` from another thread, e.g. when the
+        consumer stops before the end of the stream.
+        """
+        self._interrupted = True
+        close = getattr(self.source, 'close', None)
+        if close is not None:
+            close()
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.kill()
+
+    def release(self):
+        if self._proc is None:
+            return
+        self.interrupt()
+        self._proc.wait()
+        if self._feeder is not None:
+            self._feeder.join()
+        self._logger.join()
+        self._proc.stdout.close()
+        self._proc = None
+
+    def error_output(self):
+        return "\n".join(self._stderr_tail)
+
+    def _feed(self):
+        try:
+            while True:
+                try:
+                    data = self.source.read(FEED_BLOCK)
+                except (OSError, ValueError) as e:
+                    self._source_error = str(e)
+                    break
+                if not data:
+                    break
+                self._proc.stdin.write(data)
+        except (BrokenPipeError, OSError) as e:
+            logger.debug(f"Decoder input stopped: {str(e)}")
+        finally:
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass
+
+    def _parse_stderr(self):
+        in_output = False
+        for raw in iter(self._proc.stderr.readline, b''):
+            line = raw.decode(errors='replace').rstrip()
+            self._stderr_tail = (self._stderr_tail + [line])[-20:]
+            if not self._probed.is_set():
+                duration = re.search(r'Duration: (\d+):(\d+):([\d.]+)', line)
+                if duration:
+                    h, m, s = duration.groups()
+                    self.duration = int(h) * 3600 + int(m) * 60 + float(s)
+                if line.startswith('Output #'):
+                    in_output = True
+                if 'Video:' in line:
+                    fps = re.search(r'([\d.]+) (?:fps|tbr)', line)
+                    if fps and not in_output:
+                        self.fps = float(fps.group(1))
+                    size = re.search(r', (\d{2,5})x(\d{2,5})', line)
+                    if size and in_output:
+                        self.width, self.height = int(size.group(1)), int(size.group(2))
+                        self._probed.set()
+        self._probed.set()
+        self._proc.stderr.close()
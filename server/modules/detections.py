@@ -0,0 +1,91 @@
+"""
+Detection post-processing shared by the server and the standalone scripts.
+
+Turns YOLO results into the ``(N, 5)`` ``[x1, y1, x2, y2, conf]`` array that
+``Sort.update`` expects, in a single NumPy pass over all boxes.
+"""
+
+import numpy as np
+
+from modules.sort import iou_batch
+
+CONF_THRESHOLD = 0.4
+
+
+def to_numpy(values):
+    """
+    Converts a torch tensor (on any device) or array-like to a NumPy array.
+    """
+    if hasattr(values, 'cpu'):
+        values = values.cpu()
+    if hasattr(values, 'numpy'):
+        values = values.numpy()
+    return np.asarray(values)
+
+
+def filter_detections(xyxy, conf, conf_threshold=CONF_THRESHOLD, project=None):
+    """
+    Applies the confidence threshold to raw boxes.
+
+    Coordinates are truncated to whole pixels and confidences rounded up to
+    two decimals before thresholding, matching the per-box
+    ``int(x)`` / ``math.ceil(conf * 100) / 100`` logic this replaces.
+    ``project`` optionally maps the kept ``(K, 4)`` boxes back to original
+    frame coordinates before truncation (see ``Preprocessor.project``).
+    Returns a new ``(N, 5)`` float array.
+    """
+    xyxy = np.asarray(xyxy).reshape(-1, 4)
+    conf = np.asarray(conf).reshape(-1)
+
+    rounded = np.ceil(conf * conf.dtype.type(100)).astype(np.float64) / 100
+    keep = rounded > conf_threshold
+    count = int(np.count_nonzero(keep))
+
+    detections = np.empty((count, 5))
+    if count:
+        boxes = xyxy[keep] if project is None else project(xyxy[keep])
+        np.trunc(boxes, out=detections[:, :4])
+        detections[:, 4] = rounded[keep]
+    return detections
+
+
+def extract_detections(results, conf_threshold=CONF_THRESHOLD, project=None):
+    """
+    Builds the detection array for one frame from a YOLO ``Results`` object,
+    or from an iterable of them (e.g. the generator returned with
+    ``stream=True``).
+    """
+    if hasattr(results, 'boxes'):
+        results = [results]
+
+    arrays = []
+    for r in results:
+        boxes = r.boxes
+        if boxes is None or len(boxes) == 0:
+            continue
+        arrays.append(filter_detections(to_numpy(boxes.xyxy), to_numpy(boxes.conf), conf_threshold, project))
+
+    if not arrays:
+        return np.empty((0, 5))
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.concatenate(arrays)
+
+
+def match_confidence(tracks, detections, iou_threshold=0.3):
+    """
+    Confidence of the best-overlapping detection for each tracker box
+    (``(M, 5+)`` and ``(N, 5)`` arrays), NaN where no detection overlaps by
+    at least ``iou_threshold``.
+    """
+    confidence = np.full(len(tracks), np.nan)
+    if len(tracks) == 0 or detections is None or len(detections) == 0:
+        return confidence
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Degenerate (zero-area) boxes give 0/0; they overlap nothing
+        iou = np.nan_to_num(iou_batch(np.asarray(tracks, dtype=np.float64)[:, :4],
+                                      np.asarray(detections, dtype=np.float64)[:, :4]), nan=0.0)
+    best = iou.argmax(axis=1)
+    matched = iou[np.arange(len(tracks)), best] >= iou_threshold
+    confidence[matched] = np.asarray(detections)[best[matched], 4]
+    return confidence
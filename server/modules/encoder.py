@@ -0,0 +1,169 @@
+"""
+Single-pass H.264 output for processed videos.
+
+Annotated BGR frames are piped straight into one ffmpeg process that writes a
+faststart MP4, so each video is encoded and written to disk once. When ffmpeg
+is not installed, OpenCV's VideoWriter is used instead.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRESET = "fast"
+DEFAULT_CRF = 23
+DEFAULT_FPS = 25.0
+
+
+class EncoderError(Exception):
+    """Raised when the encoder process fails."""
+
+
+class FFmpegWriter(object):
+    """
+    Streams raw frames into ``ffmpeg -f rawvideo -i -`` and encodes them with
+    libx264. Output goes to a temporary file that replaces ``path`` only once
+    encoding succeeded.
+    """
+
+    def __init__(self, path, width, height, fps, preset=DEFAULT_PRESET, crf=DEFAULT_CRF,
+                 codec="libx264", ffmpeg="ffmpeg"):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.temp_path = path + ".part"
+        self._stderr = tempfile.TemporaryFile()
+        command = [
+            ffmpeg, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+            '-s', f'{width}x{height}', '-r', f'{fps:.6g}',
+            '-i', '-',
+            # yuv420p needs even dimensions
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+            '-an', '-c:v', codec, '-preset', preset, '-crf', str(crf),
+            '-pix_fmt', 'yuv420p', '-movflags', '+faststart',
+            '-f', 'mp4', self.temp_path
+        ]
+        self._proc = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._stderr)
+
+    def write(self, frame):
+        if frame.shape[:2] != (self.height, self.width):
+            raise EncoderError(f"Frame size {frame.shape[1]}x{frame.shape[0]} does not match "
+                               f"{self.width}x{self.height}")
+        try:
+            self._proc.stdin.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, OSError):
+            self.abort()
+            raise EncoderError(f"ffmpeg exited early: {self._error_output()}")
+
+    def release(self):
+        """
+        Finishes encoding and moves the output into place.
+        """
+        if self._proc is None:
+            return
+        self._proc.stdin.close()
+        returncode = self._proc.wait()
+        self._proc = None
+        if returncode != 0:
+            message = self._error_output()
+            self._cleanup()
+            raise EncoderError(f"ffmpeg failed with exit code {returncode}: {message}")
+        os.replace(self.temp_path, self.path)
+        self._stderr.close()
+
+    def abort(self):
+        """
+        Stops the encoder and discards the partial output.
+        """
+        if self._proc is not None:
+            self._proc.kill()
+            try:
+                self._proc.stdin.close()
+            except OSError:
+                pass
+            self._proc.wait()
+            self._proc = None
+        self._cleanup()
+
+    def _error_output(self):
+        self._stderr.seek(0)
+        return self._stderr.read().decode(errors='replace').strip()[-2000:]
+
+    def _cleanup(self):
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        self._stderr.close()
+
+
+class CvWriter(object):
+    """
+    cv2.VideoWriter fallback with the same write/release/abort interface.
+    """
+
+    def __init__(self, path, width, height, fps, fourcc='avc1'):
+        import cv2
+        self.path = path
+        # Write a new file rather than truncating one that may be hard-linked
+        # into the result cache
+        if os.path.exists(path):
+            os.remove(path)
+        self._out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+
+    def write(self, frame):
+        self._out.write(frame)
+
+    def release(self):
+        self._out.release()
+
+    def abort(self):
+        self._out.release()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def open_video_writer(path, width, height, fps, preset=DEFAULT_PRESET, crf=DEFAULT_CRF):
+    """
+    Returns an FFmpegWriter when ffmpeg is available, otherwise a CvWriter.
+    """
+    if not fps or fps <= 0 or fps != fps:
+        fps = DEFAULT_FPS
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        logger.warning("ffmpeg not found, falling back to cv2.VideoWriter")
+        return CvWriter(path, width, height, fps)
+    return FFmpegWriter(path, width, height, fps, preset=preset, crf=crf, ffmpeg=ffmpeg)
+
+
+def concat_videos(paths, output_path, ffmpeg=None):
+    """
+    Joins MP4 segments that were encoded with identical settings into one
+    file with ``-c copy``, i.e. without re-encoding.
+    """
+    ffmpeg = ffmpeg or shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise EncoderError("ffmpeg is required to concatenate segments")
+    temp_path = output_path + ".part"
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as listing:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            listing.write(f"file '{escaped}'\n")
+    try:
+        result = subprocess.run(
+            [ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', listing.name,
+             '-c', 'copy', '-movflags', '+faststart', '-f', 'mp4', temp_path],
+            stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise EncoderError(f"ffmpeg concat failed with exit code {result.returncode}: "
+                               f"{result.stderr.decode(errors='replace').strip()[-2000:]}")
+        os.replace(temp_path, output_path)
+    finally:
+        os.remove(listing.name)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
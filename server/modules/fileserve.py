@@ -0,0 +1,298 @@
+"""
+Streaming file responses with HTTP range and conditional request support.
+
+Bodies are produced by a generator that reads at most ``block_size`` bytes at
+a time (or handed to the server's ``wsgi.file_wrapper`` for whole files, which
+can use sendfile), so memory per viewer stays constant however large the
+requested span is.
+
+Supported:
+
+  Range      bytes=a-b, bytes=a-, bytes=-n and comma-separated multi-ranges
+             (answered as multipart/byteranges); unsatisfiable ranges get 416
+  If-Range   a stale validator downgrades the request to the full file
+  ETag       derived from mtime and size; If-None-Match / If-Modified-Since
+             answer 304
+
+Video players fetch the start of a file and the ``moov`` index (which may sit
+at the end of MP4 files) over and over while seeking. ``HeadCache`` keeps
+those regions of recently served files in memory.
+"""
+
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+
+from flask import Response
+from werkzeug.wsgi import wrap_file
+
+BLOCK_SIZE = 256 * 1024
+MAX_RANGES = 16  # more ranges than this are answered with the whole file
+RANGE_SPEC = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+
+class RangeNotSatisfiable(Exception):
+    """None of the requested ranges overlaps the file."""
+
+
+def parse_range(header, size):
+    """
+    Parses a Range header against a file of ``size`` bytes into a sorted
+    list of merged, inclusive ``(start, end)`` spans. Returns None when the
+    header is absent, malformed or asks for too many ranges (the whole file
+    is served then); raises RangeNotSatisfiable when no span overlaps the
+    file.
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+    spans = []
+    for spec in specs.split(','):
+        m = RANGE_SPEC.match(spec)
+        if not m or (not m.group(1) and not m.group(2)):
+            return None
+        first, last = m.group(1), m.group(2)
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            if last and int(last) < start:
+                return None
+        else:
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(0, size - length), size - 1
+        if start < size:
+            spans.append((start, end))
+    if len(spans) > MAX_RANGES:
+        return None
+    if not spans:
+        raise RangeNotSatisfiable()
+
+    spans.sort()
+    merged = [spans[0]]
+    for start, end in spans[1:]:
+        if start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def find_moov(f, size):
+    """
+    Returns ``(offset, length)`` of the top-level ``moov`` atom of an
+    ISO media file, or None.
+    """
+    position = 0
+    while position + 8 <= size:
+        f.seek(position)
+        header = f.read(16)
+        length = int.from_bytes(header[:4], 'big')
+        kind = header[4:8]
+        if length == 1 and len(header) == 16:
+            length = int.from_bytes(header[8:16], 'big')
+        elif length == 0:
+            length = size - position
+        if length < 8:
+            return None
+        if kind == b'moov':
+            return position, min(length, size - position)
+        position += length
+    return None
+
+
+class HeadCache(object):
+    """
+    LRU cache of the first ``head_bytes`` of files and, for MP4/MOV, of
+    their ``moov`` atom (up to ``moov_bytes``), bounded to ``max_bytes`` in
+    total. Entries are keyed on path and revalidated against mtime and size.
+    """
+
+    def __init__(self, max_bytes, head_bytes=1024 * 1024, moov_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.head_bytes = head_bytes
+        self.moov_bytes = moov_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # path -> (version, [(offset, bytes)], size in bytes)
+        self._lock = threading.Lock()
+
+    def regions(self, path, stat):
+        """
+        Cached ``(offset, bytes)`` regions of ``path``, loading them on
+        first use.
+        """
+        if self.max_bytes <= 0:
+            return []
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        regions = self._load(path, stat.st_size)
+        total = sum(len(data) for _, data in regions)
+        with self._lock:
+            self._entries[path] = (version, regions, total)
+            self._entries.move_to_end(path)
+            while sum(e[2] for e in self._entries.values()) > self.max_bytes and len(self._entries) > 1:
+                self._entries.popitem(last=False)
+        return regions
+
+    def _load(self, path, size):
+        with open(path, 'rb') as f:
+            head = f.read(min(self.head_bytes, size))
+            regions = [(0, head)]
+            if path.lower().endswith(('.mp4', '.mov', '.m4v')):
+                moov = find_moov(f, size)
+                if moov is not None and moov[0] + moov[1] > len(head) and moov[1] <= self.moov_bytes:
+                    offset = max(moov[0], len(head))
+                    f.seek(offset)
+                    regions.append((offset, f.read(moov[0] + moov[1] - offset)))
+        return regions
+
+    def discard(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(e[2] for e in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def iter_span(path, start, end, regions=(), block_size=BLOCK_SIZE):
+    """
+    Yields bytes ``start``..``end`` (inclusive) of ``path`` in blocks of at
+    most ``block_size``, taking whatever is covered by ``regions`` from
+    memory.
+    """
+    position = start
+    f = None
+    try:
+        while position <= end:
+            region = next(((o, d) for o, d in regions if o <= position < o + len(d)), None)
+            if region is not None:
+                offset, data = region
+                stop = min(end + 1, offset + len(data))
+                view = memoryview(data)
+                for i in range(position - offset, stop - offset, block_size):
+                    yield bytes(view[i:min(i + block_size, stop - offset)])
+                position = stop
+                continue
+            # Read up to the next cached region at most
+            stop = min([end + 1, position + block_size] + [o for o, _ in regions if o > position])
+            if f is None:
+                f = open(path, 'rb')
+            f.seek(position)
+            data = f.read(stop - position)
+            if not data:
+                break
+            yield data
+            position += len(data)
+    finally:
+        if f is not None:
+            f.close()
+
+
+class FileServer(object):
+    """
+    Builds streaming responses for files on disk. ``cache_control`` is sent
+    with every response; the default makes clients revalidate with the ETag,
+    which is only safe to relax for files never rewritten under their name.
+    """
+
+    def __init__(self, block_size=BLOCK_SIZE, head_cache=None, cache_control='no-cache'):
+        self.block_size = block_size
+        self.head_cache = head_cache
+        self.cache_control = cache_control
+
+    def response(self, request, path, mimetype):
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = f"{stat.st_mtime_ns:x}-{size:x}"
+
+        response = Response(mimetype=mimetype)
+        response.set_etag(etag)
+        response.last_modified = int(stat.st_mtime)
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Cache-Control'] = self.cache_control
+
+        if request.if_none_match:
+            if request.if_none_match.contains(etag):
+                return self._not_modified(response)
+        elif request.if_modified_since is not None and int(stat.st_mtime) <= request.if_modified_since.timestamp():
+            return self._not_modified(response)
+
+        try:
+            spans = parse_range(request.headers.get('Range'), size)
+        except RangeNotSatisfiable:
+            response.status_code = 416
+            response.headers['Content-Range'] = f"bytes */{size}"
+            response.set_data(b'')
+            return response
+        if spans is not None and not self._if_range_matches(request, etag, stat):
+            spans = None
+
+        regions = self.head_cache.regions(path, stat) if self.head_cache is not None and spans else ()
+
+        if spans is None:
+            response.response = wrap_file(request.environ, open(path, 'rb'), self.block_size)
+            response.direct_passthrough = True
+            response.content_length = size
+        elif len(spans) == 1:
+            start, end = spans[0]
+            response.status_code = 206
+            response.response = iter_span(path, start, end, regions, self.block_size)
+            response.direct_passthrough = True
+            response.headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+            response.content_length = end - start + 1
+        else:
+            boundary = uuid.uuid4().hex
+            parts = [(f"\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n"
+                      f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n").encode()
+                     for start, end in spans]
+            closing = f"\r\n--{boundary}--\r\n".encode()
+
+            def generate():
+                for part, (start, end) in zip(parts, spans):
+                    yield part
+                    yield from iter_span(path, start, end, regions, self.block_size)
+                yield closing
+
+            response.status_code = 206
+            response.response = generate()
+            response.direct_passthrough = True
+            response.content_type = f"multipart/byteranges; boundary={boundary}"
+            response.content_length = (sum(len(p) for p in parts) + len(closing)
+                                       + sum(end - start + 1 for start, end in spans))
+        return response
+
+    @staticmethod
+    def _if_range_matches(request, etag, stat):
+        if_range = request.if_range
+        if if_range.etag is not None:
+            return if_range.etag == etag
+        if if_range.date is not None:
+            return int(stat.st_mtime) <= if_range.date.timestamp()
+        return True
+
+    @staticmethod
+    def _not_modified(response):
+        response.status_code = 304
+        response.set_data(b'')
+        del response.headers['Content-Length']
+        return response
@@ -0,0 +1,146 @@
+"""
+Shared-memory frame transport between processes.
+
+Sending frames through a ``multiprocessing.Queue`` pickles them: a 1080p BGR
+frame is 6MB, copied into the pipe by the sender and out of it again by
+every receiver. FrameBus instead keeps a fixed pool of frame slots in one
+``multiprocessing.shared_memory`` block and only slot numbers travel over
+queues:
+
+  producer   ``slot = bus.acquire(refs=2)``, writes ``bus.frame(slot)`` in
+             place (e.g. ``cap.read(bus.frame(slot))``) and puts ``slot`` on
+             the queues of its two consumers
+  consumers  read ``bus.frame(slot)`` and call ``bus.release(slot)`` when
+             done; the slot is reused after the last release
+
+A slot can be passed on further (decode -> inference -> encode) with
+``retain`` before the holder releases it. Pixel data is never copied between
+processes. ``acquire`` blocks while every slot is in use, which bounds the
+pipeline like a bounded queue would.
+
+The bus is handed to worker processes as a ``Process`` argument (or pool
+initializer argument); its queue and counters can only be shared that way.
+The creating process owns the shared memory and calls ``unlink()`` once all
+workers are done.
+"""
+
+import multiprocessing
+import queue
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class FrameBus(object):
+    """
+    ``slots`` frames of ``shape`` and ``dtype`` in shared memory, with a
+    reference count per slot.
+    """
+
+    def __init__(self, slots, shape, dtype=np.uint8, ctx=None):
+        if slots < 1:
+            raise ValueError("slots must be at least 1")
+        ctx = ctx or multiprocessing.get_context()
+        self.slots = int(slots)
+        self.shape = tuple(int(s) for s in shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slots * self.frame_bytes)
+        self._refs = ctx.Array('i', self.slots)
+        self._free = ctx.Queue()
+        for slot in range(self.slots):
+            self._free.put(slot)
+        self._owner = True
+
+    def __getstate__(self):
+        return {"name": self._shm.name, "slots": self.slots, "shape": self.shape, "dtype": self.dtype.str,
+                "refs": self._refs, "free": self._free}
+
+    def __setstate__(self, state):
+        self.slots = state["slots"]
+        self.shape = state["shape"]
+        self.dtype = np.dtype(state["dtype"])
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._shm = shared_memory.SharedMemory(name=state["name"])
+        self._refs = state["refs"]
+        self._free = state["free"]
+        self._owner = False
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def acquire(self, refs=1, timeout=None):
+        """
+        Takes a free slot, held ``refs`` times (one per consumer it goes to).
+        Returns the slot number, or None if none became free within
+        ``timeout`` seconds. The frame's previous contents are undefined.
+        """
+        if refs < 1:
+            raise ValueError("refs must be at least 1")
+        try:
+            slot = self._free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._refs.get_lock():
+            self._refs[slot] = refs
+        return slot
+
+    def frame(self, slot):
+        """
+        The ndarray over ``slot``'s shared memory. Views must be dropped
+        before ``close()``.
+        """
+        if not 0 <= slot < self.slots:
+            raise IndexError(f"No slot {slot} on a bus of {self.slots}")
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf, offset=slot * self.frame_bytes)
+
+    def put(self, image, refs=1, timeout=None):
+        """
+        Copies ``image`` into a free slot and returns the slot number (None
+        on timeout), for producers that cannot decode in place.
+        """
+        slot = self.acquire(refs, timeout)
+        if slot is not None:
+            np.copyto(self.frame(slot), image)
+        return slot
+
+    def retain(self, slot, count=1):
+        """
+        Adds ``count`` references, e.g. before passing a held slot on to
+        more consumers.
+        """
+        with self._refs.get_lock():
+            if self._refs[slot] <= 0:
+                raise ValueError(f"Slot {slot} is not in use")
+            self._refs[slot] += count
+
+    def release(self, slot):
+        """
+        Drops one reference; the last one returns the slot to the pool.
+        """
+        with self._refs.get_lock():
+            refs = self._refs[slot]
+            if refs <= 0:
+                raise ValueError(f"Slot {slot} released more often than acquired")
+            self._refs[slot] = refs - 1
+        if refs == 1:
+            self._free.put(slot)
+
+    def in_use(self):
+        with self._refs.get_lock():
+            return sum(1 for refs in self._refs if refs > 0)
+
+    def close(self):
+        """
+        Detaches this process from the shared memory.
+        """
+        self._shm.close()
+
+    def unlink(self):
+        """
+        Closes and frees the shared memory (creating process only).
+        """
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
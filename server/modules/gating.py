@@ -0,0 +1,88 @@
+"""
+Pre-inference motion gate.
+
+Decides per frame whether the detector needs to run. A downscaled grayscale
+thumbnail of each frame is compared with the thumbnail of the last frame that
+was actually sent to the detector; inference is skipped while the fraction
+of thumbnail pixels that changed stays below ``motion_threshold``. On skipped frames the
+caller reuses the previous detections and only coasts the tracker forward
+with its Kalman predictions.
+"""
+
+import cv2
+
+
+class MotionGate(object):
+    """
+    Per-stream gate with three knobs:
+
+      stride            - minimum number of frames between two inferences
+      motion_threshold  - fraction (0..1) of thumbnail pixels whose gray
+                          level changed by more than ``pixel_threshold``
+                          above which a frame is sent to the detector
+      refresh_interval  - inference is forced at least this often, so slow
+                          scene changes and new objects are never missed for
+                          long
+
+    ``stride=1, motion_threshold=0`` runs the detector on every frame.
+    """
+
+    def __init__(self, stride=1, motion_threshold=0.005, refresh_interval=15, pixel_threshold=25,
+                 thumb_width=160):
+        self.stride = max(1, int(stride))
+        self.motion_threshold = motion_threshold
+        self.pixel_threshold = pixel_threshold
+        self.refresh_interval = max(1, int(refresh_interval))
+        self.thumb_width = thumb_width
+        self.reset()
+
+    def reset(self):
+        self._reference = None
+        self._since_inference = 0
+        self.frames = 0
+        self.inferences = 0
+        self.last_score = 0.0
+
+    def thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        thumb_height = max(1, int(round(height * self.thumb_width / float(width))))
+        small = cv2.resize(frame, (self.thumb_width, thumb_height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def motion_score(self, thumb):
+        if self._reference is None or self._reference.shape != thumb.shape:
+            return 1.0
+        changed = cv2.absdiff(thumb, self._reference) > self.pixel_threshold
+        return float(changed.mean())
+
+    def should_infer(self, frame):
+        """
+        Returns True if the detector should run on ``frame``.
+        """
+        self.frames += 1
+        self._since_inference += 1
+        thumb = self.thumbnail(frame)
+
+        if self._reference is None or self._since_inference >= self.refresh_interval:
+            infer = True
+            self.last_score = self.motion_score(thumb)
+        elif self._since_inference < self.stride:
+            infer = False
+        else:
+            self.last_score = self.motion_score(thumb)
+            infer = self.last_score >= self.motion_threshold
+
+        if infer:
+            self._reference = thumb
+            self._since_inference = 0
+            self.inferences += 1
+        return infer
+
+    @property
+    def skip_ratio(self):
+        if self.frames == 0:
+            return 0.0
+        return 1.0 - self.inferences / float(self.frames)
+
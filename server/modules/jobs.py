@@ -0,0 +1,189 @@
+"""
+Background job queue for video processing.
+
+Jobs are executed by a bounded thread pool so that HTTP handlers can return
+immediately with a job id instead of holding a worker for the whole run.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+
+
+class QueueFull(Exception):
+    """Raised by JobManager.submit when no more jobs can be accepted."""
+
+
+class Job(object):
+    """
+    State of a single processing job, shared between the worker thread and
+    the HTTP handlers.
+    """
+
+    def __init__(self, filename, **params):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.params = params
+        self.status = QUEUED
+        self.progress = 0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def check_cancelled(self):
+        """
+        Called periodically from the processing loop; aborts the job if a
+        cancel request has arrived.
+        """
+        if self._cancel_event.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "progress": self.progress,
+            "message": self.message,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager(object):
+    """
+    Runs jobs on a fixed-size worker pool.
+
+    At most ``max_workers`` jobs run concurrently and at most ``max_pending``
+    further jobs wait in the queue; ``submit`` raises QueueFull beyond that.
+    Only the ``max_history`` most recent finished jobs are retained.
+    """
+
+    def __init__(self, max_workers=2, max_pending=16, max_history=256):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, filename, on_finish=None, **params):
+        """
+        Queues ``fn(job)`` for execution and returns the new Job.
+
+        ``fn`` must return a ``(success, message)`` tuple like
+        process_video_with_yolo. ``on_finish(job)`` is called from the worker
+        thread once the job reaches a final state.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull("Too many jobs in progress, try again later")
+
+        job = Job(filename, **params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn, on_finish)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """
+        Requests cancellation. Queued jobs are cancelled before they start,
+        running jobs stop at their next check_cancelled call.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job.status not in FINISHED_STATES:
+            job.cancel()
+        return job
+
+    def queue_depth(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    def shutdown(self, wait=True):
+        for job in self.list():
+            job.cancel()
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job, fn, on_finish):
+        try:
+            if job.cancelled:
+                job.status = CANCELLED
+                job.message = "Cancelled before start"
+                return
+
+            job.status = RUNNING
+            job.started_at = time.time()
+            try:
+                success, message = fn(job)
+            except JobCancelled as e:
+                job.status = CANCELLED
+                job.message = str(e)
+            except Exception as e:
+                logger.error(f"Job {job.id} crashed: {str(e)}", exc_info=True)
+                job.status = FAILED
+                job.error = str(e)
+            else:
+                if job.cancelled:
+                    job.status = CANCELLED
+                    job.message = message
+                elif success:
+                    job.status = COMPLETED
+                    job.progress = 100
+                    job.message = message
+                else:
+                    job.status = FAILED
+                    job.error = message
+        finally:
+            job.finished_at = time.time()
+            self._slots.release()
+            if on_finish is not None:
+                try:
+                    on_finish(job)
+                except Exception as e:
+                    logger.error(f"Job {job.id} finish callback failed: {str(e)}", exc_info=True)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
@@ -0,0 +1,329 @@
+"""
+Stage timing and Prometheus metrics.
+
+Every processing path times its stages into a ``Profile``:
+
+  decode, gate, preprocess             decode thread of the pipeline
+  inference                            inference thread (one sample per batch)
+  postprocess, track_predict,          consumer thread (the job worker or the
+  track_associate, track_update,       camera scheduler)
+  record, annotate, encode
+  ffmpeg                               waiting for ffmpeg to finish the output
+                                       (encoder flush, segment concat)
+
+A profile feeds the process-wide ``Registry`` (cumulative histograms for
+Prometheus, plus a rolling window of recent samples for quantiles) and keeps
+its own summary, which jobs attach to their result. Since the pipeline's
+threads run concurrently, the thread with the most busy time is the one that
+caps throughput; the summary names it as the ``bottleneck``.
+
+``Registry.render()`` produces the Prometheus text exposition format; gauges
+are callbacks evaluated at scrape time (queue depths, per-stream FPS, ...).
+"""
+
+import math
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+
+# Prometheus bucket bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Which pipeline thread each stage runs on
+STAGE_THREADS = {
+    "decode": "decode", "gate": "decode", "preprocess": "decode",
+    "inference": "inference",
+    "postprocess": "consumer", "track_predict": "consumer", "track_associate": "consumer",
+    "track_update": "consumer", "record": "consumer", "annotate": "consumer", "encode": "consumer",
+    "ffmpeg": "consumer",
+}
+
+# Per-job quantiles come from log-spaced buckets (~10% wide) from 1us to ~100s
+_LOG_BASE = 1.1
+_LOG_MIN = 1e-6
+_LOG_BUCKETS = int(math.log(1e8, _LOG_BASE)) + 2
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=None):
+    items = list(labels) + list(extra or ())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram(object):
+    """
+    Cumulative histogram over ``buckets`` plus the last ``window`` samples
+    for rolling quantiles.
+    """
+
+    def __init__(self, buckets=BUCKETS, window=2048):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+            self.recent.append(value)
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)):
+        with self._lock:
+            samples = sorted(self.recent)
+        if not samples:
+            return {q: 0.0 for q in qs}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in qs}
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Counter(object):
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Registry(object):
+    """
+    Named metric families with label sets, rendered for Prometheus.
+    """
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self._families = {}  # name -> (type, help, {labels: metric} or callback)
+        self._lock = threading.Lock()
+        self.profiles = weakref.WeakSet()  # running profiles, for queue gauges
+
+    def _metric(self, kind, name, help, labels, factory):
+        labels = tuple(sorted((labels or {}).items()))
+        with self._lock:
+            family = self._families.setdefault(name, (kind, help, {}))
+            metric = family[2].get(labels)
+            if metric is None:
+                metric = family[2][labels] = factory()
+        return metric
+
+    def histogram(self, name, help="", labels=None, buckets=BUCKETS):
+        return self._metric("histogram", name, help, labels, lambda: Histogram(buckets))
+
+    def counter(self, name, help="", labels=None):
+        return self._metric("counter", name, help, labels, Counter)
+
+    def gauge(self, name, help, callback):
+        """
+        Registers ``callback()``, returning a number or a list of
+        ``(labels dict, number)``, to be evaluated at every scrape.
+        """
+        with self._lock:
+            self._families[name] = ("gauge", help, callback)
+
+    def profile(self, name=None, **labels):
+        """
+        A Profile whose stages feed this registry with ``labels``; ``name``
+        identifies it in the queue depth gauges.
+        """
+        profile = Profile(self, labels, name)
+        self.profiles.add(profile)
+        return profile
+
+    def queue_depths(self):
+        """
+        ``[({"profile": name, "queue": queue name}, depth)]`` of live profiles.
+        """
+        return [({"profile": profile.name or "", "queue": queue_name}, q.qsize())
+                for profile in list(self.profiles) for queue_name, q in list(profile.queues.items())]
+
+    def render(self):
+        with self._lock:
+            families = sorted(self._families.items())
+        lines = []
+        for name, (kind, help, metrics) in families:
+            full = self.prefix + name
+            if kind == "gauge":
+                try:
+                    values = metrics()
+                except Exception as e:
+                    lines.append(f"# {full} failed: {_escape(e)}")
+                    continue
+                if values is None:
+                    continue
+                if not isinstance(values, list):
+                    values = [({}, values)]
+            if kind != "gauge" and not metrics:
+                continue
+            lines.append(f"# HELP {full} {help}")
+            lines.append(f"# TYPE {full} {kind}")
+            if kind == "gauge":
+                for labels, value in values:
+                    lines.append(f"{full}{_labels(sorted(labels.items()))} {_number(value)}")
+            elif kind == "counter":
+                for labels, counter in sorted(metrics.items()):
+                    lines.append(f"{full}{_labels(labels)} {_number(counter.value)}")
+            else:
+                recent = []
+                for labels, histogram in sorted(metrics.items()):
+                    counts, total, count = histogram.snapshot()
+                    cumulative = 0
+                    for bound, bucket in zip(histogram.buckets + (math.inf,), counts):
+                        cumulative += bucket
+                        lines.append(f"{full}_bucket{_labels(labels, [('le', _number(bound))])} {cumulative}")
+                    lines.append(f"{full}_sum{_labels(labels)} {_number(total)}")
+                    lines.append(f"{full}_count{_labels(labels)} {count}")
+                    for q, value in histogram.quantiles().items():
+                        recent.append(f"{full}_recent{_labels(labels, [('quantile', q)])} {_number(value)}")
+                # Quantiles of the recent window are a family of their own
+                lines.append(f"# HELP {full}_recent {help} (quantiles of the last samples)")
+                lines.append(f"# TYPE {full}_recent gauge")
+                lines.extend(recent)
+        return "\n".join(lines) + "\n"
+
+
+class Profile(object):
+    """
+    Stage timings of one job (or of the camera scheduler). ``time(stage)``
+    and ``observe(stage, seconds)`` are safe to call from several threads.
+    ``queues`` maps names to queues whose depth is exported while the
+    profile is alive.
+    """
+
+    def __init__(self, registry=None, labels=None, name=None):
+        self.registry = registry
+        self.labels = dict(labels or {})
+        self.name = name
+        self.queues = {}
+        self.frames = 0
+        self.started = time.monotonic()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = {"count": 0, "total": 0.0, "max": 0.0,
+                                               "buckets": [0] * _LOG_BUCKETS}
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+            index = 0 if seconds <= _LOG_MIN else min(_LOG_BUCKETS - 1, int(math.log(seconds / _LOG_MIN, _LOG_BASE)) + 1)
+            stats["buckets"][index] += 1
+        if self.registry is not None:
+            self.registry.histogram("stage_seconds", "Time spent per pipeline stage",
+                                    dict(self.labels, stage=stage)).observe(seconds)
+
+    def export(self):
+        """
+        Raw stage statistics, picklable, for ``merge`` into another profile
+        (e.g. from a worker process).
+        """
+        with self._lock:
+            return {name: dict(stats, buckets=list(stats["buckets"])) for name, stats in self._stages.items()}
+
+    def merge(self, stages):
+        """
+        Adds the output of another profile's ``export`` to this profile's
+        summary. The registry's histograms are not updated.
+        """
+        with self._lock:
+            for name, other in stages.items():
+                stats = self._stages.get(name)
+                if stats is None:
+                    self._stages[name] = dict(other, buckets=list(other["buckets"]))
+                    continue
+                stats["count"] += other["count"]
+                stats["total"] += other["total"]
+                stats["max"] = max(stats["max"], other["max"])
+                stats["buckets"] = [a + b for a, b in zip(stats["buckets"], other["buckets"])]
+
+    def frame(self, count=1):
+        self.frames += count
+        if self.registry is not None:
+            self.registry.counter("frames_total", "Frames processed", self.labels).inc(count)
+
+    @staticmethod
+    def _quantile(buckets, count, q):
+        target = q * count
+        seen = 0
+        for index, bucket in enumerate(buckets):
+            seen += bucket
+            if seen >= target and bucket:
+                return 0.0 if index == 0 else _LOG_MIN * _LOG_BASE ** index
+        return 0.0
+
+    def summary(self):
+        """
+        Per-stage count, total/mean/p50/p95/max in milliseconds, busy time
+        per pipeline thread, the busiest thread and the overall frame rate.
+        """
+        stages = self.export()
+        elapsed = time.monotonic() - self.started
+        result = {}
+        threads = {}
+        for name, stats in sorted(stages.items()):
+            count = stats["count"]
+            result[name] = {
+                "count": count,
+                "total_ms": round(stats["total"] * 1000, 3),
+                "mean_ms": round(stats["total"] * 1000 / count, 4) if count else 0.0,
+                "p50_ms": round(self._quantile(stats["buckets"], count, 0.5) * 1000, 4),
+                "p95_ms": round(self._quantile(stats["buckets"], count, 0.95) * 1000, 4),
+                "max_ms": round(stats["max"] * 1000, 4),
+            }
+            thread = STAGE_THREADS.get(name, "other")
+            threads[thread] = threads.get(thread, 0.0) + stats["total"]
+        return {
+            "stages": result,
+            "threads_ms": {name: round(total * 1000, 3) for name, total in sorted(threads.items())},
+            "bottleneck": max(threads, key=threads.get) if threads else None,
+            "frames": self.frames,
+            "fps": round(self.frames / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+@contextmanager
+def timed(profile, stage):
+    """
+    ``profile.time(stage)``, or nothing when ``profile`` is None.
+    """
+    if profile is None:
+        yield
+        return
+    with profile.time(stage):
+        yield
@@ -0,0 +1,227 @@
+"""
+Pipelined, batched inference over a video capture.
+
+Three stages are joined by bounded queues:
+
+  decode    - reader thread pulling frames from the capture
+  inference - thread that groups frames into batches of up to ``batch_size``
+              and flushes a partial batch once ``max_latency`` seconds have
+              passed since its first frame
+  consumer  - the calling thread, which receives ``(index, frame, result)``
+              strictly in frame order and does tracking, annotation and
+              encoding
+
+Because the consumer sees frames in order, tracker updates happen exactly as
+in the sequential loop.
+
+An optional ``gate`` (e.g. MotionGate.should_infer) is evaluated in the decode
+stage; frames it rejects bypass the detector and reach the consumer with a
+``None`` result. An optional ``preprocess`` (e.g. Preprocessor.prepare) also
+runs in the decode stage and produces the image handed to ``infer_batch``;
+the consumer still receives the original frame.
+
+An optional ``profile`` (metrics.Profile) times the decode, gate, preprocess
+and inference stages and gets the two queues for depth reporting.
+
+With ``recycle_frames`` the decode stage reads into buffers from a
+decoder.FrameRing instead of allocating every frame: a frame's buffer is
+reused once the consumer asks for the next one, so a consumer that keeps a
+frame (or a view of it) beyond its own iteration must copy it. Captures
+without in-place reads (see decoder.read_frame) still allocate.
+"""
+
+import queue
+import threading
+import time
+
+from modules.decoder import FrameRing, read_frame
+from modules.metrics import timed
+
+_END = object()
+
+
+class PipelineError(Exception):
+    """Wraps an exception raised in the decode or inference stage."""
+
+
+class InferencePipeline(object):
+    """
+    Overlaps decode, batched inference and the caller's per-frame work.
+
+    ``infer_batch`` receives a list of frames and must return one result per
+    frame, in the same order.
+    """
+
+    def __init__(self, infer_batch, batch_size=8, max_latency=0.05, queue_size=32, gate=None,
+                 preprocess=None, profile=None, recycle_frames=False):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.infer_batch = infer_batch
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.queue_size = max(queue_size, batch_size)
+        self.gate = gate
+        self.preprocess = preprocess
+        self.profile = profile
+        self.recycle_frames = recycle_frames
+
+    def run(self, cap):
+        """
+        Generator yielding ``(index, frame, result)`` for every frame read
+        from ``cap`` (anything with a ``read()`` returning ``(ok, frame)``).
+
+        Closing the generator early (break, exception, cancellation) stops
+        the worker threads.
+        """
+        decoded = queue.Queue(maxsize=self.queue_size)
+        inferred = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors = []
+        # Frames can be in both queues, in a batch being inferred, with the
+        # consumer and being decoded
+        ring = FrameRing(3 * self.queue_size + 2) if self.recycle_frames else None
+        if self.profile is not None:
+            self.profile.queues.update(decoded=decoded, inferred=inferred)
+
+        decoder = threading.Thread(
+            target=self._decode, args=(cap, decoded, stop, errors, ring),
+            name="pipeline-decode", daemon=True)
+        inferer = threading.Thread(
+            target=self._infer, args=(decoded, inferred, stop, errors),
+            name="pipeline-infer", daemon=True)
+        decoder.start()
+        inferer.start()
+
+        try:
+            while True:
+                item = inferred.get()
+                if item is _END:
+                    break
+                yield item
+                if ring is not None:
+                    ring.release(item[1])
+            if errors:
+                raise PipelineError(str(errors[0])) from errors[0]
+        finally:
+            stop.set()
+            # Unblock any stage stuck on a full queue, and a capture blocked
+            # waiting for input (captures that can block expose interrupt())
+            _drain(decoded)
+            _drain(inferred)
+            interrupt = getattr(cap, 'interrupt', None)
+            if interrupt is not None and decoder.is_alive():
+                interrupt()
+            decoder.join()
+            inferer.join()
+            if self.profile is not None:
+                self.profile.queues.clear()
+
+    def _decode(self, cap, decoded, stop, errors, ring=None):
+        try:
+            index = 0
+            profile = self.profile
+            shape = None
+            while not stop.is_set():
+                buffer = None
+                if ring is not None and shape is not None:
+                    while buffer is None and not stop.is_set():
+                        buffer = ring.acquire(shape, timeout=0.1)
+                    if buffer is None:
+                        return
+                with timed(profile, "decode"):
+                    success, frame = read_frame(cap, buffer)
+                if ring is not None and frame is not buffer:
+                    # Not read in place (end of stream, size change)
+                    ring.release(buffer)
+                if not success:
+                    break
+                shape = frame.shape
+                # The detector input, or None when the gate skips this frame
+                image = None
+                if self.gate is not None:
+                    with timed(profile, "gate"):
+                        keep = self.gate(frame)
+                else:
+                    keep = True
+                if keep:
+                    if self.preprocess is None:
+                        image = frame
+                    else:
+                        with timed(profile, "preprocess"):
+                            image = self.preprocess(frame)
+                if not _put(decoded, (index, frame, image), stop):
+                    return
+                index += 1
+        except Exception as e:
+            errors.append(e)
+        finally:
+            _put(decoded, _END, stop)
+
+    def _infer(self, decoded, inferred, stop, errors):
+        try:
+            finished = False
+            while not finished and not stop.is_set():
+                item = _get(decoded, stop)
+                if item is _END:
+                    break
+                batch = [item]
+                pending = int(item[2] is not None)
+                deadline = time.monotonic() + self.max_latency
+                while pending < self.batch_size and len(batch) < self.queue_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = decoded.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is _END:
+                        finished = True
+                        break
+                    batch.append(item)
+                    pending += int(item[2] is not None)
+
+                images = [image for _, _, image in batch if image is not None]
+                output = []
+                if images:
+                    with timed(self.profile, "inference"):
+                        output = self.infer_batch(images)
+                results = iter(output)
+                for index, frame, image in batch:
+                    infer = image is not None
+                    result = next(results, None) if infer else None
+                    if infer and result is None:
+                        raise PipelineError(f"infer_batch returned fewer results than {len(images)} frames")
+                    if not _put(inferred, (index, frame, result), stop):
+                        return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            _put(inferred, _END, stop)
+
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END
+
+
+def _drain(q):
+    try:
+        while True:
+            q.get_nowait()
+    except queue.Empty:
+        pass
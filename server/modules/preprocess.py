@@ -0,0 +1,204 @@
+"""
+Resolution-aware preprocessing for the detector.
+
+A Preprocessor turns a full-resolution frame into the (much smaller) image the
+detector actually sees:
+
+  1. crop to the bounding rectangle of the region of interest (ROI) polygons,
+  2. letterbox the crop so its longer side is ``imgsz``, keeping the aspect
+     ratio and padding the short side with grey up to the detector stride
+     (the same convention as ultralytics' rectangular inference),
+  3. paint everything outside the ROI polygons grey, so the detector never
+     spends effort on sky, buildings or the roadside.
+
+The transform only depends on the frame size, so it is computed once per
+resolution and cached. ``project`` maps boxes predicted on the detector input
+back to full-resolution pixel coordinates with the exact inverse of that
+transform; tracking and annotation keep working on the original frame.
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+PAD_VALUE = 114
+STRIDE = 32
+
+
+def parse_imgsz(value):
+    """
+    Validates an inference size from a request; None/"" means the model
+    default. Sizes are rounded up to the detector stride.
+    """
+    if value is None or value == "":
+        return None
+    imgsz = int(value)
+    if imgsz < STRIDE or imgsz > 4096:
+        raise ValueError(f"imgsz must be between {STRIDE} and 4096")
+    return -(-imgsz // STRIDE) * STRIDE
+
+
+def parse_roi(value):
+    """
+    Validates ROI polygons from a request: a list of polygons, each a list of
+    at least three ``[x, y]`` points in original frame pixels. A single
+    polygon may be given without the outer list. Returns a list of
+    ``(K, 2)`` int32 arrays, or None for no ROI.
+    """
+    if value is None or value == [] or value == "":
+        return None
+    if not isinstance(value, (list, tuple)) or not value:
+        raise ValueError("ROI must be a list of polygons")
+    polygons = value
+    if isinstance(value[0], (list, tuple)) and value[0] and not isinstance(value[0][0], (list, tuple)):
+        polygons = [value]
+    parsed = []
+    for polygon in polygons:
+        points = np.asarray(polygon, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+            raise ValueError("Each ROI polygon needs at least three [x, y] points")
+        if not np.isfinite(points).all() or (points < 0).any():
+            raise ValueError("ROI coordinates must be non-negative numbers")
+        parsed.append(np.round(points).astype(np.int32))
+    return parsed
+
+
+class Transform(object):
+    """
+    Mapping between one frame resolution and the detector input:
+    ``input = (original - offset) * scale + pad``.
+    """
+
+    def __init__(self, frame_shape, crop, scale, pad, resized, input_shape, mask):
+        self.frame_shape = frame_shape
+        self.crop = crop  # x0, y0, x1, y1 in the original frame
+        self.scale = scale  # sx, sy
+        self.pad = pad  # px, py
+        self.resized = resized  # width, height of the crop after scaling
+        self.input_shape = input_shape
+        self.mask = mask  # bool (H, W) of the detector input, None if no ROI
+
+    def project(self, xyxy):
+        """
+        Maps ``(N, 4)`` boxes on the detector input to original frame
+        coordinates, clipped to the frame. Returns a new float array.
+        """
+        boxes = np.array(xyxy, dtype=np.float64).reshape(-1, 4)
+        if len(boxes) == 0:
+            return boxes
+        x0, y0 = self.crop[:2]
+        sx, sy = self.scale
+        px, py = self.pad
+        boxes[:, 0::2] = (boxes[:, 0::2] - px) / sx + x0
+        boxes[:, 1::2] = (boxes[:, 1::2] - py) / sy + y0
+        height, width = self.frame_shape[:2]
+        np.clip(boxes[:, 0::2], 0, width, out=boxes[:, 0::2])
+        np.clip(boxes[:, 1::2], 0, height, out=boxes[:, 1::2])
+        return boxes
+
+
+class Preprocessor(object):
+    """
+    Per job/camera preprocessing settings.
+
+      imgsz - longer side of the detector input; None keeps the full frame
+              (the model then letterboxes it to its default size)
+      roi   - polygons (see ``parse_roi``) outside which frames are masked
+    """
+
+    def __init__(self, imgsz=None, roi=None):
+        self.imgsz = imgsz
+        self.roi = roi
+        self._transforms = {}
+        self._lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.imgsz is not None or self.roi is not None
+
+    def roi_points(self):
+        if self.roi is None:
+            return None
+        return [polygon.tolist() for polygon in self.roi]
+
+    def transform(self, frame_shape):
+        key = tuple(frame_shape[:2])
+        transform = self._transforms.get(key)
+        if transform is None:
+            with self._lock:
+                transform = self._transforms.get(key)
+                if transform is None:
+                    transform = self._build(key)
+                    self._transforms[key] = transform
+        return transform
+
+    def prepare(self, frame):
+        """
+        Returns the detector input for ``frame``; the frame itself when no
+        resize or ROI is configured.
+        """
+        if not self.active:
+            return frame
+        t = self.transform(frame.shape)
+        x0, y0, x1, y1 = t.crop
+        image = frame[y0:y1, x0:x1]
+
+        if self.imgsz is not None:
+            new_w, new_h = t.resized
+            interpolation = cv2.INTER_AREA if new_w < image.shape[1] else cv2.INTER_LINEAR
+            canvas = np.full(t.input_shape + frame.shape[2:], PAD_VALUE, dtype=frame.dtype)
+            px, py = t.pad
+            canvas[py:py + new_h, px:px + new_w] = cv2.resize(image, (new_w, new_h), interpolation=interpolation)
+            image = canvas
+        elif t.mask is not None:
+            image = image.copy()
+
+        if t.mask is not None:
+            image[~t.mask] = PAD_VALUE
+        return image
+
+    def project(self, xyxy, frame_shape):
+        if not self.active:
+            return np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+        return self.transform(frame_shape).project(xyxy)
+
+    def _build(self, frame_shape):
+        height, width = frame_shape
+        if self.roi is not None:
+            points = np.concatenate(self.roi)
+            x0, y0 = np.clip(points.min(axis=0), 0, [width - 1, height - 1])
+            x1, y1 = np.clip(points.max(axis=0) + 1, 1, [width, height])
+            crop = (int(x0), int(y0), int(x1), int(y1))
+        else:
+            crop = (0, 0, width, height)
+        crop_w, crop_h = crop[2] - crop[0], crop[3] - crop[1]
+
+        if self.imgsz is not None:
+            ratio = min(self.imgsz / float(crop_w), self.imgsz / float(crop_h))
+            new_w = max(1, int(round(crop_w * ratio)))
+            new_h = max(1, int(round(crop_h * ratio)))
+            # Per-axis scale from the rounded size keeps the inverse exact
+            scale = (new_w / float(crop_w), new_h / float(crop_h))
+            input_shape = (-(-new_h // STRIDE) * STRIDE, -(-new_w // STRIDE) * STRIDE)
+            pad = ((input_shape[1] - new_w) // 2, (input_shape[0] - new_h) // 2)
+        else:
+            new_w, new_h = crop_w, crop_h
+            scale, pad, input_shape = (1.0, 1.0), (0, 0), (crop_h, crop_w)
+
+        mask = None
+        if self.roi is not None:
+            mask = np.zeros(input_shape, dtype=np.uint8)
+            # Polygons are drawn directly in input coordinates (fixed point for
+            # sub-pixel accuracy after scaling)
+            shift = 4
+            polygons = []
+            for polygon in self.roi:
+                p = polygon.astype(np.float64)
+                p[:, 0] = (p[:, 0] - crop[0]) * scale[0] + pad[0]
+                p[:, 1] = (p[:, 1] - crop[1]) * scale[1] + pad[1]
+                polygons.append(np.round(p * (1 << shift)).astype(np.int32))
+            cv2.fillPoly(mask, polygons, 1, shift=shift)
+            mask = mask.astype(bool)
+
+        return Transform(frame_shape, crop, scale, pad, (new_w, new_h), input_shape, mask)
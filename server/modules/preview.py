@@ -0,0 +1,250 @@
+"""
+Live MJPEG preview of running jobs and camera streams.
+
+Processing loops ``publish`` frames into a PreviewChannel; viewers read a
+``multipart/x-mixed-replace`` stream of JPEGs from it. Nothing in the
+publishing path waits for viewers:
+
+  publish    a no-op while nobody watches; otherwise at most one frame copy
+             per preview interval (the fastest viewer's frame rate)
+  encoder    one thread per watched channel draws overlays and JPEG-encodes
+             each frame once per (quality, width) profile, however many
+             viewers share that profile
+  viewers    each takes the newest encoded frame of its profile at its own
+             frame rate; a slow client simply skips the frames published
+             while it was still receiving an earlier one
+
+Viewers pick ``fps``, ``quality`` and ``width``; quality and width are
+snapped to a few levels so that viewers share encodes.
+"""
+
+import itertools
+import logging
+import threading
+import time
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+QUALITY_LEVELS = (50, 70, 90)
+WIDTH_LEVELS = (320, 480, 640, 960, 1280)  # 0 = source width
+BOUNDARY = "frame"
+
+
+def snap(value, levels):
+    return min(levels, key=lambda level: abs(level - value))
+
+
+class PreviewClosed(Exception):
+    """The channel was closed (job finished, camera removed)."""
+
+
+class PreviewChannel(object):
+    """
+    Latest frame of one job or stream and its encoded JPEGs. ``annotate(img,
+    detections, tracks)`` draws overlays on published frames that come with
+    detections/tracks; it runs on the encoder thread.
+    """
+
+    def __init__(self, name, annotate=None, max_fps=15, max_viewers=16):
+        self.name = name
+        self.annotate = annotate
+        self.max_fps = max_fps
+        self.max_viewers = max_viewers
+        self.closed = False
+        self.published = 0
+        self.encoded = 0
+        self._cond = threading.Condition()
+        self._frame = None  # (seq, frame, detections, tracks)
+        self._encoded = {}  # profile -> (seq, jpeg)
+        self._viewers = {}  # viewer id -> {"profile", "interval", "due"}
+        self._ids = itertools.count(1)
+        self._interval = None  # seconds between accepted frames, None while unwatched
+        self._last_publish = 0.0
+        self._thread = None
+
+    @property
+    def viewers(self):
+        return len(self._viewers)
+
+    def publish(self, frame, detections=None, tracks=None):
+        """
+        Offers a frame from the processing loop. Returns True if it was
+        taken. Never blocks on viewers or encoding.
+        """
+        interval = self._interval
+        if interval is None or self.closed:
+            return False
+        now = time.monotonic()
+        if now - self._last_publish < interval:
+            return False
+        self._last_publish = now
+        # The caller may reuse or keep drawing on its buffer
+        frame = frame.copy()
+        with self._cond:
+            self.published += 1
+            self._frame = (self.published, frame, detections, tracks)
+            self._cond.notify_all()
+        return True
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def stream(self, fps=10, quality=70, width=640, timeout=None):
+        """
+        Generator of multipart MJPEG parts for one viewer. Ends when the
+        channel closes or, with ``timeout``, when no frame arrives for that
+        many seconds. Raises PreviewClosed/OverflowError before the first part
+        if the channel is closed/full.
+        """
+        fps = max(0.1, min(float(fps), self.max_fps))
+        profile = (snap(quality, QUALITY_LEVELS), 0 if not width else snap(width, WIDTH_LEVELS))
+        viewer_id = self._attach(profile, 1.0 / fps)
+        return self._serve(viewer_id, profile, timeout)
+
+    def _serve(self, viewer_id, profile, timeout):
+        sent = 0
+        try:
+            while True:
+                with self._cond:
+                    waited = 0.0
+                    while not self.closed and self._encoded.get(profile, (0,))[0] <= sent:
+                        self._cond.wait(1.0)
+                        waited += 1.0
+                        if timeout is not None and waited >= timeout:
+                            return
+                    if self.closed:
+                        return
+                    sent, jpeg = self._encoded[profile]
+                    viewer = self._viewers[viewer_id]
+                    viewer["due"] = time.monotonic() + viewer["interval"]
+                # Blocks while a slow client drains the socket; frames
+                # published meanwhile are simply skipped
+                yield (f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                       f"Content-Length: {len(jpeg)}\r\n\r\n").encode() + jpeg + b"\r\n"
+                delay = viewer["due"] - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        finally:
+            self._detach(viewer_id)
+
+    def _attach(self, profile, interval):
+        with self._cond:
+            if self.closed:
+                raise PreviewClosed(f"Preview {self.name} is closed")
+            if len(self._viewers) >= self.max_viewers:
+                raise OverflowError(f"Preview {self.name} has too many viewers")
+            viewer_id = next(self._ids)
+            self._viewers[viewer_id] = {"profile": profile, "interval": interval, "due": 0.0}
+            self._update_interval()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._encode_loop, name=f"preview-{self.name}",
+                                                daemon=True)
+                self._thread.start()
+        return viewer_id
+
+    def _detach(self, viewer_id):
+        with self._cond:
+            self._viewers.pop(viewer_id, None)
+            self._update_interval()
+            self._cond.notify_all()
+
+    def _update_interval(self):
+        intervals = [viewer["interval"] for viewer in self._viewers.values()]
+        self._interval = min(intervals) if intervals else None
+
+    def _encode_loop(self):
+        encoded_seq = 0
+        while True:
+            with self._cond:
+                while (not self.closed and self._viewers
+                       and (self._frame is None or self._frame[0] == encoded_seq)):
+                    self._cond.wait(1.0)
+                if self.closed or not self._viewers:
+                    self._thread = None
+                    self._encoded.clear()
+                    return
+                seq, frame, detections, tracks = self._frame
+                now = time.monotonic()
+                # Only profiles with a viewer that is ready for a new frame
+                profiles = {v["profile"] for v in self._viewers.values() if v["due"] <= now + 0.01}
+            encoded_seq = seq
+            if not profiles:
+                continue
+            try:
+                if self.annotate is not None and (detections is not None or tracks is not None):
+                    self.annotate(frame, detections, tracks)
+                for quality, width in profiles:
+                    image = frame
+                    if width and frame.shape[1] > width:
+                        height = int(round(frame.shape[0] * width / frame.shape[1]))
+                        image = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                    ok, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                    if not ok:
+                        continue
+                    with self._cond:
+                        self._encoded[(quality, width)] = (seq, jpeg.tobytes())
+                        self.encoded += 1
+                        self._cond.notify_all()
+            except Exception as e:
+                logger.error(f"Preview {self.name} encode failed: {str(e)}")
+
+    def stats(self):
+        with self._cond:
+            return {
+                "viewers": len(self._viewers),
+                "profiles": sorted({v["profile"] for v in self._viewers.values()}),
+                "published": self.published,
+                "encoded": self.encoded,
+                "closed": self.closed,
+            }
+
+
+class PreviewHub(object):
+    """
+    Preview channels by name, e.g. ``job/<id>`` or ``camera/<id>``.
+    """
+
+    def __init__(self, annotate=None, max_fps=15, max_viewers=16):
+        self.annotate = annotate
+        self.max_fps = max_fps
+        self.max_viewers = max_viewers
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def open(self, name):
+        with self._lock:
+            channel = self._channels.get(name)
+            if channel is None or channel.closed:
+                channel = PreviewChannel(name, annotate=self.annotate, max_fps=self.max_fps,
+                                         max_viewers=self.max_viewers)
+                self._channels[name] = channel
+            return channel
+
+    def get(self, name):
+        with self._lock:
+            return self._channels.get(name)
+
+    def close(self, name):
+        with self._lock:
+            channel = self._channels.pop(name, None)
+        if channel is not None:
+            channel.close()
+
+    def publish(self, name, frame, detections=None, tracks=None):
+        channel = self._channels.get(name)
+        return channel is not None and channel.publish(frame, detections, tracks)
+
+    def stats(self):
+        with self._lock:
+            channels = list(self._channels.values())
+        return {channel.name: channel.stats() for channel in channels}
+
+    def shutdown(self):
+        with self._lock:
+            channels, self._channels = list(self._channels.values()), {}
+        for channel in channels:
+            channel.close()
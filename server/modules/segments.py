@@ -0,0 +1,375 @@
+"""
+Segmented processing of long uploads across a process pool.
+
+A long video is split at keyframes into segments that are handled by worker
+processes, each with its own detector:
+
+  detect  - every segment is decoded and run through the detector (with the
+            usual motion gate and preprocessing) in parallel; workers return
+            only the per-frame detections
+  track   - as soon as a prefix of segments has been detected, the parent runs
+            the job's single tracker over their detections in frame order, so
+            accident IDs are assigned exactly once and stay consistent across
+            segment borders
+  render  - each tracked segment is decoded again, annotated and encoded to
+            its own MP4 in a worker; rendering of early segments overlaps with
+            detection of later ones
+  concat  - the encoded segments are joined with ``ffmpeg -c copy``
+
+Tracking is a few milliseconds per frame even for crowded scenes, so doing
+it centrally costs far less than the detector work it unlocks and avoids
+any ID remapping between segments.
+"""
+
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import closing
+from functools import partial
+
+import cv2
+import numpy as np
+
+from modules.annotate import draw_detections, draw_track
+from modules.decoder import FFmpegPipeCapture, find_keyframes, open_capture, read_frame
+from modules.detections import extract_detections
+from modules.encoder import FFmpegWriter, concat_videos
+from modules.gating import MotionGate
+from modules.metrics import Profile, timed
+from modules.pipeline import InferencePipeline
+from modules.preprocess import Preprocessor, parse_roi
+
+logger = logging.getLogger(__name__)
+
+# Share of the reported progress taken by the detect stage; render takes the rest
+DETECT_PROGRESS = 80
+
+
+def video_info(path):
+    """
+    Returns ``(width, height, fps, frame_count)`` of a video file.
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise IOError(f"Could not open {path}")
+        return (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                cap.get(cv2.CAP_PROP_FPS), int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    finally:
+        cap.release()
+
+
+def plan_segments(total_frames, keyframes, count, min_frames):
+    """
+    Splits ``total_frames`` into about ``count`` segments of at least
+    ``min_frames`` frames, starting each segment on a keyframe when
+    ``keyframes`` is given. Returns ``[(start, end), ...]``; the last end is
+    None, meaning "until the end of the file", so a wrong frame count never
+    drops frames.
+    """
+    if total_frames <= 0 or count <= 1:
+        return [(0, None)]
+    target = max(min_frames, int(math.ceil(total_frames / float(count))))
+    points = keyframes if keyframes is not None else range(target, total_frames, target)
+    starts = [0]
+    for point in points:
+        if point - starts[-1] >= target and total_frames - point >= min_frames:
+            starts.append(point)
+    return list(zip(starts, starts[1:])) + [(starts[-1], None)]
+
+
+class SegmentCapture(object):
+    """
+    ``read()`` interface over frames ``[start, end)`` of a video file.
+
+    With ``backend`` "ffmpeg" (and ffmpeg installed) the file is decoded by
+    FFmpegPipeCapture, opened at ``start`` with ``open_at``: the seek goes
+    straight to the keyframe at or before it, using ``keyframes`` if given.
+    Otherwise OpenCV seeks with ``CAP_PROP_POS_FRAMES``.
+    """
+
+    def __init__(self, path, start, end, backend="opencv", threads=0, hwaccel=None, fps=None, keyframes=None):
+        if backend == "ffmpeg" and fps and shutil.which("ffmpeg") is not None:
+            self.cap = FFmpegPipeCapture.open_at(path, start, fps, keyframes=keyframes, threads=threads,
+                                                 hwaccel=hwaccel)
+        else:
+            self.cap = open_capture(path, "opencv", hwaccel=hwaccel)
+            if self.cap.isOpened() and start:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        if not self.cap.isOpened():
+            self.cap.release()
+            raise IOError(f"Could not open {path}")
+        self.remaining = None if end is None else end - start
+
+    def read(self):
+        return self.read_into(None)
+
+    def read_into(self, out):
+        """
+        Reads the next frame into ``out`` if given, else into a new array.
+        """
+        if self.remaining is not None:
+            if self.remaining <= 0:
+                return False, None
+            self.remaining -= 1
+        return read_frame(self.cap, out)
+
+    def release(self):
+        self.cap.release()
+
+
+# Per-process detector, loaded on the first detect call of each worker
+_worker = {}
+
+
+def init_worker(weights, order, threads):
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker['config'] = (weights, order)
+
+
+def _detector():
+    if 'model' not in _worker:
+        from modules.backends import load_detector
+        weights, order = _worker['config']
+        _worker['model'] = load_detector(weights, order=order)
+    return _worker['model']
+
+
+def _infer(model, imgsz, frames):
+    if imgsz is None:
+        return model(frames)
+    return model(frames, imgsz=imgsz)
+
+
+def detect_segment(path, start, end, options):
+    """
+    Worker: runs the detector over one segment. Returns the number of frames
+    read, the offsets of the frames the detector ran on, their detections
+    and the stage timings (``Profile.export``).
+    """
+    model = _detector()
+    profile = Profile()
+    preprocessor = Preprocessor(imgsz=options.get('imgsz'), roi=parse_roi(options.get('roi')))
+    gate = MotionGate(**options['gate']) if options.get('gate') else None
+    pipeline = InferencePipeline(
+        partial(_infer, model, preprocessor.imgsz),
+        batch_size=options.get('batch_size', 8),
+        max_latency=options.get('max_latency', 0.05),
+        gate=gate.should_infer if gate is not None else None,
+        preprocess=preprocessor.prepare if preprocessor.active else None,
+        profile=profile,
+        recycle_frames=True
+    )
+
+    frames = 0
+    inferred = []
+    detections = []
+    cap = SegmentCapture(path, start, end, **options.get('decode', {}))
+    try:
+        with closing(pipeline.run(cap)) as results:
+            for index, img, r in results:
+                if r is not None:
+                    project = preprocessor.transform(img.shape).project if preprocessor.active else None
+                    inferred.append(index)
+                    with profile.time("postprocess"):
+                        detections.append(extract_detections(r, project=project))
+                frames += 1
+    finally:
+        cap.release()
+    return frames, inferred, detections, profile.export()
+
+
+def render_segment(path, start, frames, inferred, detections, new_tracks, output_path, encoder):
+    """
+    Worker: decodes one segment again, draws the detections and first
+    sightings of accident tracks and encodes it to ``output_path``. Returns
+    the stage timings (``Profile.export``).
+    """
+    profile = Profile()
+    width, height, fps = encoder['width'], encoder['height'], encoder['fps']
+    lookup = dict(zip(inferred, detections))
+    current = np.empty((0, 5))
+    img = None
+    cap = SegmentCapture(path, start, start + frames, **encoder.get('decode', {}))
+    out = FFmpegWriter(output_path, width, height, fps, preset=encoder['preset'], crf=encoder['crf'],
+                       ffmpeg=shutil.which("ffmpeg"))
+    try:
+        for offset in range(frames):
+            with profile.time("decode"):
+                success, img = read_frame(cap, img)
+            if not success:
+                break
+            current = lookup.get(offset, current)
+            with profile.time("annotate"):
+                draw_detections(img, current)
+                for track in new_tracks.get(offset, ()):
+                    draw_track(img, track)
+            with profile.time("encode"):
+                out.write(img)
+        with profile.time("ffmpeg"):
+            out.release()
+    except BaseException:
+        out.abort()
+        raise
+    finally:
+        cap.release()
+    return profile.export()
+
+
+class SegmentedProcessor(object):
+    """
+    Owns the worker pool and runs segmented jobs on it. The pool is started
+    lazily with the ``spawn`` method (the server is multi-threaded, so
+    forking is unsafe) and shared by all jobs; every worker loads its own
+    detector once.
+
+    Spawned workers import the parent's main script again before running
+    their tasks, so the server is started through run.py, which imports the
+    application only under ``if __name__ == "__main__"``.
+    """
+
+    def __init__(self, weights, order, workers, threads_per_worker=1, min_segment_seconds=10):
+        self.weights = weights
+        self.order = list(order)
+        self.workers = max(1, int(workers))
+        self.threads_per_worker = threads_per_worker
+        self.min_segment_seconds = min_segment_seconds
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker,
+                initargs=(self.weights, self.order, self.threads_per_worker)
+            )
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def process(self, path, output_path, tracker, options, encoder, check_cancelled=None, on_progress=None,
+                recorder=None, render=True, profile=None):
+        """
+        Processes ``path`` into ``output_path``. ``options`` are passed to
+        ``detect_segment``; ``encoder`` holds ``preset`` and ``crf``.
+        ``options["decode"]`` (``backend``, ``threads``, ``hwaccel``) selects
+        how workers decode their segments (see SegmentCapture).
+        ``check_cancelled()`` is polled while waiting and may raise to abort;
+        ``on_progress(percent, accidents)`` is called as segments finish.
+        Detections and tracks of every frame go to ``recorder`` (a
+        ``trackstore.TrackRecorder``) if given. With ``render`` False
+        nothing is drawn or encoded and ``output_path`` is not written.
+        The workers' stage timings and the concat time go to ``profile`` (a
+        ``metrics.Profile``) if given.
+
+        Returns ``(frames, accident_ids)``.
+        """
+        width, height, fps, total_frames = video_info(path)
+        if not fps or fps <= 0 or fps != fps:
+            fps = 25.0
+        keyframes = find_keyframes(path, fps)
+        segments = plan_segments(total_frames, keyframes, self.workers, int(self.min_segment_seconds * fps))
+        decode = dict(options.get('decode') or {}, fps=fps, keyframes=keyframes)
+        options = dict(options, decode=decode)
+        encoder = dict(encoder, width=width, height=height, fps=fps, decode=decode)
+        logger.info(f"Processing {path} in {len(segments)} segments")
+
+        pool = self._get_pool()
+        workdir = tempfile.mkdtemp(prefix=".segments-", dir=os.path.dirname(os.path.abspath(output_path)))
+        detect = {}
+        rendering = {}
+        detected = {}
+        next_track = 0
+        seen = set()
+        frames_done = {"detect": 0, "render": 0}
+        total = float(max(total_frames, 1))
+        try:
+            for i, (start, end) in enumerate(segments):
+                detect[pool.submit(detect_segment, path, start, end, options)] = i
+            pending = set(detect)
+            while pending:
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                if check_cancelled is not None:
+                    check_cancelled()
+                for future in done:
+                    if future in detect:
+                        i = detect[future]
+                        *detected[i], stages = future.result()
+                        frames_done["detect"] += detected[i][0]
+                    else:
+                        stages = future.result()
+                        frames_done["render"] += rendering[future][1]
+                    if profile is not None:
+                        profile.merge(stages)
+
+                # Track every segment whose predecessors are all tracked and
+                # hand it to a worker for rendering
+                while next_track in detected:
+                    frames, inferred, detections = detected.pop(next_track)
+                    new_tracks = _track_segment(tracker, frames, inferred, detections, seen,
+                                                recorder, segments[next_track][0], profile)
+                    if render:
+                        segment_path = os.path.join(workdir, f"{next_track:05d}.mp4")
+                        future = pool.submit(render_segment, path, segments[next_track][0], frames,
+                                             inferred, detections, new_tracks, segment_path, encoder)
+                        rendering[future] = (segment_path, frames)
+                        pending.add(future)
+                    next_track += 1
+
+                if on_progress is not None and done:
+                    if render:
+                        progress = (DETECT_PROGRESS * frames_done["detect"]
+                                    + (100 - DETECT_PROGRESS) * frames_done["render"]) / total
+                    else:
+                        progress = 100 * frames_done["detect"] / total
+                    on_progress(min(100, int(progress)), len(seen))
+
+            if render:
+                with timed(profile, "ffmpeg"):
+                    concat_videos([segment_path for segment_path, _ in rendering.values()], output_path)
+            return frames_done["detect"], seen
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool next time
+            self.shutdown()
+            raise
+        finally:
+            for future in list(detect) + list(rendering):
+                future.cancel()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _track_segment(tracker, frames, inferred, detections, seen, recorder=None, start=0, profile=None):
+    """
+    Runs the tracker over one segment in frame order, coasting on frames
+    the detector skipped. Returns ``{offset: tracks first seen on that
+    frame}`` and adds their IDs to ``seen``. ``start`` is the segment's
+    first frame in the video, used for ``recorder``; ``profile`` times the
+    recording.
+    """
+    new_tracks = {}
+    lookup = dict(zip(inferred, detections))
+    for offset in range(frames):
+        dets = lookup.get(offset)
+        tracks = tracker.update(dets) if dets is not None else tracker.coast()
+        if recorder is not None:
+            with timed(profile, "record"):
+                recorder.add(start + offset, dets, tracks)
+        fresh = [track for track in tracks if track[4] not in seen]
+        if fresh:
+            seen.update(track[4] for track in fresh)
+            new_tracks[offset] = np.array(fresh)
+    return new_tracks
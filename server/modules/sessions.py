@@ -0,0 +1,82 @@
+"""
+Registry of independent SORT tracker sessions.
+
+Each job or camera stream gets its own tracker instance, and with it its own
+track ID space, Kalman state and frame counter. Sessions must be closed when
+the job or stream ends so that their state is released.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from modules.sort import Sort
+
+
+class TrackerRegistry(object):
+    """
+    Creates, looks up and tears down tracker sessions keyed by job or stream id.
+
+    Keyword arguments given to the constructor are the default tracker
+    parameters; ``open`` can override them per session.
+    """
+
+    def __init__(self, factory=Sort, **defaults):
+        self.factory = factory
+        self.defaults = defaults
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def open(self, key, **params):
+        """
+        Creates a new tracker for ``key``. Raises KeyError if the key is
+        already in use.
+        """
+        options = dict(self.defaults, **params)
+        with self._lock:
+            if key in self._sessions:
+                raise KeyError(f"Tracker session {key!r} already exists")
+            tracker = self.factory(**options)
+            self._sessions[key] = tracker
+        return tracker
+
+    def get(self, key):
+        with self._lock:
+            return self._sessions.get(key)
+
+    def close(self, key):
+        """
+        Removes the session and drops its track state. Closing an unknown key
+        is a no-op.
+        """
+        with self._lock:
+            tracker = self._sessions.pop(key, None)
+        if tracker is not None:
+            tracker.reset()
+        return tracker is not None
+
+    def close_all(self):
+        for key in self.keys():
+            self.close(key)
+
+    def keys(self):
+        with self._lock:
+            return list(self._sessions)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._sessions
+
+    @contextmanager
+    def session(self, key, **params):
+        """
+        Context manager that opens a session and always closes it on exit.
+        """
+        tracker = self.open(key, **params)
+        try:
+            yield tracker
+        finally:
+            self.close(key)
@@ -18,31 +18,25 @@
 
 from __future__ import print_function
 
-import os
+# The tracker core only needs numpy (filterpy is loaded by KalmanBoxTracker);
+# the MOT demo below imports its CLI and display dependencies itself, so that
+# servers and worker processes importing this module do not pay for them
 import numpy as np
-import matplotlib
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from skimage import io
 
-import glob
-import time
-import argparse
-from filterpy.kalman import KalmanFilter
 
-np.random.seed(0)
+try:
+  import lap
+except ImportError: #resolved once: a failed import is not cached and costs a path scan per call
+  lap = None
 
 
 def linear_assignment(cost_matrix):
-  try:
-    import lap
+  if lap is not None:
     _, x, y = lap.lapjv(cost_matrix, extend_cost=True)
     return np.array([[y[i],i] for i in x if i >= 0]) #
-  except ImportError:
-    from scipy.optimize import linear_sum_assignment
-    x, y = linear_sum_assignment(cost_matrix)
-    return np.array(list(zip(x, y)))
+  from scipy.optimize import linear_sum_assignment
+  x, y = linear_sum_assignment(cost_matrix)
+  return np.array(list(zip(x, y)))
 
 
 def iou_batch(bb_test, bb_gt):
@@ -64,6 +58,46 @@ def iou_batch(bb_test, bb_gt):
   return(o)  
 
 
+def iou_sparse(bb_test, bb_gt):
+  """
+  Sparse counterpart of iou_batch for frames with many boxes.
+
+  Boxes in bb_gt are sorted on x1 and each test box is swept against the
+  window of gt boxes whose x-extent can overlap it, so IOU is only computed
+  for candidate pairs instead of the full N*M matrix.
+  Returns the pairs with IOU > 0 as COO triplets (rows, cols, values).
+  """
+  bb_test = np.asarray(bb_test)[:, :4]
+  bb_gt = np.asarray(bb_gt)[:, :4]
+  if(len(bb_test)==0 or len(bb_gt)==0):
+    return np.empty((0,),dtype=int), np.empty((0,),dtype=int), np.empty((0,))
+
+  order = np.argsort(bb_gt[:, 0], kind='stable')
+  gt_x1 = bb_gt[order, 0]
+  max_w = max(float((bb_gt[:, 2] - bb_gt[:, 0]).max()), 0.)
+  # candidates satisfy d.x1 - max_w < gt.x1 < d.x2
+  lo = np.searchsorted(gt_x1, bb_test[:, 0] - max_w, side='right')
+  hi = np.searchsorted(gt_x1, bb_test[:, 2], side='left')
+  counts = np.maximum(hi - lo, 0)
+  total = int(counts.sum())
+  if(total==0):
+    return np.empty((0,),dtype=int), np.empty((0,),dtype=int), np.empty((0,))
+
+  starts = np.cumsum(counts) - counts
+  rows = np.repeat(np.arange(len(bb_test)), counts)
+  cols = order[np.repeat(lo - starts, counts) + np.arange(total)]
+
+  a = bb_test[rows]
+  b = bb_gt[cols]
+  w = np.maximum(0., np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]))
+  h = np.maximum(0., np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]))
+  wh = w * h
+  o = wh / ((a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    + (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1]) - wh)
+  keep = o > 0
+  return rows[keep], cols[keep], o[keep]
+
+
 def convert_bbox_to_z(bbox):
   """
   Takes a bounding box in the form [x1,y1,x2,y2] and returns z in the form
@@ -97,10 +131,14 @@ class KalmanBoxTracker(object):
   This class represents the internal state of individual tracked objects observed as bbox.
   """
   count = 0
-  def __init__(self,bbox):
+  def __init__(self,bbox,track_id=None):
     """
     Initialises a tracker using initial bounding box.
+
+    track_id is assigned by the owning Sort instance; when omitted the global
+    class counter is used, as in the original SORT implementation.
     """
+    from filterpy.kalman import KalmanFilter
     #define constant velocity model
     self.kf = KalmanFilter(dim_x=7, dim_z=4) 
     self.kf.F = np.array([[1,0,0,0,1,0,0],[0,1,0,0,0,1,0],[0,0,1,0,0,0,1],[0,0,0,1,0,0,0],  [0,0,0,0,1,0,0],[0,0,0,0,0,1,0],[0,0,0,0,0,0,1]])
@@ -114,8 +152,10 @@ class KalmanBoxTracker(object):
 
     self.kf.x[:4] = convert_bbox_to_z(bbox)
     self.time_since_update = 0
-    self.id = KalmanBoxTracker.count
-    KalmanBoxTracker.count += 1
+    if(track_id is None):
+      track_id = KalmanBoxTracker.count
+      KalmanBoxTracker.count += 1
+    self.id = track_id
     self.history = []
     self.hits = 0
     self.hit_streak = 0
@@ -145,6 +185,15 @@ class KalmanBoxTracker(object):
     self.history.append(convert_x_to_bbox(self.kf.x))
     return self.history[-1]
 
+  def coast(self):
+    """
+    Advances the state vector without touching the hit/miss counters, for
+    frames on which no detection was attempted.
+    """
+    if((self.kf.x[6]+self.kf.x[2])<=0):
+      self.kf.x[6] *= 0.0
+    self.kf.predict()
+
   def get_state(self):
     """
     Returns the current bounding box estimate.
@@ -152,61 +201,168 @@ class KalmanBoxTracker(object):
     return convert_x_to_bbox(self.kf.x)
 
 
-def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
+class ScratchBuffers(object):
   """
-  Assigns detections to tracked object (both represented as bounding boxes)
+  Grow-only scratch arrays reused from frame to frame by one tracker, so the
+  association step does not allocate its masks on every call.
+  """
+  def __init__(self):
+    self._arrays = {}
+
+  def get(self, name, shape, dtype):
+    size = int(np.prod(shape))
+    arr = self._arrays.get(name)
+    if(arr is None or arr.dtype != dtype or arr.size < size):
+      capacity = max(size, 2 * arr.size if arr is not None else 0)
+      arr = np.empty(capacity, dtype=dtype)
+      self._arrays[name] = arr
+    return arr[:size].reshape(shape)
+
 
-  Returns 3 lists of matches, unmatched_detections and unmatched_trackers
+def connected_components(rows, cols, num_rows, num_cols):
   """
-  if(len(trackers)==0):
-    return np.empty((0,2),dtype=int), np.arange(len(detections)), np.empty((0,5),dtype=int)
+  Labels the connected components of the bipartite graph given by edges
+  (rows[i], cols[i]). Returns one label per row node followed by one per
+  column node; nodes share a label iff they are connected.
+  """
+  labels = np.arange(num_rows + num_cols)
+  u = rows
+  v = cols + num_rows
+  while True:
+    new = labels.copy()
+    m = np.minimum(labels[u], labels[v])
+    np.minimum.at(new, u, m)
+    np.minimum.at(new, v, m)
+    new = new[new] #pointer jumping to shorten long chains
+    if np.array_equal(new, labels):
+      return labels
+    labels = new
+
+
+def gated_assignment(rows, cols, values, num_rows, num_cols):
+  """
+  Maximum-IOU assignment solved per connected component of the overlap graph,
+  given as the (rows, cols, values) pairs with IOU > 0. Isolated boxes are
+  skipped, single-pair components are matched directly and the Hungarian
+  solver only runs on components that actually contain a conflict, so the
+  cost grows with the number of overlapping pairs rather than with N*M.
 
-  iou_matrix = iou_batch(detections, trackers)
+  Returns the matched (row, col) pairs and their IOU values.
+  """
+  if(len(rows) == 0):
+    return np.empty((0,2),dtype=int), np.empty((0,))
+
+  labels = connected_components(rows, cols, num_rows, num_cols)
+  edge_labels = labels[rows]
+  uniq, inverse, counts = np.unique(edge_labels, return_inverse=True, return_counts=True)
+
+  single = counts[inverse] == 1
+  matches = [np.stack((rows[single], cols[single]), axis=1)]
+  ious = [values[single]]
+  for label in uniq[counts > 1]:
+    in_component = edge_labels == label
+    comp_rows = np.unique(rows[in_component])
+    comp_cols = np.unique(cols[in_component])
+    sub = np.zeros((len(comp_rows), len(comp_cols)))
+    sub[np.searchsorted(comp_rows, rows[in_component]),
+        np.searchsorted(comp_cols, cols[in_component])] = values[in_component]
+    assigned = linear_assignment(-sub)
+    if(len(assigned)):
+      assigned = assigned.astype(int)
+      matches.append(np.stack((comp_rows[assigned[:,0]], comp_cols[assigned[:,1]]), axis=1))
+      ious.append(sub[assigned[:,0], assigned[:,1]])
+  return np.concatenate(matches).astype(int), np.concatenate(ious)
+
+
+def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3,buffers = None,sparse = False):
+  """
+  Assigns detections to tracked object (both represented as bounding boxes)
 
-  if min(iou_matrix.shape) > 0:
-    a = (iou_matrix > iou_threshold).astype(np.int32)
-    if a.sum(1).max() == 1 and a.sum(0).max() == 1:
-        matched_indices = np.stack(np.where(a), axis=1)
+  Returns 3 arrays of matches, unmatched_detections and unmatched_trackers,
+  each sorted by detection (resp. tracker) index.
+  buffers is an optional ScratchBuffers owned by the calling tracker.
+  With sparse=True overlaps come from iou_sparse instead of the dense
+  iou_batch matrix, which pays off when there are many boxes per frame.
+  """
+  num_dets = len(detections)
+  num_trks = len(trackers)
+  if(num_trks==0):
+    return np.empty((0,2),dtype=int), np.arange(num_dets), np.empty((0,),dtype=int)
+  if(num_dets==0):
+    return np.empty((0,2),dtype=int), np.empty((0,),dtype=int), np.arange(num_trks)
+  if buffers is None:
+    buffers = ScratchBuffers()
+
+  if sparse:
+    rows, cols, values = iou_sparse(detections, trackers)
+    above = values > iou_threshold
+    if np.bincount(rows[above], minlength=1).max() <= 1 and np.bincount(cols[above], minlength=1).max() <= 1:
+      matched_indices = np.stack((rows[above], cols[above]), axis=1)
+      matched_ious = values[above]
     else:
-      matched_indices = linear_assignment(-iou_matrix)
+      matched_indices, matched_ious = gated_assignment(rows, cols, values, num_dets, num_trks)
   else:
-    matched_indices = np.empty(shape=(0,2))
-
-  unmatched_detections = []
-  for d, det in enumerate(detections):
-    if(d not in matched_indices[:,0]):
-      unmatched_detections.append(d)
-  unmatched_trackers = []
-  for t, trk in enumerate(trackers):
-    if(t not in matched_indices[:,1]):
-      unmatched_trackers.append(t)
+    iou_matrix = iou_batch(detections, trackers)
+    a = np.greater(iou_matrix, iou_threshold, out=buffers.get('above', iou_matrix.shape, np.bool_))
+    if a.sum(1).max() <= 1 and a.sum(0).max() <= 1:
+      matched_indices = np.stack(np.nonzero(a), axis=1)
+    else:
+      rows, cols = np.nonzero(iou_matrix > 0)
+      matched_indices, _ = gated_assignment(rows, cols, iou_matrix[rows, cols], num_dets, num_trks)
+    matched_ious = iou_matrix[matched_indices[:,0], matched_indices[:,1]]
 
   #filter out matched with low IOU
-  matches = []
-  for m in matched_indices:
-    if(iou_matrix[m[0], m[1]]<iou_threshold):
-      unmatched_detections.append(m[0])
-      unmatched_trackers.append(m[1])
-    else:
-      matches.append(m.reshape(1,2))
-  if(len(matches)==0):
-    matches = np.empty((0,2),dtype=int)
-  else:
-    matches = np.concatenate(matches,axis=0)
+  matches = matched_indices[matched_ious >= iou_threshold]
+  matches = matches[np.argsort(matches[:,0], kind='stable')]
+
+  det_matched = buffers.get('det_matched', (num_dets,), np.bool_)
+  trk_matched = buffers.get('trk_matched', (num_trks,), np.bool_)
+  det_matched[:] = False
+  trk_matched[:] = False
+  det_matched[matches[:,0]] = True
+  trk_matched[matches[:,1]] = True
 
-  return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
+  return matches, np.flatnonzero(~det_matched), np.flatnonzero(~trk_matched)
 
 
 class Sort(object):
-  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3):
+  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3, sparse_iou=False):
     """
     Sets key parameters for SORT
     """
     self.max_age = max_age
     self.min_hits = min_hits
     self.iou_threshold = iou_threshold
+    self.sparse_iou = sparse_iou
+    self.trackers = []
+    self.frame_count = 0
+    self.next_id = 0 #each instance has its own ID space
+    self.buffers = ScratchBuffers()
+
+  def reset(self):
+    """
+    Drops all tracks and restarts frame and ID numbering.
+    """
     self.trackers = []
     self.frame_count = 0
+    self.next_id = 0
+
+  def coast(self):
+    """
+    Advances all trackers one frame without detections (the detector was
+    skipped on this frame) and returns the tracks reported by the last update
+    at their predicted positions, in the same format as update().
+    """
+    ret = []
+    for trk in reversed(self.trackers):
+      trk.coast()
+      if (trk.time_since_update < 1) and (trk.hit_streak >= self.min_hits or self.frame_count <= self.min_hits):
+        d = trk.get_state()[0]
+        if not np.any(np.isnan(d)):
+          ret.append(np.concatenate((d,[trk.id+1])).reshape(1,-1))
+    if(len(ret)>0):
+      return np.concatenate(ret)
+    return np.empty((0,5))
 
   def update(self, dets=np.empty((0, 5))):
     """
@@ -220,17 +376,15 @@ class Sort(object):
     self.frame_count += 1
     # get predicted locations from existing trackers.
     trks = np.zeros((len(self.trackers), 5))
-    to_del = []
     ret = []
     for t, trk in enumerate(trks):
       pos = self.trackers[t].predict()[0]
       trk[:] = [pos[0], pos[1], pos[2], pos[3], 0]
-      if np.any(np.isnan(pos)):
-        to_del.append(t)
-    trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
-    for t in reversed(to_del):
-      self.trackers.pop(t)
-    matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets,trks, self.iou_threshold)
+    valid = ~np.isnan(trks).any(axis=1)
+    if not valid.all():
+      trks = trks[valid]
+      self.trackers = [trk for trk, ok in zip(self.trackers, valid) if ok]
+    matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets,trks, self.iou_threshold, self.buffers, self.sparse_iou)
 
     # update matched trackers with assigned detections
     for m in matched:
@@ -238,7 +392,8 @@ class Sort(object):
 
     # create and initialise new trackers for unmatched detections
     for i in unmatched_dets:
-        trk = KalmanBoxTracker(dets[i,:])
+        trk = KalmanBoxTracker(dets[i,:], self.next_id)
+        self.next_id += 1
         self.trackers.append(trk)
     i = len(self.trackers)
     for trk in reversed(self.trackers):
@@ -255,6 +410,7 @@ class Sort(object):
 
 def parse_args():
     """Parse input arguments."""
+    import argparse
     parser = argparse.ArgumentParser(description='SORT demo')
     parser.add_argument('--display', dest='display', help='Display online tracker output (slow) [False]',action='store_true')
     parser.add_argument("--seq_path", help="Path to detections.", type=str, default='data')
@@ -270,6 +426,11 @@ def parse_args():
     return args
 
 if __name__ == '__main__':
+  import glob
+  import os
+  import time
+
+  np.random.seed(0)
   # all train
   args = parse_args()
   display = args.display
@@ -278,6 +439,12 @@ if __name__ == '__main__':
   total_frames = 0
   colours = np.random.rand(32, 3) #used only for display
   if(display):
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+    from skimage import io
+
     if not os.path.exists('mot_benchmark'):
       print('\n\tERROR: mot_benchmark link not found!\n\n    Create a symbolic link to the MOT benchmark\n    (https://motchallenge.net/data/2D_MOT_2015/#download). E.g.:\n\n    $ ln -s /path/to/MOT2015_challenge/2DMOT2015 mot_benchmark\n\n')
       exit()
@@ -0,0 +1,371 @@
+"""
+Live camera ingestion.
+
+Each camera is read by its own StreamReader thread into a small drop-oldest
+buffer, so a slow detector never backs up the network connection. A single
+StreamScheduler thread shares one detector across all streams: every round it
+takes at most one frame per stream, starting from a rotating offset, so each
+camera gets a fair share of each inference batch. Tracking state is kept per
+stream in a TrackerRegistry session.
+
+Any source cv2.VideoCapture can open works, including local video files,
+which makes the whole path testable without real cameras.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+
+import cv2
+import numpy as np
+
+from modules.detections import extract_detections
+from modules.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+class StreamReader(object):
+    """
+    Keeps one capture open and pushes its frames into a bounded buffer,
+    dropping the oldest frame when the consumer falls behind.
+
+    Lost connections (and the end of a file source) are retried with
+    exponential backoff between ``backoff_initial`` and ``backoff_max``
+    seconds. ``fps_cap`` limits how many frames per second are decoded and
+    buffered; the rest are grabbed and discarded.
+    """
+
+    def __init__(self, stream_id, url, buffer_size=2, fps_cap=None,
+                 backoff_initial=1.0, backoff_max=30.0, opener=cv2.VideoCapture, on_frame=None):
+        self.stream_id = stream_id
+        self.url = url
+        self.fps_cap = fps_cap
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.opener = opener
+        self.on_frame = on_frame
+        self.connected = False
+        self.reconnects = 0
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.last_error = None
+        self._buffer = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"stream-{stream_id}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    @property
+    def alive(self):
+        return self._thread.is_alive()
+
+    def pop(self):
+        """
+        Returns the oldest buffered ``(frame_index, timestamp, frame)`` or None.
+        """
+        with self._lock:
+            if self._buffer:
+                return self._buffer.popleft()
+            return None
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def _run(self):
+        backoff = self.backoff_initial
+        index = 0
+        while not self._stop.is_set():
+            cap = self.opener(self.url)
+            if not cap.isOpened():
+                cap.release()
+                self._disconnected("Could not open stream", backoff)
+                backoff = min(backoff * 2, self.backoff_max)
+                continue
+
+            self.connected = True
+            backoff = self.backoff_initial
+            # Files are paced at their native rate so they behave like a live camera
+            source_fps = cap.get(cv2.CAP_PROP_FPS) if "://" not in str(self.url) else 0
+            pace = 1.0 / source_fps if source_fps and source_fps > 0 else 0.0
+            min_interval = 1.0 / self.fps_cap if self.fps_cap else 0.0
+            next_read = next_emit = time.monotonic()
+            try:
+                while not self._stop.is_set():
+                    if pace:
+                        delay = next_read - time.monotonic()
+                        if delay > 0:
+                            self._stop.wait(delay)
+                        next_read = max(next_read, time.monotonic() - pace) + pace
+                    # grab() keeps the connection drained; frames beyond the FPS cap
+                    # are never decoded
+                    if not cap.grab():
+                        break
+                    now = time.monotonic()
+                    if min_interval and now < next_emit:
+                        continue
+                    next_emit = max(next_emit + min_interval, now)
+                    success, frame = cap.retrieve()
+                    if not success:
+                        break
+                    self._push((index, time.time(), frame))
+                    index += 1
+            finally:
+                cap.release()
+            if not self._stop.is_set():
+                self._disconnected("Stream ended", backoff)
+                backoff = min(backoff * 2, self.backoff_max)
+
+    def _push(self, item):
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.frames_dropped += 1
+            self._buffer.append(item)
+            self.frames_read += 1
+        if self.on_frame is not None:
+            self.on_frame()
+
+    def _disconnected(self, reason, backoff):
+        self.connected = False
+        self.last_error = reason
+        self.reconnects += 1
+        logger.warning(f"Stream {self.stream_id}: {reason}, reconnecting in {backoff:.1f}s")
+        self._stop.wait(backoff)
+
+
+class StreamScheduler(object):
+    """
+    Round-robin batching of frames from many StreamReaders through one
+    detector.
+
+    ``infer_batch(frames)`` returns one result per frame. For every processed
+    frame ``on_result(stream_id, frame_index, frame, detections, tracks)`` is
+    called from the scheduler thread.
+
+    ``gate_factory`` optionally creates a MotionGate per stream; frames the
+    gate rejects skip the detector, reuse the stream's last detections and
+    only coast its tracker.
+
+    Streams added with a Preprocessor are cropped, masked and letterboxed
+    before inference and their boxes projected back to full resolution.
+    Frames are grouped by inference size and each group is passed as
+    ``infer_batch(images, imgsz=imgsz)``.
+
+    ``profile`` (a metrics.Profile) times gating, preprocessing, inference,
+    postprocessing and the trackers of all streams.
+    """
+
+    def __init__(self, infer_batch, trackers, max_batch=8, on_result=None, idle_wait=0.05,
+                 gate_factory=None, profile=None):
+        self.infer_batch = infer_batch
+        self.trackers = trackers
+        self.max_batch = max_batch
+        self.on_result = on_result
+        self.idle_wait = idle_wait
+        self.gate_factory = gate_factory
+        self.profile = profile
+        self._gates = {}
+        self._preprocessors = {}
+        self._last_detections = {}
+        self._readers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._offset = 0
+        self._thread = None
+
+    def add(self, url, fps_cap=None, buffer_size=2, stream_id=None, preprocessor=None, **reader_options):
+        stream_id = stream_id or uuid.uuid4().hex[:12]
+        self.trackers.open(stream_id).profile = self.profile
+        reader = StreamReader(stream_id, url, buffer_size=buffer_size, fps_cap=fps_cap,
+                              on_frame=self._wakeup.set, **reader_options)
+        gate = self.gate_factory() if self.gate_factory is not None else None
+        with self._lock:
+            self._readers[stream_id] = reader
+            if gate is not None:
+                self._gates[stream_id] = gate
+            if preprocessor is not None:
+                self._preprocessors[stream_id] = preprocessor
+            self._stats[stream_id] = {"processed": 0, "fps": 0.0, "window_start": time.monotonic(),
+                                      "window_frames": 0}
+        reader.start()
+        self._ensure_running()
+        return stream_id
+
+    def remove(self, stream_id):
+        with self._lock:
+            reader = self._readers.pop(stream_id, None)
+            self._stats.pop(stream_id, None)
+            self._gates.pop(stream_id, None)
+            self._preprocessors.pop(stream_id, None)
+            self._last_detections.pop(stream_id, None)
+        if reader is None:
+            return False
+        reader.stop()
+        self.trackers.close(stream_id)
+        return True
+
+    def get(self, stream_id):
+        with self._lock:
+            reader = self._readers.get(stream_id)
+            stats = dict(self._stats.get(stream_id, {}))
+            gate = self._gates.get(stream_id)
+            preprocessor = self._preprocessors.get(stream_id)
+        if reader is None:
+            return None
+        return {
+            "stream_id": stream_id,
+            "url": reader.url,
+            "connected": reader.connected,
+            "fps_cap": reader.fps_cap,
+            "frames_read": reader.frames_read,
+            "frames_dropped": reader.frames_dropped,
+            "buffered": reader.pending(),
+            "frames_processed": stats.get("processed", 0),
+            "fps": round(stats.get("fps", 0.0), 2),
+            "reconnects": reader.reconnects,
+            "last_error": reader.last_error,
+            "gate_skip_ratio": round(gate.skip_ratio, 3) if gate is not None else 0.0,
+            "imgsz": preprocessor.imgsz if preprocessor is not None else None,
+            "roi": preprocessor.roi_points() if preprocessor is not None else None,
+        }
+
+    def list(self):
+        with self._lock:
+            ids = list(self._readers)
+        return [info for info in (self.get(stream_id) for stream_id in ids) if info is not None]
+
+    def shutdown(self):
+        self._stop.set()
+        self._wakeup.set()
+        for stream_id in list(self._readers):
+            self.remove(stream_id)
+        if self._thread is not None:
+            self._thread.join()
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="stream-scheduler", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        with self._lock:
+            readers = list(self._readers.values())
+        if not readers:
+            return []
+        start = self._offset % len(readers)
+        self._offset += 1
+        order = readers[start:] + readers[:start]
+
+        batch = []
+        while len(batch) < self.max_batch:
+            took = False
+            for reader in order:
+                if len(batch) >= self.max_batch:
+                    break
+                item = reader.pop()
+                if item is not None:
+                    batch.append((reader.stream_id, item))
+                    took = True
+            if not took:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if not batch:
+                self._wakeup.wait(self.idle_wait)
+                self._wakeup.clear()
+                continue
+            infer = [self._should_infer(stream_id, frame) for stream_id, (_, _, frame) in batch]
+            try:
+                results = self._infer(batch, infer)
+            except Exception as e:
+                logger.error(f"Stream inference failed: {str(e)}", exc_info=True)
+                continue
+
+            for position, (stream_id, (index, _, frame)) in enumerate(batch):
+                result = results.get(position)
+                tracker = self.trackers.get(stream_id)
+                if tracker is None:
+                    continue  # stream removed while its frame was in flight
+                if result is not None:
+                    preprocessor = self._preprocessors.get(stream_id)
+                    project = None
+                    if preprocessor is not None and preprocessor.active:
+                        project = preprocessor.transform(frame.shape).project
+                    with timed(self.profile, "postprocess"):
+                        detections = extract_detections(result, project=project)
+                    self._last_detections[stream_id] = detections
+                    tracks = tracker.update(detections)
+                else:
+                    detections = self._last_detections.get(stream_id, np.empty((0, 5)))
+                    tracks = tracker.coast()
+                self._count(stream_id)
+                if self.profile is not None:
+                    self.profile.frame()
+                if self.on_result is not None:
+                    try:
+                        self.on_result(stream_id, index, frame, detections, tracks)
+                    except Exception as e:
+                        logger.error(f"Stream {stream_id} result handler failed: {str(e)}", exc_info=True)
+
+    def _infer(self, batch, infer):
+        """
+        Runs the detector on the flagged frames of ``batch``, one call per
+        inference size. Returns ``{position in batch: result}``.
+        """
+        groups = {}
+        for position, ((stream_id, (_, _, frame)), flag) in enumerate(zip(batch, infer)):
+            if not flag:
+                continue
+            preprocessor = self._preprocessors.get(stream_id)
+            if preprocessor is None:
+                groups.setdefault(None, []).append((position, frame))
+            else:
+                with timed(self.profile, "preprocess"):
+                    image = preprocessor.prepare(frame)
+                groups.setdefault(preprocessor.imgsz, []).append((position, image))
+
+        results = {}
+        for imgsz, items in groups.items():
+            images = [image for _, image in items]
+            with timed(self.profile, "inference"):
+                output = self.infer_batch(images) if imgsz is None else self.infer_batch(images, imgsz=imgsz)
+            for (position, _), result in zip(items, output):
+                results[position] = result
+        return results
+
+    def _should_infer(self, stream_id, frame):
+        gate = self._gates.get(stream_id)
+        if gate is None:
+            return True
+        with timed(self.profile, "gate"):
+            return gate.should_infer(frame)
+
+    def _count(self, stream_id):
+        with self._lock:
+            stats = self._stats.get(stream_id)
+            if stats is None:
+                return
+            stats["processed"] += 1
+            stats["window_frames"] += 1
+            elapsed = time.monotonic() - stats["window_start"]
+            if elapsed >= 1.0:
+                stats["fps"] = stats["window_frames"] / elapsed
+                stats["window_frames"] = 0
+                stats["window_start"] = time.monotonic()
@@ -0,0 +1,278 @@
+"""
+Structured output of processing jobs.
+
+Every job writes two things next to its rendered video:
+
+  track file  - ``<job_id>.npz``, a compressed columnar store of every
+                detection (frames the detector ran on) and every tracker
+                output (all frames): frame, track id, box and confidence
+  event index - one row per accident track in a SQLite database with its
+                first/last frame and time, peak confidence and the frame
+                (and box) to take a thumbnail from
+
+Both can be queried without decoding any video.
+
+Clients that overlay tracks on the video themselves (jobs run with
+``render=false``) read a compact binary sidecar, written for every job:
+
+  header  16 bytes: b"TRK1", uint32 fps * 1000, uint16 width, uint16 height,
+          uint32 record count
+  records 16 bytes each, sorted by frame: uint32 frame, uint32 track id,
+          uint16 x1, y1, x2, y2
+
+all little-endian, so a record's position can be computed and fetched with a
+range request.
+"""
+
+import os
+import sqlite3
+import struct
+import threading
+import time
+from contextlib import closing
+
+import numpy as np
+
+from modules.detections import match_confidence
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    job_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    fps REAL,
+    frames INTEGER,
+    width INTEGER,
+    height INTEGER,
+    track_file TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL REFERENCES videos(job_id) ON DELETE CASCADE,
+    track_id INTEGER NOT NULL,
+    first_frame INTEGER NOT NULL,
+    last_frame INTEGER NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    peak_conf REAL,
+    thumb_frame INTEGER NOT NULL,
+    thumb_time REAL NOT NULL,
+    x1 REAL, y1 REAL, x2 REAL, y2 REAL
+);
+CREATE INDEX IF NOT EXISTS events_job ON events(job_id);
+CREATE INDEX IF NOT EXISTS events_time ON events(start_time, end_time);
+CREATE INDEX IF NOT EXISTS events_conf ON events(peak_conf);
+"""
+
+SIDECAR_MAGIC = b"TRK1"
+SIDECAR_HEADER = struct.Struct("<4sIHHI")
+SIDECAR_RECORD = np.dtype([("frame", "<u4"), ("track_id", "<u4"), ("box", "<u2", (4,))])
+
+EVENT_COLUMNS = ("job_id", "track_id", "first_frame", "last_frame", "start_time", "end_time",
+                 "peak_conf", "thumb_frame", "thumb_time", "x1", "y1", "x2", "y2")
+
+
+class TrackRecorder(object):
+    """
+    Collects per-frame detections and tracker output of one job and turns
+    them into columns and accident events.
+    """
+
+    def __init__(self):
+        self._detections = []
+        self._tracks = []
+
+    def add(self, frame, detections=None, tracks=None):
+        """
+        Records one frame. ``detections`` is the ``(N, 5)`` detector output
+        (None on frames the detector skipped), ``tracks`` the ``(M, 5)``
+        tracker output. Tracks get the confidence of the best overlapping
+        detection of the same frame, NaN if there is none.
+        """
+        if detections is not None and len(detections):
+            rows = np.empty((len(detections), 6), dtype=np.float32)
+            rows[:, 0] = frame
+            rows[:, 1:] = detections[:, :5]
+            self._detections.append(rows)
+        if tracks is not None and len(tracks):
+            rows = np.empty((len(tracks), 7), dtype=np.float32)
+            rows[:, 0] = frame
+            rows[:, 1] = tracks[:, 4]
+            rows[:, 2:6] = tracks[:, :4]
+            rows[:, 6] = match_confidence(tracks, detections)
+            self._tracks.append(rows)
+
+    def columns(self):
+        detections = np.concatenate(self._detections) if self._detections else np.empty((0, 6), np.float32)
+        tracks = np.concatenate(self._tracks) if self._tracks else np.empty((0, 7), np.float32)
+        return {
+            "det_frame": detections[:, 0].astype(np.int32),
+            "det_box": detections[:, 1:5],
+            "det_conf": detections[:, 5],
+            "track_frame": tracks[:, 0].astype(np.int32),
+            "track_id": tracks[:, 1].astype(np.int32),
+            "track_box": tracks[:, 2:6],
+            "track_conf": tracks[:, 6],
+        }
+
+    def save(self, path):
+        np.savez_compressed(path, **self.columns())
+
+    def write_sidecar(self, path, fps, width, height):
+        """
+        Writes the tracker output in the binary sidecar format (see the
+        module docstring), replacing ``path`` atomically.
+        """
+        columns = self.columns()
+        order = np.argsort(columns["track_frame"], kind="stable")
+        records = np.empty(len(order), dtype=SIDECAR_RECORD)
+        records["frame"] = columns["track_frame"][order]
+        records["track_id"] = columns["track_id"][order]
+        box = np.rint(columns["track_box"][order])
+        box[:, 0::2] = box[:, 0::2].clip(0, max(width - 1, 0))
+        box[:, 1::2] = box[:, 1::2].clip(0, max(height - 1, 0))
+        records["box"] = box
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(SIDECAR_HEADER.pack(SIDECAR_MAGIC, int(round((fps or 0) * 1000)), width, height, len(records)))
+            f.write(records.tobytes())
+        os.replace(temp_path, path)
+
+    def events(self, fps):
+        """
+        One event per track id: frame/time span, peak confidence and the
+        frame and box at that peak (the first frame if the track was never
+        matched to a detection).
+        """
+        columns = self.columns()
+        if len(columns["track_id"]) == 0:
+            return []
+        fps = fps if fps and fps > 0 else 25.0
+        order = np.lexsort((columns["track_frame"], columns["track_id"]))
+        ids = columns["track_id"][order]
+        frames = columns["track_frame"][order]
+        boxes = columns["track_box"][order]
+        conf = columns["track_conf"][order]
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        ends = np.r_[starts[1:], len(ids)]
+
+        events = []
+        for start, end in zip(starts, ends):
+            group = conf[start:end]
+            if np.isnan(group).all():
+                peak, peak_conf = start, None
+            else:
+                peak = start + int(np.nanargmax(group))
+                peak_conf = round(float(conf[peak]), 4)
+            events.append({
+                "track_id": int(ids[start]),
+                "first_frame": int(frames[start]),
+                "last_frame": int(frames[end - 1]),
+                "start_time": round(frames[start] / fps, 3),
+                "end_time": round(frames[end - 1] / fps, 3),
+                "peak_conf": peak_conf,
+                "thumb_frame": int(frames[peak]),
+                "thumb_time": round(frames[peak] / fps, 3),
+                "x1": float(boxes[peak, 0]),
+                "y1": float(boxes[peak, 1]),
+                "x2": float(boxes[peak, 2]),
+                "y2": float(boxes[peak, 3]),
+            })
+        return events
+
+
+def load_tracks(path, start_frame=None, end_frame=None, track_id=None):
+    """
+    Reads a track file, optionally restricted to a frame range and a
+    single track. Returns ``{"detections": {...}, "tracks": {...}}`` of
+    JSON-ready columns.
+    """
+    with np.load(path) as data:
+        columns = {name: data[name] for name in data.files}
+
+    def window(frame):
+        keep = np.ones(len(frame), dtype=bool)
+        if start_frame is not None:
+            keep &= frame >= start_frame
+        if end_frame is not None:
+            keep &= frame <= end_frame
+        return keep
+
+    det = window(columns["det_frame"])
+    trk = window(columns["track_frame"])
+    if track_id is not None:
+        trk &= columns["track_id"] == track_id
+
+    return {
+        "detections": {
+            "frame": columns["det_frame"][det].tolist(),
+            "box": np.round(columns["det_box"][det].astype(np.float64), 1).tolist(),
+            "conf": np.round(columns["det_conf"][det].astype(np.float64), 4).tolist(),
+        },
+        "tracks": {
+            "frame": columns["track_frame"][trk].tolist(),
+            "track_id": columns["track_id"][trk].tolist(),
+            "box": np.round(columns["track_box"][trk].astype(np.float64), 1).tolist(),
+            "conf": [None if c != c else round(float(c), 4) for c in columns["track_conf"][trk]],
+        },
+    }
+
+
+class EventStore(object):
+    """
+    SQLite index of processed videos and their accident events. A
+    connection is opened (and closed) per call, so the store can be used
+    from any thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA foreign_keys=ON")
+        return db
+
+    def add_video(self, job_id, filename, fps, frames, width, height, track_file, events):
+        with self._write_lock, closing(self._connect()) as db, db:
+            db.execute(
+                "INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, filename, fps, frames, width, height, track_file, time.time()))
+            db.executemany(
+                f"INSERT INTO events ({', '.join(EVENT_COLUMNS)}) VALUES ({', '.join('?' * len(EVENT_COLUMNS))})",
+                [tuple([job_id] + [event[c] for c in EVENT_COLUMNS[1:]]) for event in events])
+
+    def get_video(self, job_id):
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT * FROM videos WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def query_events(self, job_id=None, filename=None, start=None, end=None, min_conf=None,
+                     since=None, until=None, limit=100, offset=0):
+        """
+        Events overlapping the video time range ``[start, end]`` (seconds)
+        with peak confidence of at least ``min_conf``, optionally limited to
+        one job or filename and to videos processed between ``since`` and
+        ``until`` (Unix time). Ordered by processing time, then start time.
+        """
+        clauses, args = [], []
+        for clause, value in (("e.job_id = ?", job_id), ("v.filename = ?", filename),
+                              ("e.end_time >= ?", start), ("e.start_time <= ?", end),
+                              ("e.peak_conf >= ?", min_conf), ("v.created_at >= ?", since),
+                              ("v.created_at <= ?", until)):
+            if value is not None:
+                clauses.append(clause)
+                args.append(value)
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                f"SELECT e.*, v.filename, v.created_at FROM events e JOIN videos v ON v.job_id = e.job_id "
+                f"{where} ORDER BY v.created_at DESC, e.start_time LIMIT ? OFFSET ?",
+                args + [limit, offset]).fetchall()
+        return [dict(row) for row in rows]
@@ -0,0 +1,381 @@
+"""
+Resumable chunked uploads.
+
+A client creates an upload, then sends the file as a sequence of chunks,
+each tagged with the byte offset it starts at and optionally a checksum:
+
+  POST   /uploads                  {"filename", "size"}       create
+  PATCH  /uploads/<id>             Upload-Offset: <n>, body    append a chunk
+  GET    /uploads/<id>                                         current offset
+  POST   /uploads/<id>/finalize                                start processing
+  DELETE /uploads/<id>                                         abort
+
+Chunk bodies are copied from the request stream to the upload file in small
+blocks, so memory use does not depend on chunk or file size. After a dropped
+connection the client asks for the current offset and resumes from there.
+
+Readers (``GrowingFileReader``) can consume an upload while it is still being
+written: they block at the current end of the data until more arrives or the
+upload is finalized, which lets processing start before the upload is done.
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import struct
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK = 1024 * 1024
+CHECKSUM_ALGORITHMS = ("md5", "sha1", "sha256")
+
+# Containers whose headers come first, so a prefix can already be decoded
+STREAMABLE_EXTENSIONS = ("mkv", "webm", "avi")
+ISO_EXTENSIONS = ("mp4", "mov")
+
+
+class UploadError(Exception):
+    """Base class; ``status`` is the HTTP status the API answers with."""
+    status = 400
+
+
+class UploadNotFound(UploadError):
+    status = 404
+
+
+class OffsetMismatch(UploadError):
+    status = 409
+
+    def __init__(self, expected):
+        super(OffsetMismatch, self).__init__(f"Upload offset is {expected}")
+        self.expected = expected
+
+
+class ChecksumMismatch(UploadError):
+    status = 460
+
+
+class UploadTooLarge(UploadError):
+    status = 413
+
+
+class UploadClosed(UploadError):
+    status = 410
+
+
+def parse_checksum(header):
+    """
+    Parses an ``Upload-Checksum: <algorithm> <base64 digest>`` header.
+    Returns ``(algorithm, digest bytes)`` or None.
+    """
+    if not header:
+        return None
+    try:
+        algorithm, value = header.strip().split(None, 1)
+        digest = base64.b64decode(value, validate=True)
+    except ValueError:
+        raise UploadError("Upload-Checksum must be '<algorithm> <base64 digest>'")
+    algorithm = algorithm.lower()
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise UploadError(f"Unsupported checksum algorithm {algorithm}")
+    return algorithm, digest
+
+
+class Upload(object):
+    """
+    State of one upload. ``offset`` only moves forward under ``_cond``;
+    readers wait on it for more data.
+    """
+
+    def __init__(self, filename, path, size=None, **params):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.params = params
+        self.offset = 0
+        self.complete = False
+        self.aborted = False
+        self.job_id = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self._content_hash = hashlib.sha256()
+        self._write_lock = threading.Lock()
+        self._cond = threading.Condition()
+
+    @property
+    def extension(self):
+        return self.filename.rsplit('.', 1)[-1].lower() if '.' in self.filename else ''
+
+    def to_dict(self):
+        return {
+            "upload_id": self.id,
+            "filename": self.filename,
+            "offset": self.offset,
+            "size": self.size,
+            "complete": self.complete,
+            "job_id": self.job_id,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    def digest(self):
+        """
+        SHA-256 of the data received so far, maintained while writing so a
+        finished upload never has to be read back to hash it.
+        """
+        return self._content_hash.hexdigest()
+
+    def wait_for_data(self, position, timeout):
+        """
+        Blocks until data beyond ``position`` is present, the upload is
+        finished or aborted, or ``timeout`` expires.
+        """
+        with self._cond:
+            if self.offset <= position and not self.complete and not self.aborted:
+                self._cond.wait(timeout)
+
+    def _advance(self, offset):
+        with self._cond:
+            self.offset = offset
+            self.updated_at = time.time()
+            self._cond.notify_all()
+
+    def _finish(self, aborted=False):
+        with self._cond:
+            if aborted:
+                self.aborted = True
+            else:
+                self.complete = True
+            self.updated_at = time.time()
+            self._cond.notify_all()
+
+
+class UploadManager(object):
+    """
+    Keeps track of uploads in progress. Uploads not touched for ``ttl``
+    seconds are aborted and their files removed.
+    """
+
+    def __init__(self, folder, max_size, ttl=24 * 3600):
+        self.folder = folder
+        self.max_size = max_size
+        self.ttl = ttl
+        self._uploads = {}
+        self._lock = threading.Lock()
+        self._expiry = None
+        self._stopped = threading.Event()
+        os.makedirs(folder, exist_ok=True)
+
+    def start_expiry(self, interval):
+        """
+        Runs ``expire()`` every ``interval`` seconds in a background thread,
+        so stale uploads go away even when no new upload is created.
+        """
+        if self._expiry is None:
+            self._expiry = threading.Thread(target=self._expire_loop, args=(interval,),
+                                            name="upload-expiry", daemon=True)
+            self._expiry.start()
+
+    def stop_expiry(self):
+        self._stopped.set()
+
+    def _expire_loop(self, interval):
+        while not self._stopped.wait(interval):
+            try:
+                self.expire()
+            except Exception as e:
+                logger.error(f"Expiring uploads failed: {str(e)}")
+
+    def create(self, filename, size=None, **params):
+        if size is not None and size > self.max_size:
+            raise UploadTooLarge(f"File size exceeds {self.max_size} bytes")
+        self.expire()
+        upload = Upload(filename, None, size=size, **params)
+        upload.path = os.path.join(self.folder, f"{upload.id}_{filename}")
+        open(upload.path, 'wb').close()
+        with self._lock:
+            self._uploads[upload.id] = upload
+        return upload
+
+    def get(self, upload_id):
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+        if upload is None:
+            raise UploadNotFound("Upload not found")
+        return upload
+
+    def append(self, upload_id, offset, stream, checksum=None):
+        """
+        Writes the chunk read from ``stream`` at ``offset``. Returns the new
+        offset. Without a checksum, the bytes received before a dropped
+        connection are kept so the client can resume after them; with one,
+        a chunk is all-or-nothing.
+        """
+        upload = self.get(upload_id)
+        if not upload._write_lock.acquire(blocking=False):
+            raise OffsetMismatch(upload.offset)  # another chunk is being written
+        try:
+            if upload.complete or upload.aborted:
+                raise UploadClosed("Upload is already finalized")
+            if offset != upload.offset:
+                raise OffsetMismatch(upload.offset)
+            limit = self.max_size if upload.size is None else min(upload.size, self.max_size)
+            hasher = hashlib.new(checksum[0]) if checksum else None
+            content_hash = upload._content_hash.copy()
+
+            written = 0
+            try:
+                with open(upload.path, 'r+b') as f:
+                    f.seek(offset)
+                    while True:
+                        data = stream.read(READ_BLOCK)
+                        if not data:
+                            break
+                        if offset + written + len(data) > limit:
+                            f.truncate(offset)
+                            raise UploadTooLarge(f"Upload exceeds {limit} bytes")
+                        f.write(data)
+                        written += len(data)
+                        content_hash.update(data)
+                        if hasher is not None:
+                            hasher.update(data)
+                    if hasher is not None and hasher.digest() != checksum[1]:
+                        f.truncate(offset)
+                        raise ChecksumMismatch("Chunk checksum mismatch")
+            except FileNotFoundError:
+                raise UploadClosed("Upload file is gone")
+            except UploadError:
+                raise
+            except Exception as e:
+                # Connection dropped mid-chunk (e.g. ClientDisconnected or a
+                # reset socket): keep what arrived unless the chunk has to be
+                # verified as a whole. Nothing is kept after a disk error.
+                dropped = isinstance(e, ConnectionError) or not isinstance(e, OSError)
+                if dropped and hasher is None and written:
+                    upload._content_hash = content_hash
+                    upload._advance(offset + written)
+                raise
+            upload._content_hash = content_hash
+            upload._advance(offset + written)
+            return upload.offset
+        finally:
+            upload._write_lock.release()
+
+    def finalize(self, upload_id):
+        upload = self.get(upload_id)
+        with upload._write_lock:
+            if upload.aborted:
+                raise UploadClosed("Upload was aborted")
+            if upload.size is not None and upload.offset != upload.size:
+                raise OffsetMismatch(upload.offset)
+            if upload.offset == 0:
+                raise UploadError("Upload is empty")
+            # Drop any bytes past the offset left by a failed chunk
+            os.truncate(upload.path, upload.offset)
+            upload._finish()
+        return upload
+
+    def abort(self, upload_id, remove_file=True):
+        upload = self.get(upload_id)
+        upload._finish(aborted=True)
+        self.discard(upload_id)
+        if remove_file and os.path.exists(upload.path):
+            os.remove(upload.path)
+        return upload
+
+    def discard(self, upload_id):
+        """
+        Forgets an upload whose file has been handed over to processing.
+        """
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+
+    def expire(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            stale = [u.id for u in self._uploads.values() if u.updated_at < cutoff and not u.complete]
+        for upload_id in stale:
+            logger.info(f"Expiring stale upload {upload_id}")
+            try:
+                self.abort(upload_id)
+            except UploadNotFound:
+                pass
+
+    def is_streamable(self, upload):
+        """
+        True if what has arrived so far can already be decoded front to back,
+        False if the container needs the end of the file (MP4/MOV with the
+        ``moov`` index after the media data), None if it cannot tell yet.
+        """
+        if upload.extension in STREAMABLE_EXTENSIONS:
+            return upload.offset > 0 or None
+        if upload.extension not in ISO_EXTENSIONS:
+            return False
+        with open(upload.path, 'rb') as f:
+            position = 0
+            while position + 8 <= upload.offset:
+                f.seek(position)
+                size, kind = struct.unpack('>I4s', f.read(8))
+                if kind == b'moov':
+                    return True
+                if kind == b'mdat':
+                    return False
+                if size == 1:
+                    if position + 16 > upload.offset:
+                        return None
+                    size = struct.unpack('>Q', f.read(8))[0]
+                elif size == 0:
+                    return False
+                if size < 8:
+                    return False
+                position += size
+        return None
+
+    def reader(self, upload_id, idle_timeout=None):
+        return GrowingFileReader(self.get(upload_id), idle_timeout=idle_timeout)
+
+
+class GrowingFileReader(object):
+    """
+    File-like reader over an upload that may still be receiving data.
+    ``read`` blocks at the current end of the data and returns ``b''`` only
+    once the upload is finalized; an aborted upload or ``close()`` ends the
+    stream with an IOError. So does an upload that stops receiving data: with
+    ``idle_timeout``, a read fails once the upload has been idle (no chunk,
+    no finalize) for that many seconds, instead of waiting for the client
+    forever.
+    """
+
+    def __init__(self, upload, poll=0.5, idle_timeout=None):
+        self.upload = upload
+        self.poll = poll
+        self.idle_timeout = idle_timeout
+        self.closed = False
+        self._file = open(upload.path, 'rb')
+        self._position = 0
+
+    def read(self, size=READ_BLOCK):
+        while True:
+            if self.closed:
+                raise IOError("Reader closed")
+            if self.upload.aborted:
+                raise IOError("Upload aborted")
+            available = self.upload.offset - self._position
+            if available > 0:
+                data = self._file.read(min(size, available))
+                self._position += len(data)
+                return data
+            if self.upload.complete:
+                return b''
+            if self.idle_timeout is not None and time.time() - self.upload.updated_at > self.idle_timeout:
+                raise IOError(f"Upload received no data for {self.idle_timeout} seconds")
+            self.upload.wait_for_data(self._position, self.poll)
+
+    def close(self):
+        self.closed = True
+        self._file.close()
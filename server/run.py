@@ -0,0 +1,14 @@
+"""
+Starts the server:
+
+    $ python run.py
+
+Segment worker processes are started with ``spawn``, which runs the parent's
+main script again in every worker. This script is that main script, and it
+imports the application only when run directly, so workers load just the
+modules their tasks need instead of the whole server.
+"""
+
+if __name__ == "__main__":
+    import app
+    app.main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tests import the server's modules the way app.py does ("modules.x")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,184 @@
+import base64
+import email
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+import pytest
+
+from modules.alerts import AlertDispatcher, EmailSink, WebhookSink, encode_snapshot
+
+
+class RecordingSink(object):
+    name = "recording"
+
+    def __init__(self):
+        self.notifications = []
+        self.closed = False
+
+    async def send(self, notification):
+        self.notifications.append(notification)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def webhook():
+    """
+    Local HTTP server answering POSTs with the queued ``statuses`` (then 200)
+    and recording the JSON bodies.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            server.bodies.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+            self.send_response(server.statuses.pop(0) if server.statuses else 200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.statuses = []
+    server.bodies = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/alerts"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def dispatcher(sinks, **kwargs):
+    kwargs = dict({"coalesce_window": 0.05, "backoff_initial": 0.01, "max_retries": 2}, **kwargs)
+    return AlertDispatcher(sinks, **kwargs).start()
+
+
+def test_webhook_retries_server_errors(webhook):
+    webhook.statuses = [503, 500]
+    alerts = dispatcher([WebhookSink(webhook.url)])
+    assert alerts.submit("camera/1", 7, confidence=0.8, box=(1, 2, 3, 4), stream_id="1")
+    alerts.stop()
+
+    stats = alerts.stats()
+    assert (stats["delivered"], stats["retries"], stats["dead_lettered"], stats["pending"]) == (1, 2, 0, 0)
+    assert len(webhook.bodies) == 3
+    body = webhook.bodies[-1]
+    assert body["source"] == "camera/1" and body["track_ids"] == [7] and body["stream_id"] == "1"
+    assert body["accidents"][0]["box"] == [1, 2, 3, 4]
+
+
+def test_webhook_dead_letters_client_errors(webhook, tmp_path):
+    webhook.statuses = [400]
+    dead_letters = tmp_path / "dead.jsonl"
+    alerts = dispatcher([WebhookSink(webhook.url)], dead_letter_path=str(dead_letters))
+    alerts.submit("job/a", 1)
+    alerts.stop()
+
+    stats = alerts.stats()
+    assert (stats["delivered"], stats["retries"], stats["dead_lettered"]) == (0, 0, 1)
+    assert len(webhook.bodies) == 1
+    record = json.loads(dead_letters.read_text())
+    assert record["sink"] == "webhook" and record["attempts"] == 1 and "400" in record["error"]
+    assert record["notification"]["track_ids"] == [1]
+
+
+def test_webhook_gives_up_after_retries(webhook, tmp_path):
+    webhook.statuses = [503] * 3
+    dead_letters = tmp_path / "dead.jsonl"
+    alerts = dispatcher([WebhookSink(webhook.url)], dead_letter_path=str(dead_letters))
+    alerts.submit("job/a", 1)
+    alerts.stop()
+
+    assert alerts.stats()["dead_lettered"] == 1
+    assert json.loads(dead_letters.read_text())["attempts"] == 3
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_email_sink():
+    from aiosmtpd.controller import Controller
+
+    class Handler(object):
+        def __init__(self):
+            self.messages = []
+
+        async def handle_DATA(self, server, session, envelope):
+            self.messages.append(envelope)
+            return '250 OK'
+
+    handler = Handler()
+    port = free_port()
+    controller = Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    try:
+        alerts = dispatcher([EmailSink('127.0.0.1', port, 'alerts@localhost', ['ops@localhost'])])
+        snapshot = encode_snapshot(np.zeros((48, 64, 3), dtype=np.uint8))
+        alerts.submit("camera/2", 3, confidence=0.9, snapshot=snapshot, filename="crash.mp4")
+        alerts.submit("camera/2", 4, confidence=0.5)
+        alerts.stop()
+    finally:
+        controller.stop()
+
+    assert alerts.stats()["delivered"] == 1
+    assert len(handler.messages) == 1
+    envelope = handler.messages[0]
+    assert envelope.rcpt_tos == ['ops@localhost']
+    message = email.message_from_bytes(envelope.content)
+    assert message['Subject'] == "Accident detected: camera/2"
+    parts = {part.get_content_type(): part for part in message.walk()}
+    assert "crash.mp4" in parts['text/plain'].get_payload()
+    assert parts['image/jpeg'].get_payload(decode=True) == snapshot
+
+
+def test_coalesces_alerts_of_one_source():
+    sink = RecordingSink()
+    alerts = dispatcher([sink], coalesce_window=0.5)
+    alerts.submit("camera/1", 1, confidence=0.4)
+    alerts.submit("camera/1", 2, confidence=0.9, snapshot=b"jpeg")
+    alerts.submit("camera/1", 1, confidence=0.6)
+    alerts.submit("camera/2", 5)
+    alerts.stop()
+
+    by_source = {n["source"]: n for n in sink.notifications}
+    assert sorted(by_source) == ["camera/1", "camera/2"]
+    merged = by_source["camera/1"]
+    assert merged["track_ids"] == [1, 2] and merged["alerts"] == 3
+    assert merged["confidence"] == 0.9
+    assert base64.b64decode(merged["snapshot"]) == b"jpeg"
+    assert by_source["camera/2"]["snapshot"] is None
+    assert alerts.stats()["coalesced"] == 2 and alerts.stats()["notifications"] == 2
+
+
+def test_drops_when_queue_is_full():
+    sink = RecordingSink()
+    alerts = AlertDispatcher([sink], queue_size=2, coalesce_window=60)
+    assert not alerts.submit("camera/1", 1)  # not started
+    alerts.start()
+    assert alerts.submit("camera/1", 2)
+    assert alerts.submit("camera/1", 3)
+    assert not alerts.submit("camera/1", 4)
+    stats = alerts.stats()
+    assert (stats["submitted"], stats["dropped"], stats["pending"]) == (4, 2, 2)
+
+    # stop() sends the open batch without waiting for the window
+    alerts.stop(timeout=5)
+    assert [n["track_ids"] for n in sink.notifications] == [[2, 3]]
+    assert sink.closed
+    assert alerts.stats()["pending"] == 0
+
+
+def test_encode_snapshot_downscales():
+    frame = np.random.default_rng(0).integers(0, 255, (1080, 1920, 3), dtype=np.uint8)
+    image = cv2.imdecode(np.frombuffer(encode_snapshot(frame, max_size=480), np.uint8), cv2.IMREAD_COLOR)
+    assert image.shape == (270, 480, 3)
+    small = np.zeros((100, 200, 3), dtype=np.uint8)
+    assert cv2.imdecode(np.frombuffer(encode_snapshot(small), np.uint8), cv2.IMREAD_COLOR).shape == (100, 200, 3)
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from modules.sort import (ScratchBuffers, associate_detections_to_trackers, connected_components,
+                          gated_assignment, iou_batch, linear_assignment)
+
+
+def crowded_boxes(n, rng, spread=300):
+    """Boxes packed closely enough that many of them overlap."""
+    xy = rng.uniform(0, spread, (n, 2))
+    wh = rng.uniform(20, 60, (n, 2))
+    return np.concatenate([xy, xy + wh], axis=1)
+
+
+def test_connected_components():
+    # 0-0, 1-0 and 2-1, 3-2: rows {0, 1} join column 0; row 2 with column 1;
+    # row 3 with column 2; column 3 is isolated
+    rows = np.array([0, 1, 2, 3])
+    cols = np.array([0, 0, 1, 2])
+    labels = connected_components(rows, cols, 4, 4)
+    row_labels, col_labels = labels[:4], labels[4:]
+    assert row_labels[0] == row_labels[1] == col_labels[0]
+    assert row_labels[2] == col_labels[1]
+    assert row_labels[3] == col_labels[2]
+    assert len({row_labels[0], row_labels[2], row_labels[3], col_labels[3]}) == 4
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_gated_assignment_is_optimal(seed):
+    rng = np.random.default_rng(seed)
+    dets = crowded_boxes(40, rng)
+    trks = crowded_boxes(35, rng)
+    iou = iou_batch(dets, trks)
+    rows, cols = np.nonzero(iou > 0)
+
+    matches, values = gated_assignment(rows, cols, iou[rows, cols], len(dets), len(trks))
+
+    # One-to-one, and values are the pairs' IOUs
+    assert len(np.unique(matches[:, 0])) == len(matches)
+    assert len(np.unique(matches[:, 1])) == len(matches)
+    np.testing.assert_allclose(values, iou[matches[:, 0], matches[:, 1]])
+    # Same total IOU as the Hungarian solver on the full matrix
+    dense = linear_assignment(-iou)
+    np.testing.assert_allclose(values.sum(), iou[dense[:, 0], dense[:, 1]].sum())
+
+
+def test_gated_assignment_without_overlaps():
+    empty = np.empty((0,), dtype=int)
+    matches, values = gated_assignment(empty, empty, np.empty((0,)), 3, 3)
+    assert matches.shape == (0, 2)
+    assert values.shape == (0,)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_associate_partitions_detections_and_trackers(seed):
+    rng = np.random.default_rng(seed)
+    dets = crowded_boxes(30, rng)
+    trks = dets[rng.permutation(30)[:20]] + rng.normal(0, 4, (20, 4))
+
+    matches, unmatched_dets, unmatched_trks = associate_detections_to_trackers(
+        dets, trks, 0.3, ScratchBuffers())
+
+    assert sorted(matches[:, 0].tolist() + unmatched_dets.tolist()) == list(range(len(dets)))
+    assert sorted(matches[:, 1].tolist() + unmatched_trks.tolist()) == list(range(len(trks)))
+    assert (np.diff(matches[:, 0]) > 0).all()
+    assert (np.diff(unmatched_dets) > 0).all() and (np.diff(unmatched_trks) > 0).all()
+    assert (iou_batch(dets, trks)[matches[:, 0], matches[:, 1]] >= 0.3).all()
+
+
+def test_associate_reuses_buffers():
+    rng = np.random.default_rng(0)
+    buffers = ScratchBuffers()
+    dets = crowded_boxes(10, rng)
+    first = associate_detections_to_trackers(dets, dets, 0.3, buffers)
+    second = associate_detections_to_trackers(dets, dets, 0.3, buffers)
+    for a, b in zip(first, second):
+        np.testing.assert_array_equal(a, b)
+    assert first[0].tolist() == [[i, i] for i in range(10)]
+
+
+def test_associate_empty_inputs():
+    dets = np.array([[0., 0., 10., 10., 0.9]])
+    matches, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets, np.empty((0, 5)))
+    assert matches.shape == (0, 2) and unmatched_dets.tolist() == [0] and len(unmatched_trks) == 0
+    matches, unmatched_dets, unmatched_trks = associate_detections_to_trackers(np.empty((0, 5)), dets)
+    assert matches.shape == (0, 2) and len(unmatched_dets) == 0 and unmatched_trks.tolist() == [0]
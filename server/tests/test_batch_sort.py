@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from modules.batch_sort import BatchSort
+
+pytest.importorskip("filterpy")
+from modules.sort import Sort  # noqa: E402
+
+
+def detection_stream(num_objects=30, num_frames=60, seed=0):
+    """
+    Per-frame ``[x1, y1, x2, y2, score]`` arrays of objects moving at
+    constant velocity, with ~10% missed detections.
+    """
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform(0, [640, 480], (num_objects, 2))
+    vel = rng.normal(0, 4, (num_objects, 2))
+    size = rng.uniform(20, 80, (num_objects, 2))
+    frames = []
+    for _ in range(num_frames):
+        pos += vel
+        visible = rng.random(num_objects) > 0.1
+        xy = pos[visible] + rng.normal(0, 1.5, (visible.sum(), 2))
+        frames.append(np.column_stack([xy, xy + size[visible], rng.uniform(0.5, 1, visible.sum())]))
+    return frames
+
+
+@pytest.mark.parametrize("sparse_iou", [False, True])
+def test_matches_sort(sparse_iou):
+    sort = Sort(max_age=3, min_hits=3, iou_threshold=0.3)
+    batch = BatchSort(max_age=3, min_hits=3, iou_threshold=0.3, sparse_iou=sparse_iou)
+    for i, dets in enumerate(detection_stream()):
+        if i % 7 == 3:
+            expected, got = sort.coast(), batch.coast()
+        else:
+            expected, got = sort.update(dets), batch.update(dets)
+        assert got.shape == expected.shape
+        np.testing.assert_allclose(got, expected, rtol=1e-7, atol=1e-6)
+
+
+def test_track_life_cycle():
+    batch = BatchSort(max_age=1, min_hits=1)
+    box = np.array([[10., 10., 50., 60., 0.9]])
+    assert batch.update(box)[:, 4].tolist() == [1]
+    assert batch.update().shape == (0, 5)
+    batch.update()
+    assert len(batch) == 0
+    # New tracks get new IDs and are reported from their second hit on
+    assert batch.update(box).shape == (0, 5)
+    assert batch.update(box)[:, 4].tolist() == [2]
+
+
+def test_reset_restarts_ids():
+    batch = BatchSort(max_age=1, min_hits=1)
+    batch.update(np.array([[10., 10., 50., 60., 0.9]]))
+    batch.reset()
+    assert len(batch) == 0
+    assert batch.update(np.array([[100., 100., 150., 160., 0.9]]))[:, 4].tolist() == [1]
@@ -0,0 +1,91 @@
+import os
+import time
+
+from modules.cache import ResultCache, cache_key, file_digest, link_or_copy
+
+
+def make_video(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(os.urandom(size))
+    return str(path)
+
+
+def meta_size(cache, key):
+    return os.path.getsize(os.path.join(cache.folder, key, "meta.json"))
+
+
+def test_put_and_get(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), 10 ** 6)
+    video = make_video(tmp_path, "in.mp4", 1000)
+    sidecar = make_video(tmp_path, "in.tracks", 10)
+    cache.put("a", video, {"result": {"frames": 3}}, attachments={"tracks": sidecar})
+
+    path, meta = cache.get("a")
+    assert open(path, 'rb').read() == open(video, 'rb').read()
+    assert meta["result"] == {"frames": 3}
+    assert cache.attachment("a", "tracks") is not None
+    assert cache.attachment("a", "other") is None
+    assert cache.get("b") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    video = make_video(tmp_path, "in.mp4", 1000)
+    cache = ResultCache(str(tmp_path / "cache"), 10 ** 6)
+    cache.put("a", video, {})
+    entry = 1000 + meta_size(cache, "a")
+    cache.max_bytes = 3 * entry + 100  # cached_at varies in length
+    cache.put("b", video, {})
+    cache.put("c", video, {})
+    assert cache.get("a") is not None  # "b" is now the least recently used
+
+    cache.put("d", video, {})
+    assert len(cache) == 3
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    assert not os.path.exists(os.path.join(cache.folder, "b"))
+    assert cache.size <= cache.max_bytes
+
+
+def test_keeps_single_entry_larger_than_limit(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), 100)
+    cache.put("a", make_video(tmp_path, "in.mp4", 1000), {})
+    assert cache.get("a") is not None
+    cache.put("b", make_video(tmp_path, "in2.mp4", 1000), {})
+    assert cache.get("a") is None and cache.get("b") is not None
+
+
+def test_recency_survives_restart(tmp_path):
+    folder = str(tmp_path / "cache")
+    video = make_video(tmp_path, "in.mp4", 1000)
+    cache = ResultCache(folder, 10 ** 6)
+    for key in "abc":
+        cache.put(key, video, {})
+        time.sleep(0.01)
+    time.sleep(0.01)
+    cache.get("a")
+    # Interrupted put: no meta.json
+    os.makedirs(os.path.join(folder, "partial"))
+
+    reloaded = ResultCache(folder, 10 ** 6)
+    assert list(reloaded._entries) == ["b", "c", "a"]
+    assert not os.path.exists(os.path.join(folder, "partial"))
+
+
+def test_cache_key_depends_on_every_input():
+    params = {"imgsz": 640, "render": True}
+    key = cache_key("content", "weights", params)
+    assert key == cache_key("content", "weights", dict(reversed(list(params.items()))))
+    assert key != cache_key("other", "weights", params)
+    assert key != cache_key("content", "other", params)
+    assert key != cache_key("content", "weights", dict(params, imgsz=320))
+
+
+def test_file_digest_and_link_or_copy(tmp_path):
+    source = make_video(tmp_path, "a.mp4", 5000)
+    destination = str(tmp_path / "b.mp4")
+    open(destination, 'wb').write(b"old")
+    link_or_copy(source, destination)
+    assert file_digest(destination) == file_digest(source)
+    link_or_copy(source, destination)  # already the same file
+    assert sorted(os.listdir(tmp_path)) == ["a.mp4", "b.mp4"]
@@ -0,0 +1,145 @@
+import os
+
+import flask
+import pytest
+
+from modules.fileserve import FileServer, HeadCache, RangeNotSatisfiable, parse_range
+
+SIZE = 1000
+
+
+@pytest.mark.parametrize("header, spans", [
+    ("bytes=0-99", [(0, 99)]),
+    ("bytes=900-", [(900, 999)]),
+    ("bytes=-100", [(900, 999)]),
+    ("bytes=-5000", [(0, 999)]),
+    ("bytes=990-5000", [(990, 999)]),
+    ("bytes=500-599,0-9", [(0, 9), (500, 599)]),
+    ("bytes=0-9,5-20,21-30", [(0, 30)]),
+    ("bytes=0-0,2000-3000", [(0, 0)]),
+])
+def test_parse_range(header, spans):
+    assert parse_range(header, SIZE) == spans
+
+
+@pytest.mark.parametrize("header", [None, "", "items=0-9", "bytes=", "bytes=a-b", "bytes=-", "bytes=9-0",
+                                    "bytes=" + ",".join(f"{i * 10}-{i * 10}" for i in range(17))])
+def test_parse_range_falls_back_to_whole_file(header):
+    assert parse_range(header, SIZE) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=2000-3000", "bytes=-0", "bytes=1000-1999,1500-"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, SIZE)
+
+
+@pytest.fixture(params=[False, True], ids=["plain", "head-cache"])
+def client(request, tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(bytes(i % 251 for i in range(SIZE)))
+    head_cache = HeadCache(1024 * 1024, head_bytes=100) if request.param else None
+    server = FileServer(block_size=64, head_cache=head_cache)
+
+    app = flask.Flask(__name__)
+
+    @app.route("/video")
+    def video():
+        return server.response(flask.request, str(path), "video/mp4")
+
+    client = app.test_client()
+    client.data = path.read_bytes()
+    return client
+
+
+def test_whole_file(client):
+    response = client.get("/video")
+    assert response.status_code == 200
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.data == client.data
+
+
+def test_single_range(client):
+    response = client.get("/video", headers={"Range": "bytes=50-149"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 50-149/{SIZE}"
+    assert response.content_length == 100
+    assert response.data == client.data[50:150]
+
+
+def test_multiple_ranges(client):
+    response = client.get("/video", headers={"Range": "bytes=0-9,-10"})
+    assert response.status_code == 206
+    assert response.mimetype == "multipart/byteranges"
+    body = response.data
+    assert len(body) == response.content_length
+    assert f"Content-Range: bytes 0-9/{SIZE}".encode() in body
+    assert f"Content-Range: bytes 990-999/{SIZE}".encode() in body
+    assert client.data[:10] in body and client.data[-10:] in body
+
+
+@pytest.mark.parametrize("header", [f"bytes={SIZE}-", f"bytes={SIZE}-{SIZE + 9},{SIZE * 2}-"])
+def test_unsatisfiable_range(client, header):
+    response = client.get("/video", headers={"Range": header})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{SIZE}"
+    assert response.data == b""
+
+
+def test_if_range(client):
+    etag = client.get("/video").headers["ETag"]
+
+    response = client.get("/video", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == 206
+    assert response.data == client.data[:10]
+
+    response = client.get("/video", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.data == client.data
+
+    response = client.get("/video", headers={"Range": "bytes=0-9", "If-Range": "Thu, 01 Jan 1970 00:00:00 GMT"})
+    assert response.status_code == 200
+
+
+def test_conditional_get(client):
+    first = client.get("/video")
+    response = client.get("/video", headers={"If-None-Match": first.headers["ETag"]})
+    assert response.status_code == 304
+    assert response.data == b""
+    response = client.get("/video", headers={"If-Modified-Since": first.headers["Last-Modified"]})
+    assert response.status_code == 304
+    response = client.get("/video", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+def test_cache_control(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(b"x" * 10)
+    app = flask.Flask(__name__)
+    servers = {"default": FileServer(), "immutable": FileServer(cache_control="max-age=60, immutable")}
+
+    @app.route("/<name>")
+    def video(name):
+        return servers[name].response(flask.request, str(path), "video/mp4")
+
+    client = app.test_client()
+    assert client.get("/default").headers["Cache-Control"] == "no-cache"
+    response = client.get("/immutable")
+    assert response.headers["Cache-Control"] == "max-age=60, immutable"
+    revalidated = client.get("/immutable", headers={"If-None-Match": response.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["Cache-Control"] == "max-age=60, immutable"
+
+
+def test_head_cache_revalidates(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"a" * 200)
+    cache = HeadCache(1024, head_bytes=100)
+    assert cache.regions(str(path), os.stat(path)) == [(0, b"a" * 100)]
+    cache.regions(str(path), os.stat(path))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    path.write_bytes(b"b" * 200)
+    os.utime(path, ns=(0, 1))
+    assert cache.regions(str(path), os.stat(path)) == [(0, b"b" * 100)]
+    assert cache.misses == 2
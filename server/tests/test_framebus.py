@@ -0,0 +1,107 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from modules.framebus import FrameBus
+
+SHAPE = (4, 6, 3)
+
+
+@pytest.fixture
+def bus():
+    bus = FrameBus(2, SHAPE)
+    yield bus
+    bus.unlink()
+
+
+def test_release_returns_slot_after_last_reference(bus):
+    slot = bus.acquire(refs=2)
+    other = bus.acquire()
+    assert {slot, other} == {0, 1}
+    assert bus.in_use() == 2
+    assert bus.acquire(timeout=0.05) is None
+
+    bus.release(slot)
+    assert bus.in_use() == 2
+    assert bus.acquire(timeout=0.05) is None
+    bus.release(slot)
+    assert bus.in_use() == 1
+    assert bus.acquire(timeout=1) == slot
+
+
+def test_retain_adds_references(bus):
+    slot = bus.acquire()
+    bus.retain(slot, 2)
+    for _ in range(2):
+        bus.release(slot)
+        assert bus.in_use() == 1
+    bus.release(slot)
+    assert bus.in_use() == 0
+
+
+def test_misuse_raises(bus):
+    with pytest.raises(ValueError):
+        bus.retain(0)
+    with pytest.raises(ValueError):
+        bus.acquire(refs=0)
+    slot = bus.acquire()
+    bus.release(slot)
+    with pytest.raises(ValueError):
+        bus.release(slot)
+    with pytest.raises(IndexError):
+        bus.frame(2)
+    with pytest.raises(ValueError):
+        FrameBus(0, SHAPE)
+
+
+def test_frames_share_memory(bus):
+    image = np.arange(np.prod(SHAPE), dtype=np.uint8).reshape(SHAPE)
+    slot = bus.put(image)
+    assert np.array_equal(bus.frame(slot), image)
+
+    view = bus.frame(slot)
+    view[0, 0, 0] = 255
+    assert bus.frame(slot)[0, 0, 0] == 255
+    other = bus.put(np.zeros(SHAPE, dtype=np.uint8))
+    assert bus.frame(slot)[0, 0, 0] == 255
+    assert not bus.frame(other).any()
+    del view
+
+
+def consume(bus, slots, results):
+    for _ in range(2):
+        slot = slots.get()
+        frame = bus.frame(slot)
+        results.put(int(frame.sum()))
+        frame[...] = 1
+        del frame
+        bus.release(slot)
+    bus.close()
+
+
+def test_cross_process():
+    ctx = multiprocessing.get_context('spawn')
+    bus = FrameBus(2, SHAPE, ctx=ctx)
+    slots = ctx.Queue()
+    results = ctx.Queue()
+    worker = ctx.Process(target=consume, args=(bus, slots, results))
+    try:
+        worker.start()
+        for value in (3, 5):
+            slot = bus.put(np.full(SHAPE, value, dtype=np.uint8), refs=2)
+            slots.put(slot)
+        assert [results.get(timeout=30) for _ in range(2)] == [3 * np.prod(SHAPE), 5 * np.prod(SHAPE)]
+        worker.join(30)
+        assert worker.exitcode == 0
+
+        # The worker dropped one reference each and wrote through to our memory
+        assert bus.in_use() == 2
+        for slot in range(2):
+            assert (bus.frame(slot) == 1).all()
+            bus.release(slot)
+        assert bus.in_use() == 0
+    finally:
+        if worker.is_alive():
+            worker.terminate()
+        bus.unlink()
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from modules.gating import MotionGate
+
+
+def scene(box=None, height=240, width=320):
+    """
+    Gray frame with an optional white ``(x, y, size)`` square.
+    """
+    frame = np.full((height, width, 3), 60, dtype=np.uint8)
+    if box is not None:
+        x, y, size = box
+        frame[y:y + size, x:x + size] = 255
+    return frame
+
+
+def run(gate, frames):
+    return [gate.should_infer(frame) for frame in frames]
+
+
+def test_static_frames_are_skipped():
+    gate = MotionGate(refresh_interval=100)
+    assert run(gate, [scene((50, 50, 40))] * 10) == [True] + [False] * 9
+    assert gate.last_score == 0.0
+    assert gate.skip_ratio == pytest.approx(0.9)
+
+
+def test_moving_object_runs_the_detector():
+    gate = MotionGate(refresh_interval=100)
+    frames = [scene((50 + 20 * i, 50, 40)) for i in range(6)]
+    assert run(gate, frames) == [True] * 6
+    assert gate.last_score > gate.motion_threshold
+    assert gate.skip_ratio == 0.0
+
+
+def test_small_change_below_threshold():
+    # A 4x4 blob is 0.02% of the frame, far below the default 0.5%
+    gate = MotionGate(refresh_interval=100)
+    assert run(gate, [scene(), scene((100, 100, 4))]) == [True, False]
+    assert 0.0 < gate.last_score < gate.motion_threshold
+    strict = MotionGate(motion_threshold=0.0001, refresh_interval=100)
+    assert run(strict, [scene(), scene((100, 100, 4))]) == [True, True]
+
+
+def test_compares_with_last_inferred_frame():
+    # Slow drift accumulates against the reference until it crosses the threshold
+    gate = MotionGate(motion_threshold=0.05, refresh_interval=100)
+    frames = [scene((50 + 4 * i, 50, 60)) for i in range(12)]
+    # Two 32x60 strips differ once the square has moved 32 pixels: 5% of the frame
+    assert run(gate, frames) == [True] + [False] * 7 + [True] + [False] * 3
+
+
+def test_refresh_interval_forces_inference():
+    gate = MotionGate(refresh_interval=4)
+    decisions = run(gate, [scene()] * 12)
+    assert decisions == [True, False, False, False] * 3
+    assert gate.inferences == 3
+    assert gate.skip_ratio == pytest.approx(0.75)
+
+
+def test_stride_limits_inference_rate():
+    gate = MotionGate(stride=3, refresh_interval=100)
+    frames = [scene((10 + 30 * i, 50, 40)) for i in range(7)]
+    assert run(gate, frames) == [True, False, False, True, False, False, True]
+
+
+def test_every_frame_without_gating():
+    gate = MotionGate(stride=1, motion_threshold=0)
+    assert run(gate, [scene()] * 5) == [True] * 5
+    assert gate.skip_ratio == 0.0
+
+
+def test_reset_and_resolution_change():
+    gate = MotionGate(refresh_interval=100)
+    run(gate, [scene()] * 3)
+    # A different aspect ratio cannot be compared and counts as motion
+    assert gate.should_infer(scene(height=180))
+    gate.reset()
+    assert gate.skip_ratio == 0.0 and gate.frames == 0
+    assert gate.should_infer(scene())
+
+
+def test_grayscale_frames():
+    gate = MotionGate(refresh_interval=100)
+    gray = scene()[:, :, 0]
+    assert run(gate, [gray, gray]) == [True, False]
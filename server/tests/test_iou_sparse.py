@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from modules.sort import associate_detections_to_trackers, iou_batch, iou_sparse
+
+
+def scattered_boxes(n, rng, width=3840, height=2160):
+    xy = rng.uniform(0, [width, height], (n, 2))
+    wh = rng.uniform(30, 150, (n, 2))
+    return np.concatenate([xy, xy + wh], axis=1)
+
+
+@pytest.mark.parametrize("n,m", [(1, 1), (10, 10), (200, 150), (500, 500)])
+def test_matches_dense_iou(n, m):
+    rng = np.random.default_rng(n)
+    dets = scattered_boxes(n, rng, 800, 600)
+    trks = scattered_boxes(m, rng, 800, 600)
+
+    rows, cols, values = iou_sparse(dets, trks)
+    dense = iou_batch(dets, trks)
+
+    expected_rows, expected_cols = np.nonzero(dense > 0)
+    assert sorted(zip(rows.tolist(), cols.tolist())) == sorted(zip(expected_rows.tolist(), expected_cols.tolist()))
+    np.testing.assert_allclose(values, dense[rows, cols])
+
+
+def test_touching_and_contained_boxes():
+    dets = np.array([[0., 0., 10., 10.], [100., 100., 200., 200.]])
+    trks = np.array([[10., 0., 20., 10.],      # shares an edge only: IOU 0
+                     [120., 120., 130., 130.],  # inside the second detection
+                     [0., 0., 10., 10.]])       # identical to the first
+    rows, cols, values = iou_sparse(dets, trks)
+    pairs = dict(zip(zip(rows.tolist(), cols.tolist()), values.tolist()))
+    assert set(pairs) == {(0, 2), (1, 1)}
+    assert pairs[(0, 2)] == pytest.approx(1.0)
+    assert pairs[(1, 1)] == pytest.approx(100. / 10000.)
+
+
+def test_ignores_score_column_and_empty_inputs():
+    dets = np.array([[0., 0., 10., 10., 0.9]])
+    rows, cols, values = iou_sparse(dets, dets)
+    assert rows.tolist() == [0] and cols.tolist() == [0] and values.tolist() == [1.0]
+    for a, b in ((dets, np.empty((0, 5))), (np.empty((0, 5)), dets)):
+        rows, cols, values = iou_sparse(a, b)
+        assert len(rows) == len(cols) == len(values) == 0
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_sparse_association_matches_dense(seed):
+    rng = np.random.default_rng(seed)
+    dets = scattered_boxes(300, rng, 1200, 800)
+    trks = dets[rng.permutation(300)[:250]] + rng.normal(0, 6, (250, 4))
+
+    dense = associate_detections_to_trackers(dets, trks, 0.3)
+    sparse = associate_detections_to_trackers(dets, trks, 0.3, sparse=True)
+    for a, b in zip(dense, sparse):
+        np.testing.assert_array_equal(a, b)
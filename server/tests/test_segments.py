@@ -0,0 +1,120 @@
+import cv2
+import numpy as np
+import pytest
+
+from modules.batch_sort import BatchSort
+from modules.segments import SegmentCapture, _track_segment, plan_segments, video_info
+
+
+def check_plan(segments):
+    starts = [start for start, _ in segments]
+    assert starts[0] == 0 and segments[-1][1] is None
+    assert [end for _, end in segments[:-1]] == starts[1:]
+    assert starts == sorted(set(starts))
+    return starts
+
+
+@pytest.mark.parametrize("total_frames, count", [(0, 4), (-1, 4), (1000, 1), (1000, 0)])
+def test_single_segment(total_frames, count):
+    assert plan_segments(total_frames, None, count, 10) == [(0, None)]
+
+
+def test_even_split_without_keyframes():
+    segments = plan_segments(1000, None, 4, 10)
+    assert check_plan(segments) == [0, 250, 500, 750]
+
+
+def test_starts_on_keyframes():
+    keyframes = list(range(0, 1000, 48))
+    segments = plan_segments(1000, keyframes, 4, 10)
+    starts = check_plan(segments)
+    assert set(starts) <= set(keyframes)
+    # Every segment but the last is at least the target length
+    assert all(b - a >= 250 for a, b in zip(starts, starts[1:]))
+    assert starts == [0, 288, 576, 864]
+
+
+def test_minimum_segment_length():
+    # Four segments of 25 frames would be shorter than min_frames
+    assert check_plan(plan_segments(100, None, 4, 40)) == [0, 40]
+    # No segment start leaves fewer than min_frames for the last segment
+    starts = check_plan(plan_segments(1000, [0, 300, 600, 990], 4, 50))
+    assert starts == [0, 300, 600]
+
+
+def test_sparse_keyframes():
+    assert check_plan(plan_segments(1000, [0], 4, 10)) == [0]
+    assert check_plan(plan_segments(1000, [0, 100, 200, 900], 4, 10)) == [0, 900]
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    """
+    40 frames of 64x48 whose brightness encodes the frame number.
+    """
+    path = str(tmp_path_factory.mktemp("video") / "frames.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 20, (64, 48))
+    if not writer.isOpened():
+        pytest.skip("OpenCV cannot write MJPG here")
+    for i in range(40):
+        writer.write(np.full((48, 64, 3), i * 6, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def frame_numbers(cap):
+    numbers = []
+    img = None
+    while True:
+        success, img = cap.read_into(img)
+        if not success:
+            return numbers
+        numbers.append(int(round(img.mean() / 6)))
+
+
+def test_video_info(video):
+    assert video_info(video) == (64, 48, 20.0, 40)
+
+
+@pytest.mark.parametrize("start, end", [(0, 10), (10, 25), (25, None)])
+def test_segment_capture_reads_its_frames(video, start, end):
+    cap = SegmentCapture(video, start, end)
+    try:
+        assert frame_numbers(cap) == list(range(start, 40 if end is None else end))
+    finally:
+        cap.release()
+
+
+def test_segment_capture_missing_file(tmp_path):
+    with pytest.raises(IOError):
+        SegmentCapture(str(tmp_path / "missing.mp4"), 0, None)
+
+
+class Recorder(object):
+    def __init__(self):
+        self.frames = []
+
+    def add(self, frame_index, detections, tracks):
+        self.frames.append((frame_index, detections is not None, len(tracks)))
+
+
+def test_track_segment_coasts_and_reports_new_tracks():
+    box = np.array([[10., 10., 50., 60., 0.9]])
+    tracker = BatchSort(max_age=5, min_hits=1)
+    seen = set()
+    recorder = Recorder()
+
+    # Detector ran on offsets 0, 1 and 3; offset 2 coasts
+    new_tracks = _track_segment(tracker, 4, [0, 1, 3], [box, box, box + 2], seen, recorder, start=100)
+    assert list(new_tracks) == [0]
+    np.testing.assert_allclose(new_tracks[0][:, :4], box[:, :4], atol=1e-6)
+    assert seen == {1}
+    assert recorder.frames == [(100, True, 1), (101, True, 1), (102, False, 1), (103, True, 1)]
+
+    # The next segment continues the same tracker: known IDs are not new, and
+    # a new object is reported from its second hit on
+    both = np.vstack([box, box + 200])
+    second = _track_segment(tracker, 3, [0, 1, 2], [box, both, both], seen, recorder, start=104)
+    assert list(second) == [2]
+    assert second[2][:, 4].tolist() == [2]
+    assert seen == {1, 2}
@@ -0,0 +1,235 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from modules.sessions import TrackerRegistry
+from modules.streams import StreamReader, StreamScheduler
+
+
+class FakeCapture(object):
+    """
+    Capture that yields ``frames`` (tiny images whose value is the frame
+    number) and then ends; ``opened=False`` fails to open.
+    """
+
+    def __init__(self, frames=0, opened=True):
+        self.remaining = frames
+        self.opened = opened
+        self.count = 0
+        self.released = False
+
+    def isOpened(self):
+        return self.opened
+
+    def get(self, prop):
+        return 0.0
+
+    def grab(self):
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+    def retrieve(self):
+        frame = np.full((4, 4, 3), self.count, dtype=np.uint8)
+        self.count += 1
+        return True, frame
+
+    def release(self):
+        self.released = True
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.005)
+
+
+def test_push_drops_oldest():
+    notified = []
+    reader = StreamReader("cam", "rtsp://camera", buffer_size=2, on_frame=lambda: notified.append(1))
+    for index in range(5):
+        reader._push((index, 0.0, None))
+    assert (reader.frames_read, reader.frames_dropped, reader.pending()) == (5, 3, 2)
+    assert len(notified) == 5
+    assert [reader.pop()[0], reader.pop()[0]] == [3, 4]
+    assert reader.pop() is None
+
+
+class RecordingReader(StreamReader):
+    def __init__(self, *args, **kwargs):
+        super(RecordingReader, self).__init__(*args, **kwargs)
+        self.waits = []
+
+    def _disconnected(self, reason, backoff):
+        self.waits.append((reason, backoff))
+        super(RecordingReader, self)._disconnected(reason, backoff)
+
+
+def test_reconnect_backoff():
+    captures = [FakeCapture(opened=False) for _ in range(3)] + [FakeCapture(frames=2)]
+    opened = []
+
+    def opener(url):
+        opened.append(url)
+        return captures.pop(0) if captures else FakeCapture(opened=False)
+
+    reader = RecordingReader("cam", "rtsp://camera", buffer_size=4, backoff_initial=0.01, backoff_max=0.04,
+                             opener=opener).start()
+    try:
+        wait_for(lambda: len(reader.waits) >= 7)
+    finally:
+        reader.stop()
+    assert not reader.alive
+    assert reader.waits[:7] == [
+        ("Could not open stream", 0.01), ("Could not open stream", 0.02), ("Could not open stream", 0.04),
+        # A successful connection resets the backoff
+        ("Stream ended", 0.01),
+        ("Could not open stream", 0.02), ("Could not open stream", 0.04), ("Could not open stream", 0.04),
+    ]
+    assert set(opened) == {"rtsp://camera"}
+    assert reader.reconnects == len(reader.waits)
+    assert not reader.connected and reader.last_error == "Could not open stream"
+    assert [reader.pop()[0], reader.pop()[0]] == [0, 1]
+
+
+def test_stop_interrupts_backoff():
+    reader = StreamReader("cam", "rtsp://camera", backoff_initial=60, opener=lambda url: FakeCapture(opened=False))
+    reader.start()
+    wait_for(lambda: reader.reconnects == 1)
+    started = time.monotonic()
+    reader.stop()
+    assert not reader.alive and time.monotonic() - started < 2
+
+
+def buffered_reader(stream_id, frames):
+    reader = StreamReader(stream_id, "rtsp://camera", buffer_size=len(frames))
+    for index in frames:
+        reader._push((index, 0.0, None))
+    return reader
+
+
+def test_next_batch_round_robin():
+    scheduler = StreamScheduler(lambda images: [], TrackerRegistry(), max_batch=4)
+    for stream_id, count in (("a", 5), ("b", 1), ("c", 3)):
+        scheduler._readers[stream_id] = buffered_reader(stream_id, range(count))
+
+    def next_batch():
+        return [(stream_id, item[0]) for stream_id, item in scheduler._next_batch()]
+
+    # One frame per stream per round, starting from a rotating stream
+    assert next_batch() == [("a", 0), ("b", 0), ("c", 0), ("a", 1)]
+    assert next_batch() == [("c", 1), ("a", 2), ("c", 2), ("a", 3)]
+    assert next_batch() == [("a", 4)]
+    assert next_batch() == []
+
+
+class RecordingTracker(object):
+    def __init__(self):
+        self.calls = []
+        self.profile = None
+
+    def update(self, dets):
+        self.calls.append(("update", len(dets)))
+        return np.hstack([dets[:, :4], np.arange(1, len(dets) + 1)[:, None]])
+
+    def coast(self):
+        self.calls.append(("coast", None))
+        return np.empty((0, 5))
+
+    def reset(self):
+        pass
+
+
+class PatternGate(object):
+    def __init__(self, pattern):
+        self.pattern = list(pattern)
+        self.skip_ratio = 0.0
+
+    def should_infer(self, frame):
+        return self.pattern.pop(0)
+
+
+class Boxes(object):
+    def __init__(self, boxes):
+        boxes = np.array(boxes, dtype=float).reshape(-1, 5)
+        self.xyxy = boxes[:, :4]
+        self.conf = boxes[:, 4]
+
+    def __len__(self):
+        return len(self.xyxy)
+
+
+def result(boxes):
+    return SimpleNamespace(boxes=Boxes(boxes))
+
+
+def test_gated_frames_coast_the_tracker():
+    box = [10, 10, 50, 60, 0.9]
+    inferred = []
+
+    def infer_batch(images):
+        inferred.append([int(image[0, 0, 0]) for image in images])
+        return [result([box]) for _ in images]
+
+    results = []
+    done = threading.Event()
+
+    def on_result(stream_id, index, frame, detections, tracks):
+        results.append((index, detections.tolist(), len(tracks)))
+        if len(results) == 4:
+            done.set()
+
+    trackers = TrackerRegistry(factory=RecordingTracker)
+    scheduler = StreamScheduler(infer_batch, trackers, max_batch=1, on_result=on_result,
+                                gate_factory=lambda: PatternGate([True, False, False, True]))
+    stream_id = scheduler.add("rtsp://camera", buffer_size=4, backoff_initial=60,
+                              opener=lambda url: FakeCapture(frames=4))
+    try:
+        assert done.wait(5)
+        tracker = trackers.get(stream_id)
+        calls = list(tracker.calls)
+        info = scheduler.get(stream_id)
+    finally:
+        scheduler.shutdown()
+
+    assert inferred == [[0], [3]]
+    assert calls == [("update", 1), ("coast", None), ("coast", None), ("update", 1)]
+    # Skipped frames report the stream's last detections
+    assert [index for index, _, _ in results] == [0, 1, 2, 3]
+    assert all(detections == [box] for _, detections, _ in results)
+    assert [count for _, _, count in results] == [1, 0, 0, 1]
+    assert info["frames_processed"] == 4
+    assert trackers.get(stream_id) is None
+
+
+@pytest.mark.parametrize("max_batch", [1, 3])
+def test_scheduler_batches_streams(max_batch):
+    sizes = []
+    results = []
+    done = threading.Event()
+
+    def infer_batch(images):
+        sizes.append(len(images))
+        return [result([]) for _ in images]
+
+    def on_result(stream_id, index, frame, detections, tracks):
+        results.append(stream_id)
+        if len(results) == 6:
+            done.set()
+
+    scheduler = StreamScheduler(infer_batch, TrackerRegistry(factory=RecordingTracker), max_batch=max_batch,
+                                on_result=on_result)
+    ids = [scheduler.add("rtsp://camera", buffer_size=3, backoff_initial=60,
+                         opener=lambda url: FakeCapture(frames=3)) for _ in range(2)]
+    try:
+        assert done.wait(5)
+    finally:
+        scheduler.shutdown()
+    assert sorted(results) == sorted(ids * 3)
+    assert max(sizes) <= max_batch
@@ -0,0 +1,163 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from modules.trackstore import (SIDECAR_HEADER, SIDECAR_MAGIC, SIDECAR_RECORD, EventStore, TrackRecorder,
+                                load_tracks)
+
+
+def track(box, track_id):
+    return np.array([list(box) + [track_id]], dtype=float)
+
+
+def detection(box, conf):
+    return np.array([list(box) + [conf]], dtype=float)
+
+
+@pytest.fixture
+def recorder():
+    """
+    Track 1 on frames 0-4 with the detector running on even frames (peak on
+    frame 2); track 2 on frames 3-4 without any overlapping detection.
+    """
+    recorder = TrackRecorder()
+    box = (10, 20, 50, 80)
+    other = (300, 300, 340, 360)
+    for frame in range(5):
+        dets = detection(box, [0.5, None, 0.9, None, 0.7][frame]) if frame % 2 == 0 else None
+        tracks = track(box, 1)
+        if frame >= 3:
+            tracks = np.vstack([tracks, track(other, 2)])
+        recorder.add(frame, dets, tracks)
+    return recorder
+
+
+def test_columns(recorder):
+    columns = recorder.columns()
+    assert columns["det_frame"].tolist() == [0, 2, 4]
+    assert columns["track_frame"].tolist() == [0, 1, 2, 3, 3, 4, 4]
+    assert columns["track_id"].tolist() == [1, 1, 1, 1, 2, 1, 2]
+    conf = columns["track_conf"]
+    np.testing.assert_allclose(conf[[0, 2, 5]], [0.5, 0.9, 0.7], rtol=1e-6)
+    assert np.isnan(conf[[1, 3, 4, 6]]).all()
+
+
+def test_events(recorder):
+    events = {event["track_id"]: event for event in recorder.events(fps=10)}
+    assert events[1] == {
+        "track_id": 1, "first_frame": 0, "last_frame": 4, "start_time": 0.0, "end_time": 0.4,
+        "peak_conf": 0.9, "thumb_frame": 2, "thumb_time": 0.2, "x1": 10.0, "y1": 20.0, "x2": 50.0, "y2": 80.0,
+    }
+    # Never matched: no confidence, thumbnail from the first frame
+    assert events[2]["peak_conf"] is None
+    assert (events[2]["first_frame"], events[2]["thumb_frame"], events[2]["x1"]) == (3, 3, 300.0)
+
+
+def test_events_fps_fallback_and_empty(recorder):
+    assert recorder.events(fps=0)[0]["end_time"] == round(4 / 25.0, 3)
+    assert TrackRecorder().events(fps=25) == []
+
+
+def test_sidecar_round_trip(tmp_path, recorder):
+    recorder.add(5, None, np.array([[-4.0, 10.4, 700.0, 90.6, 3]]))
+    path = tmp_path / "job.tracks"
+    recorder.write_sidecar(str(path), fps=29.97, width=640, height=480)
+
+    data = path.read_bytes()
+    magic, fps, width, height, count = SIDECAR_HEADER.unpack_from(data)
+    assert (magic, fps, width, height, count) == (SIDECAR_MAGIC, 29970, 640, 480, 8)
+    assert len(data) == SIDECAR_HEADER.size + count * SIDECAR_RECORD.itemsize == 16 + 8 * 16
+    records = np.frombuffer(data, dtype=SIDECAR_RECORD, offset=SIDECAR_HEADER.size)
+    assert records["frame"].tolist() == [0, 1, 2, 3, 3, 4, 4, 5]
+    assert records["track_id"].tolist() == [1, 1, 1, 1, 2, 1, 2, 3]
+    assert records["box"][0].tolist() == [10, 20, 50, 80]
+    # Rounded and clipped to the frame
+    assert records["box"][-1].tolist() == [0, 10, 639, 91]
+    assert not (tmp_path / "job.tracks.tmp").exists()
+
+
+def test_load_tracks_window(tmp_path, recorder):
+    path = str(tmp_path / "job.npz")
+    recorder.save(path)
+
+    everything = load_tracks(path)
+    assert everything["detections"]["frame"] == [0, 2, 4]
+    assert everything["tracks"]["frame"] == [0, 1, 2, 3, 3, 4, 4]
+
+    window = load_tracks(path, start_frame=2, end_frame=3)
+    assert window["detections"] == {"frame": [2], "box": [[10.0, 20.0, 50.0, 80.0]], "conf": [0.9]}
+    assert window["tracks"]["frame"] == [2, 3, 3]
+    assert window["tracks"]["conf"] == [0.9, None, None]
+
+    single = load_tracks(path, start_frame=3, track_id=2)
+    assert single["tracks"]["frame"] == [3, 4] and single["tracks"]["track_id"] == [2, 2]
+    assert single["detections"]["frame"] == [4]
+
+
+def event(track_id, start, end, conf):
+    return {"track_id": track_id, "first_frame": int(start * 10), "last_frame": int(end * 10),
+            "start_time": start, "end_time": end, "peak_conf": conf, "thumb_frame": int(start * 10),
+            "thumb_time": start, "x1": 0.0, "y1": 0.0, "x2": 1.0, "y2": 1.0}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = EventStore(str(tmp_path / "db" / "events.db"))
+    clock = iter([1000.0, 2000.0])
+    monkeypatch.setattr("modules.trackstore.time.time", lambda: next(clock))
+    store.add_video("a", "crash.mp4", 10.0, 100, 640, 480, "a.npz",
+                    [event(1, 0.0, 2.0, 0.9), event(2, 5.0, 6.0, 0.4)])
+    store.add_video("b", "other.mp4", 25.0, 50, 320, 240, "b.npz", [event(1, 1.0, 1.5, None)])
+    monkeypatch.undo()
+    return store
+
+
+def test_get_video(store):
+    video = store.get_video("a")
+    assert (video["filename"], video["fps"], video["frames"], video["track_file"]) == ("crash.mp4", 10.0, 100, "a.npz")
+    assert store.get_video("missing") is None
+
+
+def ids(rows):
+    return [(row["job_id"], row["track_id"]) for row in rows]
+
+
+def test_query_events_filters(store):
+    # Newest video first, then by start time
+    assert ids(store.query_events()) == [("b", 1), ("a", 1), ("a", 2)]
+    assert ids(store.query_events(job_id="a")) == [("a", 1), ("a", 2)]
+    assert ids(store.query_events(filename="other.mp4")) == [("b", 1)]
+    # Overlap with [start, end]
+    assert ids(store.query_events(start=1.8, end=5.5)) == [("a", 1), ("a", 2)]
+    assert ids(store.query_events(start=2.5, end=4.0)) == []
+    assert ids(store.query_events(min_conf=0.5)) == [("a", 1)]
+    assert ids(store.query_events(since=1500)) == [("b", 1)]
+    assert ids(store.query_events(until=1500)) == [("a", 1), ("a", 2)]
+    assert ids(store.query_events(limit=1, offset=1)) == [("a", 1)]
+    row = store.query_events(job_id="b")[0]
+    assert (row["filename"], row["created_at"], row["peak_conf"]) == ("other.mp4", 2000.0, None)
+
+
+def test_connections_are_closed(store, monkeypatch):
+    opened = []
+    connect = store._connect
+
+    def tracking_connect():
+        db = connect()
+        opened.append(db)
+        return db
+
+    monkeypatch.setattr(store, "_connect", tracking_connect)
+    store.add_video("c", "c.mp4", 10.0, 10, 64, 48, "c.npz", [event(1, 0.0, 0.5, 0.8)])
+    store.get_video("c")
+    store.query_events(job_id="c")
+    with pytest.raises(sqlite3.IntegrityError):
+        store.add_video("d", "d.mp4", 10.0, 10, 64, 48, "d.npz", [dict(event(1, 0.0, 0.5, 0.8), first_frame=None)])
+
+    assert len(opened) == 4
+    for db in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            db.execute("SELECT 1")
+    # The failed insert was rolled back
+    assert store.get_video("d") is None
@@ -0,0 +1,243 @@
+import base64
+import hashlib
+import io
+import struct
+import threading
+import time
+
+import pytest
+
+from modules.uploads import (ChecksumMismatch, GrowingFileReader, OffsetMismatch, UploadClosed, UploadError,
+                             UploadManager, UploadTooLarge, parse_checksum)
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return UploadManager(str(tmp_path / "uploads"), max_size=1000)
+
+
+def read_file(upload):
+    with open(upload.path, 'rb') as f:
+        return f.read()
+
+
+def checksum(data, algorithm="sha256"):
+    return algorithm, hashlib.new(algorithm, data).digest()
+
+
+class DroppedStream(object):
+    """
+    Returns ``data`` and then fails the way a dropped client connection
+    does.
+    """
+
+    def __init__(self, data, error):
+        self.data = data
+        self.error = error
+
+    def read(self, size):
+        if self.data:
+            data, self.data = self.data, b''
+            return data
+        raise self.error
+
+
+def test_append_and_finalize(manager):
+    upload = manager.create("clip.mkv", size=10)
+    assert manager.append(upload.id, 0, io.BytesIO(b"hello")) == 5
+    assert manager.append(upload.id, 5, io.BytesIO(b"world"), checksum=checksum(b"world")) == 10
+    manager.finalize(upload.id)
+    assert upload.complete
+    assert read_file(upload) == b"helloworld"
+    assert upload.digest() == hashlib.sha256(b"helloworld").hexdigest()
+    with pytest.raises(UploadClosed):
+        manager.append(upload.id, 10, io.BytesIO(b"!"))
+
+
+def test_offset_mismatch(manager):
+    upload = manager.create("clip.mkv")
+    manager.append(upload.id, 0, io.BytesIO(b"abc"))
+    for offset in (0, 2, 4):
+        with pytest.raises(OffsetMismatch) as e:
+            manager.append(upload.id, offset, io.BytesIO(b"x"))
+        assert e.value.status == 409 and e.value.expected == 3
+    assert read_file(upload) == b"abc"
+
+
+def test_checksum_mismatch_discards_chunk(manager):
+    upload = manager.create("clip.mkv")
+    manager.append(upload.id, 0, io.BytesIO(b"abc"))
+    with pytest.raises(ChecksumMismatch):
+        manager.append(upload.id, 3, io.BytesIO(b"def"), checksum=checksum(b"xyz", "md5"))
+    assert upload.offset == 3
+    assert read_file(upload) == b"abc"
+    assert manager.append(upload.id, 3, io.BytesIO(b"def"), checksum=checksum(b"def", "md5")) == 6
+    assert upload.digest() == hashlib.sha256(b"abcdef").hexdigest()
+
+
+def test_too_large(manager):
+    with pytest.raises(UploadTooLarge):
+        manager.create("clip.mkv", size=1001)
+    upload = manager.create("clip.mkv", size=4)
+    with pytest.raises(UploadTooLarge):
+        manager.append(upload.id, 0, io.BytesIO(b"12345"))
+    assert upload.offset == 0 and read_file(upload) == b""
+
+
+@pytest.mark.parametrize("error", [ConnectionResetError(), RuntimeError("client disconnected")])
+def test_dropped_connection_keeps_partial_chunk(manager, error):
+    upload = manager.create("clip.mkv")
+    with pytest.raises(type(error)):
+        manager.append(upload.id, 0, DroppedStream(b"partial", error))
+    assert upload.offset == 7
+    assert upload.digest() == hashlib.sha256(b"partial").hexdigest()
+    # The client resumes from the reported offset
+    assert manager.append(upload.id, 7, io.BytesIO(b"-rest")) == 12
+    assert read_file(upload) == b"partial-rest"
+
+
+def test_dropped_connection_discards_verified_chunk(manager):
+    upload = manager.create("clip.mkv")
+    with pytest.raises(ConnectionResetError):
+        manager.append(upload.id, 0, DroppedStream(b"partial", ConnectionResetError()),
+                       checksum=checksum(b"partial-rest"))
+    assert upload.offset == 0
+    assert upload.digest() == hashlib.sha256(b"").hexdigest()
+
+
+def test_disk_error_keeps_nothing(manager):
+    upload = manager.create("clip.mkv")
+    with pytest.raises(OSError):
+        manager.append(upload.id, 0, DroppedStream(b"partial", OSError("No space left on device")))
+    assert upload.offset == 0
+
+
+def test_finalize_truncates_to_offset(manager):
+    upload = manager.create("clip.mkv")
+    manager.append(upload.id, 0, io.BytesIO(b"abc"))
+    with pytest.raises(ChecksumMismatch):
+        manager.append(upload.id, 3, io.BytesIO(b"defgh"), checksum=checksum(b"other"))
+    # Bytes of a failed chunk left past the offset
+    with open(upload.path, 'ab') as f:
+        f.write(b"garbage")
+    manager.finalize(upload.id)
+    assert read_file(upload) == b"abc"
+
+
+def test_finalize_checks(manager):
+    upload = manager.create("clip.mkv", size=5)
+    with pytest.raises(OffsetMismatch):
+        manager.finalize(upload.id)
+    empty = manager.create("clip.mkv")
+    with pytest.raises(UploadError):
+        manager.finalize(empty.id)
+    manager.abort(upload.id)
+    with pytest.raises(UploadError):
+        manager.finalize(upload.id)
+
+
+def test_parse_checksum():
+    digest = hashlib.sha1(b"x").digest()
+    assert parse_checksum(f"SHA1 {base64.b64encode(digest).decode()}") == ("sha1", digest)
+    assert parse_checksum(None) is None
+    for header in ("sha1", "sha1 not-base64!", "crc32 AAAA"):
+        with pytest.raises(UploadError):
+            parse_checksum(header)
+
+
+def atom(kind, size=8):
+    return struct.pack('>I4s', size, kind) + b"\0" * (size - 8)
+
+
+@pytest.mark.parametrize("filename, data, expected", [
+    ("clip.mp4", atom(b'ftyp', 24) + atom(b'moov', 16) + atom(b'mdat', 32), True),
+    ("clip.mp4", atom(b'ftyp', 24) + atom(b'free') + atom(b'mdat', 32) + atom(b'moov', 16), False),
+    # 64-bit size on the first atom
+    ("clip.mov", struct.pack('>I4sQ', 1, b'ftyp', 24) + b"\0" * 8 + atom(b'moov'), True),
+    # Header not complete yet
+    ("clip.mp4", atom(b'ftyp', 24)[:20], None),
+    ("clip.mp4", atom(b'ftyp', 24), None),
+    ("clip.mkv", b"\x1aE\xdf\xa3", True),
+    ("clip.mkv", b"", None),
+    ("clip.flv", b"FLV", False),
+])
+def test_is_streamable(manager, filename, data, expected):
+    upload = manager.create(filename)
+    if data:
+        manager.append(upload.id, 0, io.BytesIO(data))
+    assert manager.is_streamable(upload) is expected
+
+
+def test_reader_blocks_until_data_and_finalize(manager):
+    upload = manager.create("clip.mkv")
+    reader = manager.reader(upload.id)
+    reader.poll = 0.05
+    received = []
+
+    def consume():
+        while True:
+            data = reader.read(4)
+            if not data:
+                break
+            received.append(data)
+
+    thread = threading.Thread(target=consume)
+    thread.start()
+    manager.append(upload.id, 0, io.BytesIO(b"abcdef"))
+    time.sleep(0.2)
+    assert thread.is_alive()  # waiting for more data
+    manager.append(upload.id, 6, io.BytesIO(b"gh"))
+    manager.finalize(upload.id)
+    thread.join(5)
+    assert not thread.is_alive()
+    assert b"".join(received) == b"abcdefgh"
+    reader.close()
+
+
+def test_reader_idle_timeout(manager):
+    upload = manager.create("clip.mkv")
+    manager.append(upload.id, 0, io.BytesIO(b"abc"))
+    reader = GrowingFileReader(upload, poll=0.05, idle_timeout=0.2)
+    assert reader.read() == b"abc"
+    started = time.time()
+    with pytest.raises(IOError, match="no data"):
+        reader.read()
+    assert 0.15 < time.time() - started < 2
+    reader.close()
+
+
+def test_reader_abort_and_close(manager):
+    upload = manager.create("clip.mkv")
+    reader = GrowingFileReader(upload, poll=5)
+    errors = []
+
+    def consume():
+        try:
+            reader.read()
+        except IOError as e:
+            errors.append(str(e))
+
+    thread = threading.Thread(target=consume)
+    thread.start()
+    time.sleep(0.1)
+    manager.abort(upload.id)
+    thread.join(2)
+    assert not thread.is_alive()  # woken up by the abort, not the poll interval
+    assert errors == ["Upload aborted"]
+
+    other = manager.create("clip.mkv")
+    reader = manager.reader(other.id)
+    reader.close()
+    with pytest.raises(IOError, match="closed"):
+        reader.read()
+
+
+def test_expire(manager):
+    stale = manager.create("old.mkv")
+    fresh = manager.create("new.mkv")
+    stale.updated_at -= manager.ttl + 1
+    manager.expire()
+    assert stale.aborted and not fresh.aborted
+    with pytest.raises(UploadError):
+        manager.get(stale.id)
+    manager.get(fresh.id)